@@ -1,35 +1,61 @@
+import numpy as np
 import pandas as pd
+from pandas.api.extensions import take
 
-def API(daily_df, week_df):
-    # 确保日期列是 datetime 类型
-    daily_df['日期'] = pd.to_datetime(daily_df['日期'])
-    week_df['日期'] = pd.to_datetime(week_df['日期'])
+from dtypes import as_datetime
+
+
+def API(daily_df, week_df, how='exact', inplace=False):
+    """
+    将周度表的各列按日期对齐到日度表上，一次索引对齐完成，不逐个周度日期扫描日表。
+
+    参数:
+    daily_df (pd.DataFrame): 日度表，包含 '日期' 列
+    week_df (pd.DataFrame): 周度表，包含 '日期' 列
+    how (str): 'exact' 只填充与周度日期相同的日度行（默认）；
+               'asof' 每个日度行取不晚于它的最近一个周度行，即把周度值向后延续
+    inplace (bool): 为 True 时直接在 daily_df 上添加列，省去整表复制
+
+    返回:
+    pd.DataFrame: 添加了周度列的日度表。未匹配的行，字符串列和分类列为 ''，数值列为 NaN；
+                  数值列保持数值类型（整数列在存在缺失时变为浮点）
+    """
+    if how not in ('exact', 'asof'):
+        raise ValueError(f"不支持的对齐方式 '{how}'，请使用 'exact' 或 'asof'")
 
     # 创建新的 DataFrame 基于 daily_df
-    new_daily_df = daily_df.copy()
-
-    # 将 week_df 的日期作为参考
-    week_dates = week_df['日期'].unique()
-
-    # 遍历 week_df 的列（排除 '日期' 列），作为新列添加到 new_daily_df
-    for column in week_df.columns:
-        if column != '日期':
-            # 根据列类型初始化，保留原始类型
-            if week_df[column].dtype == 'object':  # 字符串列
-                new_daily_df[column] = ''
-            else:
-                new_daily_df[column] = pd.NA
-
-    # 填充 week_df 的数据到 new_daily_df
-    for date in week_dates:
-        mask = new_daily_df['日期'] == date
-        if mask.any():
-            week_row = week_df[week_df['日期'] == date].iloc[0].drop('日期')
-            for col, value in week_row.items():
-                # 根据列类型处理
-                if pd.api.types.is_numeric_dtype(week_df[col].dtype):
-                    new_daily_df.loc[mask, col] = pd.to_numeric(value, errors='coerce')
-                else:
-                    new_daily_df.loc[mask, col] = value
-
-    return new_daily_df
\ No newline at end of file
+    new_daily_df = daily_df if inplace else daily_df.copy()
+    new_daily_df['日期'] = as_datetime(new_daily_df['日期'])
+
+    # 周度表按日期排序，同一日期只取第一行
+    week = week_df.assign(日期=as_datetime(week_df['日期']))
+    week = week[week['日期'].notna()].drop_duplicates('日期', keep='first').sort_values('日期', kind='stable')
+    week_dates = week['日期'].values
+    daily_dates = new_daily_df['日期'].values
+
+    # 每个日度行对应的周度行位置，没有对应时为 -1
+    if how == 'exact':
+        pos = np.searchsorted(week_dates, daily_dates, side='left')
+        clipped = np.minimum(pos, max(len(week_dates) - 1, 0))
+        matched = (pos < len(week_dates)) & (week_dates[clipped] == daily_dates) if len(week_dates) else np.zeros(len(daily_dates), dtype=bool)
+        indexer = np.where(matched, clipped, -1)
+    else:
+        indexer = np.searchsorted(week_dates, daily_dates, side='right') - 1
+
+    # 遍历 week_df 的列（排除 '日期' 列），按位置一次取值后作为新列添加
+    for column in week.columns:
+        if column == '日期':
+            continue
+        values = week[column].to_numpy()
+        if isinstance(week[column].dtype, pd.CategoricalDtype):  # 分类列按编码对齐，未匹配的行为空字符串（类别中没有时为缺失值）
+            categories = week[column].cat.categories
+            fill = categories.get_loc('') if '' in categories else -1
+            codes = take(week[column].cat.codes.to_numpy(), indexer, allow_fill=True, fill_value=fill)
+            aligned = pd.Categorical.from_codes(codes, dtype=week[column].dtype)
+        elif week[column].dtype == 'object':  # 字符串列，未匹配的行为空字符串
+            aligned = take(values, indexer, allow_fill=True, fill_value='')
+        else:
+            aligned = take(values, indexer, allow_fill=True)
+        new_daily_df[column] = aligned
+
+    return new_daily_df
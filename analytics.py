@@ -0,0 +1,158 @@
+import numpy as np
+import pandas as pd
+
+# 年化使用的每年交易日数
+PERIODS_PER_YEAR = 252
+
+METRIC_COLUMNS = ['总收益', '年化收益', '年化波动', '夏普比率', '最大回撤', '年化换手率', '平均仓位']
+
+
+def _as_matrix(positions):
+    """
+    将一列或多列仓位统一为 (行数, 列数) 的浮点矩阵，缺失值视为 0 仓位。
+    返回 (矩阵, 列名)；一维输入的列名为 [None]。
+    """
+    if isinstance(positions, pd.DataFrame):
+        names = list(positions.columns)
+        matrix = positions.to_numpy(dtype=float)
+    elif isinstance(positions, pd.Series):
+        names = [positions.name]
+        matrix = positions.to_numpy(dtype=float)[:, None]
+    else:
+        matrix = np.asarray(positions, dtype=float)
+        if matrix.ndim == 1:
+            names = [None]
+            matrix = matrix[:, None]
+        else:
+            names = list(range(matrix.shape[1]))
+    return np.nan_to_num(matrix, nan=0.0), names
+
+
+def asset_returns(close):
+    """
+    标的的逐日收益率 close[t] / close[t-1] - 1，第一行为 0。
+    """
+    close = np.asarray(close, dtype=float)
+    returns = np.zeros(len(close))
+    if len(close) > 1:
+        returns[1:] = close[1:] / close[:-1] - 1
+    return np.nan_to_num(returns, nan=0.0, posinf=0.0, neginf=0.0)
+
+
+def strategy_returns(close, positions, cost=0.0):
+    """
+    按前一天收盘时的仓位持有到当天收盘计算策略收益：ret[t] = pos[t-1] * r[t] - cost * |pos[t] - pos[t-1]|。
+
+    参数:
+    close (array-like): 收盘价，长度为 n
+    positions (array-like): 仓位，形状为 (n,) 或 (n, k)，k 为仓位列数（例如 k 组参数扫描的结果）
+    cost (float): 单边交易成本，按仓位变化的绝对值收取
+
+    返回:
+    np.ndarray: 形状为 (n, k) 的策略收益率矩阵，第一行为 0
+    """
+    matrix, _ = _as_matrix(positions)
+    returns = np.zeros_like(matrix)
+    if len(matrix) > 1:
+        returns[1:] = matrix[:-1] * asset_returns(close)[1:, None]
+        if cost:
+            returns[1:] -= cost * np.abs(np.diff(matrix, axis=0))
+    return returns
+
+
+def nav_and_drawdown(returns):
+    """
+    由收益率矩阵计算净值（从 1 开始）和回撤（净值相对历史最高点的跌幅，<= 0）。
+    """
+    nav = np.cumprod(1 + returns, axis=0)
+    drawdown = nav / np.maximum.accumulate(nav, axis=0) - 1
+    return nav, drawdown
+
+
+def performance_metrics(close, positions, cost=0.0, risk_free=0.0, periods_per_year=PERIODS_PER_YEAR):
+    """
+    计算一列或多列仓位的绩效指标，多列时在整个矩阵上一次完成，可以直接给参数扫描的上千组结果打分。
+
+    参数:
+    close (array-like): 收盘价
+    positions (pd.Series, pd.DataFrame or np.ndarray): 一列仓位、多列仓位，或形状为 (行数, 运行数) 的仓位矩阵
+    cost (float): 单边交易成本，按仓位变化的绝对值收取
+    risk_free (float): 年化无风险收益率，用于夏普比率
+    periods_per_year (int): 每年交易日数
+
+    返回:
+    pd.DataFrame: 每列仓位一行，列为 METRIC_COLUMNS：
+                  总收益、年化收益（几何）、年化波动、夏普比率、最大回撤（正数）、年化换手率（仓位变化绝对值之和）、平均仓位
+    """
+    matrix, names = _as_matrix(positions)
+    returns = strategy_returns(close, matrix, cost)
+    nav, drawdown = nav_and_drawdown(returns)
+    periods = len(matrix) - 1
+
+    metrics = np.full((matrix.shape[1], len(METRIC_COLUMNS)), np.nan)
+    if periods > 0:
+        body = returns[1:]
+        excess = body - risk_free / periods_per_year
+        volatility = body.std(axis=0, ddof=1) if periods > 1 else np.full(matrix.shape[1], np.nan)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            sharpe = np.where(volatility > 0, excess.mean(axis=0) / volatility * np.sqrt(periods_per_year), np.nan)
+        metrics[:, 0] = nav[-1] - 1
+        metrics[:, 1] = nav[-1] ** (periods_per_year / periods) - 1
+        metrics[:, 2] = volatility * np.sqrt(periods_per_year)
+        metrics[:, 3] = sharpe
+        metrics[:, 4] = -drawdown.min(axis=0)
+        metrics[:, 5] = np.abs(np.diff(matrix, axis=0)).sum(axis=0) / periods * periods_per_year
+    metrics[:, 6] = matrix.mean(axis=0) if len(matrix) else np.nan
+    return pd.DataFrame(metrics, index=names, columns=METRIC_COLUMNS)
+
+
+def attribution(close, legs, cost=0.0):
+    """
+    将各分项仓位之和的收益拆分到每个分项：第 t 天分项 j 的贡献为 nav[t-1] * legs[t-1, j] * r[t]，
+    各分项贡献（加上交易成本）之和恰好等于合计仓位的总收益。
+
+    参数:
+    close (array-like): 收盘价
+    legs (pd.DataFrame): 分项仓位列，例如 pipeline.POSITION_COLUMNS 对应的三列
+    cost (float): 单边交易成本，按合计仓位变化的绝对值收取，单独列为 '交易成本'
+
+    返回:
+    pd.DataFrame: 每个分项一行，列为 '收益贡献' 和 '贡献占比'
+    """
+    matrix, names = _as_matrix(legs)
+    total = matrix.sum(axis=1)
+    returns = strategy_returns(close, total, cost)[:, 0]
+    nav_before = np.r_[1.0, np.cumprod(1 + returns)[:-1]]
+
+    contributions = np.zeros(matrix.shape[1])
+    cost_contribution = 0.0
+    if len(matrix) > 1:
+        r = asset_returns(close)
+        contributions = (nav_before[1:, None] * matrix[:-1] * r[1:, None]).sum(axis=0)
+        cost_contribution = -(nav_before[1:] * cost * np.abs(np.diff(total))).sum()
+
+    if cost:
+        names = names + ['交易成本']
+        contributions = np.r_[contributions, cost_contribution]
+    total_return = contributions.sum()
+    with np.errstate(divide='ignore', invalid='ignore'):
+        share = contributions / total_return if total_return else np.full(len(contributions), np.nan)
+    return pd.DataFrame({'收益贡献': contributions, '贡献占比': share}, index=names)
+
+
+def equity_curve(df, position_column='组合总仓位', close_column='收盘价', date_column='日期', cost=0.0):
+    """
+    由 run_strategies 的输出生成净值曲线。
+
+    返回:
+    pd.DataFrame: 日期、标的收益率、策略收益率、净值、回撤 五列
+    """
+    returns = strategy_returns(df[close_column], df[position_column], cost)
+    nav, drawdown = nav_and_drawdown(returns)
+    return pd.DataFrame({
+        date_column: df[date_column].to_numpy(),
+        '标的收益率': asset_returns(df[close_column]),
+        '策略收益率': returns[:, 0],
+        '净值': nav[:, 0],
+        '回撤': drawdown[:, 0],
+    })
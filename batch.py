@@ -0,0 +1,152 @@
+import argparse
+import contextlib
+import json
+import os
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import pandas as pd
+
+from params import StrategyParams
+from pipeline import run_strategies, summarize_run, export_result
+
+# 目录模式下每个标的子目录中的默认文件名，与 main.py 中的 resource.xlsx / husen.xlsx 一致
+DAILY_FILE_NAME = 'resource.xlsx'
+WEEKLY_FILE_NAME = 'husen.xlsx'
+
+
+def discover_instruments(source, daily_name=DAILY_FILE_NAME, weekly_name=WEEKLY_FILE_NAME):
+    """
+    列出需要回测的标的及其日表、周表文件。
+
+    参数:
+    source (str): 目录或清单文件。
+                  目录：每个子目录是一个标的（子目录名作为标的名），其中包含 daily_name 文件和可选的 weekly_name 文件；
+                  清单：.csv 或 .json 文件，每条记录包含 name、daily 和可选的 weekly 字段，相对路径相对于清单所在目录。
+                  没有周表的标的由日表生成周表
+    daily_name (str): 目录模式下的日表文件名
+    weekly_name (str): 目录模式下的周表文件名
+
+    返回:
+    list: [(标的名, 日表路径, 周表路径或 None), ...]，按清单顺序或子目录名排序
+    """
+    if os.path.isdir(source):
+        instruments = []
+        for name in sorted(os.listdir(source)):
+            folder = os.path.join(source, name)
+            daily = os.path.join(folder, daily_name)
+            weekly = os.path.join(folder, weekly_name)
+            if os.path.isfile(daily):
+                instruments.append((name, daily, weekly if os.path.isfile(weekly) else None))
+        return instruments
+
+    extension = os.path.splitext(source)[1].lower()
+    if extension == '.csv':
+        records = pd.read_csv(source, dtype=str).to_dict('records')
+    elif extension == '.json':
+        with open(source, encoding='utf-8') as f:
+            records = json.load(f)
+    else:
+        raise ValueError(f"不支持的清单类型 '{extension}'，请提供目录、.csv 或 .json 文件")
+
+    base = os.path.dirname(os.path.abspath(source))
+    instruments = []
+    for record in records:
+        missing = [key for key in ('name', 'daily') if not record.get(key)]
+        if missing:
+            raise ValueError(f"清单记录缺少字段 {missing}: {record}")
+        weekly = record.get('weekly')
+        instruments.append((str(record['name']),
+                            os.path.join(base, record['daily']),
+                            os.path.join(base, weekly) if isinstance(weekly, str) and weekly else None))
+
+    names = [name for name, _, _ in instruments]
+    duplicated = sorted({name for name in names if names.count(name) > 1})
+    if duplicated:
+        raise ValueError(f"清单中的标的名重复: {duplicated}")
+    return instruments
+
+
+def _run_instrument(name, daily, weekly, out_dir, initial_pos, params):
+    """
+    在子进程中运行单个标的，策略的逐笔打印写入 <标的>.log，异常只记录在该标的的汇总行中。
+    """
+    row = {'标的': name, '日表': daily, '周表': weekly, '状态': '成功', '错误': '', '耗时(秒)': 0.0}
+    output_file = os.path.join(out_dir, f'{name}.xlsx')
+    start = time.perf_counter()
+    with open(os.path.join(out_dir, f'{name}.log'), 'w', encoding='utf-8') as log, contextlib.redirect_stdout(log):
+        try:
+            df = run_strategies(daily, weekly, initial_pos, params)
+            export_result(df, output_file)
+            row.update({'起始日期': df['日期'].iloc[0].date(), '结束日期': df['日期'].iloc[-1].date(),
+                        '行数': len(df), **summarize_run(df), '输出文件': output_file})
+        except Exception as e:
+            traceback.print_exc(file=log)
+            row.update({'状态': '失败', '错误': f'{type(e).__name__}: {e}'})
+    row['耗时(秒)'] = round(time.perf_counter() - start, 4)
+    return row
+
+
+def run_batch(source, out_dir, initial_pos=0.7, params=None, max_workers=None,
+              daily_name=DAILY_FILE_NAME, weekly_name=WEEKLY_FILE_NAME):
+    """
+    多标的批量回测：每个标的在独立的子进程中运行完整的日度+周度策略链，
+    同时运行的进程数不超过 max_workers，单个标的失败不影响其他标的。
+
+    参数:
+    source (str): 目录或清单文件，见 discover_instruments
+    out_dir (str): 输出目录，每个标的写出 <标的>.xlsx 和 <标的>.log，汇总表写入 summary.csv
+    initial_pos (float): pcr_bbi 初始仓位
+    params (StrategyParams): 策略参数，默认为 StrategyParams()
+    max_workers (int): 最大进程数，默认为 CPU 核数和标的数中的较小值
+    daily_name (str): 目录模式下的日表文件名
+    weekly_name (str): 目录模式下的周表文件名
+
+    返回:
+    pd.DataFrame: 每个标的一行的汇总表，顺序与 discover_instruments 一致
+    """
+    params = params or StrategyParams()
+    instruments = discover_instruments(source, daily_name, weekly_name)
+    if not instruments:
+        raise ValueError(f"在 '{source}' 中没有找到任何标的")
+    os.makedirs(out_dir, exist_ok=True)
+    max_workers = max_workers or min(os.cpu_count() or 1, len(instruments))
+
+    rows = {}
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        futures = {executor.submit(_run_instrument, name, daily, weekly, out_dir, initial_pos, params):
+                   (name, daily, weekly) for name, daily, weekly in instruments}
+        for future in as_completed(futures):
+            name, daily, weekly = futures[future]
+            try:
+                row = future.result()
+            except Exception as e:  # 子进程异常退出等进程池层面的错误
+                row = {'标的': name, '日表': daily, '周表': weekly,
+                       '状态': '失败', '错误': f'{type(e).__name__}: {e}'}
+            rows[name] = row
+            print(f"[{len(rows)}/{len(instruments)}] {name} {row['状态']} {row['错误']}")
+
+    summary = pd.DataFrame([rows[name] for name, _, _ in instruments])
+    summary.to_csv(os.path.join(out_dir, 'summary.csv'), index=False, encoding='utf-8-sig')
+    return summary
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='多标的批量回测')
+    parser.add_argument('source', help='标的目录（每个子目录一个标的）或 .csv/.json 清单文件')
+    parser.add_argument('out_dir', help='输出目录')
+    parser.add_argument('--initial-pos', type=float, default=0.7, help='初始仓位，默认 0.7')
+    parser.add_argument('--workers', type=int, default=None, help='最大进程数，默认为 CPU 核数')
+    parser.add_argument('--daily-name', default=DAILY_FILE_NAME, help=f'目录模式下的日表文件名，默认 {DAILY_FILE_NAME}')
+    parser.add_argument('--weekly-name', default=WEEKLY_FILE_NAME, help=f'目录模式下的周表文件名，默认 {WEEKLY_FILE_NAME}')
+    parser.add_argument('--pcr-lookback', type=int, default=StrategyParams.pcr_lookback,
+                        help=f'由持仓量计算持仓量PCR百分位时的回看交易日数，默认 {StrategyParams.pcr_lookback}')
+    parser.add_argument('--pcr-min-periods', type=int, default=StrategyParams.pcr_min_periods,
+                        help=f'给出持仓量PCR百分位所需的最少交易日数，默认 {StrategyParams.pcr_min_periods}')
+    args = parser.parse_args()
+
+    params = StrategyParams(pcr_lookback=args.pcr_lookback, pcr_min_periods=args.pcr_min_periods)
+    summary = run_batch(args.source, args.out_dir, initial_pos=args.initial_pos, params=params, max_workers=args.workers,
+                        daily_name=args.daily_name, weekly_name=args.weekly_name)
+    print(summary.to_string())
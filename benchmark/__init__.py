@@ -0,0 +1,8 @@
+"""
+性能基准测试：用带随机种子的合成日表、周表对策略链的每个阶段计时，结果写成 JSON。
+
+    python -m benchmark --sizes 1000 10000 100000 --out bench.json
+    python -m benchmark --sizes 10000 --compare bench.json
+"""
+from benchmark.synthetic import synthetic_daily, synthetic_weekly, signal_density
+from benchmark.bench import run_benchmark, compare_results
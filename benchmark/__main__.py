@@ -0,0 +1,21 @@
+import argparse
+
+from benchmark.bench import DEFAULT_SIZES, run_benchmark, compare_results
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(prog='python -m benchmark', description='策略链各阶段的性能基准测试')
+    parser.add_argument('--sizes', type=int, nargs='+', default=DEFAULT_SIZES,
+                        help=f'日度表行数，默认 {" ".join(map(str, DEFAULT_SIZES))}')
+    parser.add_argument('--repeat', type=int, default=3, help='每个阶段运行的次数，默认 3')
+    parser.add_argument('--seed', type=int, default=0, help='合成数据的随机种子，默认 0')
+    parser.add_argument('--no-export', action='store_true', help='不计时 Excel 导出')
+    parser.add_argument('--out', default=None, help='JSON 结果输出路径')
+    parser.add_argument('--compare', default=None, help='与该 JSON 结果比较各阶段耗时')
+    parser.add_argument('--threshold', type=float, default=1.1, help='耗时之比超过该值时标记为变慢，默认 1.1')
+    args = parser.parse_args()
+
+    report = run_benchmark(args.sizes, repeat=args.repeat, seed=args.seed, export=not args.no_export,
+                           out_file=args.out)
+    if args.compare:
+        comparison = compare_results(args.compare, report, threshold=args.threshold)
+        print(comparison.to_string(index=False))
@@ -0,0 +1,178 @@
+import contextlib
+import datetime
+import json
+import os
+import platform
+import statistics
+import subprocess
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+from pcr_bbi_new import analyze_market_data
+from xichou_fun import xichou
+from function_new import function
+from husen_new import analyze_market_signals_with_position as hs3
+from API import API
+from sum import sum
+from params import StrategyParams
+from pipeline import POSITION_COLUMNS, summarize_run, export_result
+from instrument import log_level
+from benchmark.synthetic import synthetic_daily, synthetic_weekly, signal_density
+
+# 结果文件格式版本，字段变化时加一
+RESULT_VERSION = 1
+DEFAULT_SIZES = [1000, 10000, 100000]
+
+
+def _git_revision():
+    # 记录当前提交，便于比较不同提交的结果；不在 git 仓库中时返回 None
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    try:
+        commit = subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=root, capture_output=True,
+                                text=True, check=True).stdout.strip()
+        dirty = bool(subprocess.run(['git', 'status', '--porcelain', '--untracked-files=no'], cwd=root,
+                                    capture_output=True, text=True, check=True).stdout.strip())
+    except (OSError, subprocess.CalledProcessError):
+        return None, None
+    return commit, dirty
+
+
+def _time_stage(run, prepare, repeat):
+    """
+    运行 repeat 次，每次先调用 prepare() 准备输入（不计时），再对 run(*inputs) 计时。
+    返回最后一次的输出和每次的耗时。
+    """
+    runs = []
+    output = None
+    for _ in range(repeat):
+        inputs = prepare()
+        start = time.perf_counter()
+        output = run(*inputs)
+        runs.append(time.perf_counter() - start)
+    return output, runs
+
+
+def bench_size(n_rows, repeat=3, seed=0, params=None, export=True, work_dir=None):
+    """
+    对一个行数运行全部阶段的计时。每个阶段的输入是上一阶段的输出（每次计时前复制一份），
+    与 run_strategies 的调用顺序相同。计时期间关闭策略的逐笔交易日志，耗时只包含计算本身。
+
+    参数:
+    n_rows (int): 日度表行数
+    repeat (int): 每个阶段运行的次数
+    seed (int): 合成数据的随机种子
+    params (StrategyParams): 策略参数，默认为 StrategyParams()
+    export (bool): 是否计时 Excel 导出
+    work_dir (str): 导出文件的临时目录
+
+    返回:
+    dict: 行数、信号频率、各阶段耗时（秒）和结果汇总
+    """
+    params = params or StrategyParams()
+    daily = synthetic_daily(n_rows, seed=seed)
+    weekly = synthetic_weekly(daily)
+
+    stages = {}
+    with log_level('WARNING'), open(os.devnull, 'w', encoding='utf-8') as devnull, \
+            contextlib.redirect_stdout(devnull):
+        df, stages['analyze_market_data'] = _time_stage(
+            lambda d: analyze_market_data(d, date_column='日期', position=0.7, params=params),
+            lambda: (daily.copy(),), repeat)
+        df, stages['xichou'] = _time_stage(lambda d: xichou(d, params), lambda: (df.copy(),), repeat)
+        df, stages['function'] = _time_stage(lambda d: function(d, params), lambda: (df.copy(),), repeat)
+        week_df, stages['hs3'] = _time_stage(lambda w: hs3(w, params=params), lambda: (weekly.copy(),), repeat)
+        df, stages['API'] = _time_stage(API, lambda: (df.copy(), week_df.copy()), repeat)
+        df, stages['sum'] = _time_stage(lambda d: sum(d, POSITION_COLUMNS), lambda: (df.copy(),), repeat)
+        if export:
+            output_file = os.path.join(work_dir or tempfile.gettempdir(), f'bench_{n_rows}.xlsx')
+            _, stages['export'] = _time_stage(export_result, lambda: (df, output_file), repeat)
+            os.remove(output_file)
+
+    return {
+        'rows': n_rows,
+        'weekly_rows': len(weekly),
+        'signals': signal_density(daily, weekly, params),
+        'summary': summarize_run(df),
+        'stages': {name: {'min': min(runs), 'median': statistics.median(runs), 'runs': runs}
+                   for name, runs in stages.items()},
+    }
+
+
+def run_benchmark(sizes=None, repeat=3, seed=0, params=None, export=True, out_file=None):
+    """
+    在多个行数上运行基准测试，结果写成 JSON，可以用 compare_results 与其他提交的结果比较。
+
+    参数:
+    sizes (list): 日度表行数列表，默认为 DEFAULT_SIZES
+    repeat (int): 每个阶段运行的次数，统计取最小值和中位数
+    seed (int): 合成数据的随机种子
+    params (StrategyParams): 策略参数，默认为 StrategyParams()
+    export (bool): 是否计时 Excel 导出
+    out_file (str): JSON 输出路径，为 None 时不写文件
+
+    返回:
+    dict: {'meta': 运行环境, 'results': [每个行数的 bench_size 结果, ...]}
+    """
+    params = params or StrategyParams()
+    commit, dirty = _git_revision()
+    report = {
+        'version': RESULT_VERSION,
+        'meta': {
+            'commit': commit,
+            'dirty': dirty,
+            'created': datetime.datetime.now().isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'pandas': pd.__version__,
+            'numpy': np.__version__,
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+            'repeat': repeat,
+            'seed': seed,
+        },
+        'results': [],
+    }
+    with tempfile.TemporaryDirectory() as work_dir:
+        for n_rows in sizes or DEFAULT_SIZES:
+            result = bench_size(n_rows, repeat=repeat, seed=seed, params=params, export=export, work_dir=work_dir)
+            report['results'].append(result)
+            timings = ' '.join(f"{name}={stage['min'] * 1000:.1f}ms" for name, stage in result['stages'].items())
+            print(f"{n_rows} 行: {timings}")
+
+    if out_file:
+        with open(out_file, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+    return report
+
+
+def compare_results(baseline, current, threshold=1.1):
+    """
+    比较两次基准测试的结果，按行数和阶段列出最小耗时之比。
+
+    参数:
+    baseline (dict or str): 基准结果或其 JSON 文件路径
+    current (dict or str): 当前结果或其 JSON 文件路径
+    threshold (float): 耗时之比超过该值时标记为变慢
+
+    返回:
+    pd.DataFrame: 行数、阶段、基准耗时、当前耗时、耗时之比、是否变慢，只包含两边都有的行数和阶段
+    """
+    reports = []
+    for report in (baseline, current):
+        if isinstance(report, str):
+            with open(report, encoding='utf-8') as f:
+                report = json.load(f)
+        reports.append({result['rows']: result['stages'] for result in report['results']})
+
+    rows = []
+    for n_rows, stages in reports[0].items():
+        for name, stage in stages.items():
+            if name not in reports[1].get(n_rows, {}):
+                continue
+            before, after = stage['min'], reports[1][n_rows][name]['min']
+            ratio = after / before if before > 0 else float('inf')
+            rows.append({'行数': n_rows, '阶段': name, '基准(秒)': before, '当前(秒)': after,
+                         '耗时之比': ratio, '变慢': ratio > threshold})
+    return pd.DataFrame(rows, columns=['行数', '阶段', '基准(秒)', '当前(秒)', '耗时之比', '变慢'])
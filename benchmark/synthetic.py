@@ -0,0 +1,151 @@
+import numpy as np
+import pandas as pd
+
+# 日期列为 datetime64[ns]，可表示的范围约为 1677-09-22 ~ 2262-04-11
+EARLIEST_START = '1678-01-03'
+LATEST_END = '2262-04-10'
+DEFAULT_START = '2005-01-04'
+
+
+def _trading_days(n_rows, rng, start=None, holiday_rate=0.04):
+    """
+    生成 n_rows 个递增的交易日：工作日中随机去掉 holiday_rate 比例的节假日。
+    start 为 None 时从 DEFAULT_START 开始，放不下时自动提前到 EARLIEST_START。
+    """
+    span = int(n_rows / (1 - holiday_rate) * 1.05) + 10
+    candidates = [start] if start is not None else [DEFAULT_START, EARLIEST_START]
+    for first in candidates:
+        calendar = np.arange(np.datetime64(first, 'D'), np.datetime64(first, 'D') + span * 7 // 5 + 7)
+        days = calendar[np.is_busday(calendar)][:span]
+        if days[-1] <= np.datetime64(LATEST_END, 'D'):
+            break
+    else:
+        capacity = np.busday_count(candidates[-1], LATEST_END) * (1 - holiday_rate) / 1.05
+        raise ValueError(f"行数 ({n_rows}) 超出 datetime64[ns] 可表示的日期范围，"
+                         f"从 {candidates[-1]} 开始最多约 {int(capacity)} 个交易日")
+    keep = rng.random(len(days)) >= holiday_rate
+    return days[keep][:n_rows].astype('datetime64[ns]')
+
+
+def _bbi(close):
+    s = pd.Series(close)
+    return ((s.rolling(3, min_periods=1).mean() + s.rolling(6, min_periods=1).mean()
+             + s.rolling(12, min_periods=1).mean() + s.rolling(24, min_periods=1).mean()) / 4).to_numpy()
+
+
+def _ar1(rng, n, phi, sigma):
+    # 平稳 AR(1) 序列，第一项直接取平稳分布，没有预热段
+    noise = rng.normal(0.0, sigma, n)
+    noise[0] /= np.sqrt(1 - phi ** 2)
+    out = np.empty(n)
+    level = 0.0
+    for i in range(n):
+        level = phi * level + noise[i]
+        out[i] = level
+    return out
+
+
+def synthetic_daily(n_rows, seed=0, start=None):
+    """
+    生成带随机种子的日度表，列与 resource.xlsx 相同，各信号出现的频率与真实数据同一量级：
+    收盘价为带波动率聚集的随机游走，持仓量PCR与涨跌反向相关并均值回复，
+    持仓量PCR百分位为过去 250 个交易日的滚动排名，吸筹值约 5% 的交易日超过 80，振幅约 20% 的交易日超过 2.5。
+
+    参数:
+    n_rows (int): 行数
+    seed (int): 随机种子，相同的种子和行数生成完全相同的表
+    start (str): 第一个交易日，默认为 2005-01-04，行数过多时自动提前
+
+    返回:
+    pd.DataFrame: 包含 日期、收盘价、日度BBI、持仓量PCR、持仓量PCR百分位、吸筹值、振幅(%)、涨跌幅(%) 列
+    """
+    if n_rows < 1:
+        raise ValueError(f"行数 ({n_rows}) 必须大于 0")
+    rng = np.random.default_rng(seed)
+    dates = _trading_days(n_rows, rng, start)
+
+    # 收盘价：对数波动率为 AR(1)，收益率为 t 分布
+    vol = 0.013 * np.exp(_ar1(rng, n_rows, 0.98, 0.08) - 0.08)
+    ret = vol * rng.standard_t(5, n_rows) / np.sqrt(5 / 3) + 0.0002
+    ret[0] = 0.0
+    close = 3000.0 * np.exp(np.cumsum(ret))
+    change = np.zeros(n_rows)
+    change[1:] = (close[1:] / close[:-1] - 1) * 100
+    amplitude = (np.abs(ret) + vol * np.abs(rng.normal(1.0, 0.5, n_rows))) * 100
+
+    # 持仓量PCR：均值回复，下跌时上升
+    pcr = 0.85 * np.exp(_ar1(rng, n_rows, 0.97, 0.05) - 2.0 * pd.Series(ret).rolling(5, min_periods=1).sum().to_numpy())
+    percentile = pd.Series(pcr).rolling(250, min_periods=20).rank(pct=True).fillna(0.5).to_numpy()
+
+    # 吸筹值：0~100，偶尔出现持续几天的高值
+    xichou = 100 / (1 + np.exp(-(_ar1(rng, n_rows, 0.85, 0.55) - 0.45)))
+
+    return pd.DataFrame({
+        '日期': dates,
+        '收盘价': close.round(2),
+        '日度BBI': _bbi(close.round(2)).round(2),
+        '持仓量PCR': pcr.round(4),
+        '持仓量PCR百分位': percentile.round(4),
+        '吸筹值': xichou.round(2),
+        '振幅(%)': amplitude.round(2),
+        '涨跌幅(%)': change.round(2),
+    })
+
+
+def synthetic_weekly(daily):
+    """
+    由日度表生成周度表：每个自然周取最后一个交易日的收盘价，
+    周度BBI 为 3/6/12/24 周均线的平均，MACD 为 2 * (DIF - DEA)。
+
+    参数:
+    daily (pd.DataFrame): synthetic_daily 的输出或任何包含 日期、收盘价 列的日度表
+
+    返回:
+    pd.DataFrame: 包含 日期、周收盘价、周度BBI、MACD 列，日期为每周最后一个交易日
+    """
+    dates = pd.to_datetime(daily['日期']).values.astype('datetime64[D]')
+    # 1970-01-01 是周四，加 3 后整除 7 得到以周一开始的周序号
+    week = (dates.astype(np.int64) + 3) // 7
+    last = np.flatnonzero(np.r_[week[1:] != week[:-1], True])
+    close = daily['收盘价'].to_numpy(dtype=float)[last]
+
+    s = pd.Series(close)
+    dif = s.ewm(span=12, adjust=False).mean() - s.ewm(span=26, adjust=False).mean()
+    dea = dif.ewm(span=9, adjust=False).mean()
+    return pd.DataFrame({
+        '日期': pd.to_datetime(daily['日期']).values[last],
+        '周收盘价': close,
+        '周度BBI': _bbi(close).round(2),
+        'MACD': (2 * (dif - dea)).round(4).to_numpy(),
+    })
+
+
+def signal_density(daily, weekly, params=None):
+    """
+    统计输入表中各策略原始条件成立的比例，用于确认合成数据的信号频率。
+
+    参数:
+    daily (pd.DataFrame): 日度表
+    weekly (pd.DataFrame): 周度表
+    params (StrategyParams): 策略参数，默认为 StrategyParams()
+
+    返回:
+    dict: 各条件成立的行数占比
+    """
+    from params import StrategyParams
+    params = params or StrategyParams()
+    close = daily['收盘价'].to_numpy(dtype=float)
+    bbi = daily['日度BBI'].to_numpy(dtype=float)
+    week_close = weekly['周收盘价'].to_numpy(dtype=float)
+    week_bbi = weekly['周度BBI'].to_numpy(dtype=float)
+    below = close < bbi
+    week_below = week_close < week_bbi
+    return {
+        'PCR卖出条件': float(((daily['持仓量PCR百分位'] > params.pcr_sell_percentile)
+                             & (daily['持仓量PCR'] > params.pcr_sell_value)).mean()),
+        'PCR买入条件': float((daily['持仓量PCR百分位'] < params.pcr_buy_percentile).mean()),
+        '日度BBI交叉': float((below[1:] != below[:-1]).mean()) if len(daily) > 1 else 0.0,
+        '吸筹买入条件': float((daily['吸筹值'] > params.xichou_threshold).mean()),
+        '振幅观察条件': float(((daily['振幅(%)'] > params.amplitude_threshold) & (daily['涨跌幅(%)'] < 0)).mean()),
+        '周度BBI交叉': float((week_below[1:] != week_below[:-1]).mean()) if len(weekly) > 1 else 0.0,
+    }
@@ -1,4 +1,18 @@
+import os
+import uuid
+
+import numpy as np
 import pandas as pd
+from openpyxl import Workbook
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.styles import Alignment, Border, Font, Side
+
+# 规则中使用的颜色名对应的 RGB，与 Styler 导出时 CSS 颜色名的转换结果一致
+COLOR_CODES = {'red': 'FF0000', 'green': '008000', 'blue': '0000FF', 'orange': 'FFA500'}
+
+# 每次转换并写出的行数，也是检查取消的间隔
+CHUNK_ROWS = 1000
+
 
 def color(df):
     """
@@ -22,23 +36,104 @@ def color(df):
 
     # 创建样式 DataFrame，初始化为空字符串
     styles = pd.DataFrame('', index=df.index, columns=df.columns)
+    for columns, condition, name in color_rules(df):
+        for col in columns:
+            styles.loc[condition, col] = f'color: {name}'
+
+    return styles
+
+
+def color_rules(df):
+    """
+    color 的四条规则，以布尔掩码形式返回，后面的规则覆盖前面的规则。
+
+    参数:
+    df (pd.DataFrame): 输入的 DataFrame，包含相关列。
+
+    返回:
+    list: [(列名列表, 布尔 Series, 颜色名), ...]
+    """
+    return [
+        # 规则 1: 持仓量PCR百分位 > 90% 且 持仓量PCR > 100%，字体红色
+        (['持仓量PCR百分位', '持仓量PCR'], (df['持仓量PCR百分位'] > 0.9) & (df['持仓量PCR'] > 1.0), 'red'),
+        # 规则 2: 持仓量PCR百分位 < 15%，字体绿色
+        (['持仓量PCR百分位'], df['持仓量PCR百分位'] < 0.15, 'green'),
+        # 规则 3: 吸筹值 > 80，字体蓝色
+        (['吸筹值'], df['吸筹值'] > 80, 'blue'),
+        # 规则 4: 振幅 > 2.5% 且 涨跌幅 < 0，字体橙色
+        (['振幅(%)', '涨跌幅(%)'], (df['振幅(%)'] > 0.025) & (df['涨跌幅(%)'] < 0), 'orange'),
+    ]
+
+
+def to_excel_colored(df, output_file, sheet_name='Sheet1', cancel_token=None):
+    """
+    按 color 的规则给字体上色并写出 Excel，与 df.style.apply(color, axis=None).to_excel(...) 的结果相同，
+    但不生成逐单元格的 CSS 字符串：用只写模式的工作簿分块逐行写出，只有命中规则的单元格带字体样式。
+
+    参数:
+    df (pd.DataFrame): 输入的 DataFrame，包含相关列。
+    output_file (str): 输出 Excel 文件路径
+    sheet_name (str): 工作表名，默认为 'Sheet1'
+    cancel_token (instrument.CancelToken): 给出时每写 CHUNK_ROWS 行检查一次是否已取消，取消时不生成文件
+    """
+    required_columns = ['持仓量PCR百分位', '持仓量PCR', '吸筹值', '振幅(%)', '涨跌幅(%)']
+    missing_columns = [col for col in required_columns if col not in df.columns]
+    if missing_columns:
+        raise ValueError(f"缺少必要的列: {missing_columns}")
+
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet(sheet_name)
 
-    # 规则 1: 持仓量PCR百分位 > 90% 且 持仓量PCR > 100%，字体红色
-    condition1 = (df['持仓量PCR百分位'] > 0.9) & (df['持仓量PCR'] > 1.0)
-    styles.loc[condition1, '持仓量PCR百分位'] = 'color: red'
-    styles.loc[condition1, '持仓量PCR'] = 'color: red'
+    # 表头样式与 pandas 导出的表头一致：加粗、细边框、居中
+    side = Side(style='thin')
+    header_font = Font(bold=True)
+    header_border = Border(left=side, right=side, top=side, bottom=side)
+    header_alignment = Alignment(horizontal='center', vertical='top')
+    header = []
+    for name in df.columns:
+        cell = WriteOnlyCell(sheet, value=str(name))
+        cell.font, cell.border, cell.alignment = header_font, header_border, header_alignment
+        header.append(cell)
+    sheet.append(header)
 
-    # 规则 2: 持仓量PCR百分位 < 15%，字体绿色
-    condition2 = df['持仓量PCR百分位'] < 0.15
-    styles.loc[condition2, '持仓量PCR百分位'] = 'color: green'
+    # 只给命中规则的单元格设置字体，后面的规则覆盖前面的规则：每个上色的列记录每行的颜色序号，-1 为不上色
+    fonts = [Font(color=code) for code in COLOR_CODES.values()]
+    color_index = {name: i for i, name in enumerate(COLOR_CODES)}
+    cell_colors = {}
+    for names, condition, color_name in color_rules(df):
+        hit = condition.to_numpy(dtype=bool, na_value=False)
+        for name in names:
+            codes = cell_colors.setdefault(name, np.full(len(df), -1, dtype=np.int8))
+            codes[hit] = color_index[color_name]
+    colored = [(j, cell_colors[name]) for j, name in enumerate(df.columns) if name in cell_colors]
 
-    # 规则 3: 吸筹值 > 80，字体蓝色
-    condition3 = df['吸筹值'] > 80
-    styles.loc[condition3, '吸筹值'] = 'color: blue'
+    # 先写入同目录下的临时文件，完成后再替换为输出文件；取消时删除临时文件
+    tmp = f'{output_file}.{uuid.uuid4().hex}.tmp'
+    try:
+        # 每次只把 CHUNK_ROWS 行转换为 Python 值，不一次生成全部单元格
+        for start in range(0, len(df), CHUNK_ROWS):
+            if cancel_token is not None and cancel_token.is_cancelled():
+                workbook.save(tmp)
+                cancel_token.check()
+            stop = min(start + CHUNK_ROWS, len(df))
+            rows = [list(row) for row in zip(*(_cell_values(df[name].iloc[start:stop]) for name in df.columns))]
+            for j, codes in colored:
+                for i in np.flatnonzero(codes[start:stop] >= 0):
+                    cell = WriteOnlyCell(sheet, value=rows[i][j])
+                    cell.font = fonts[codes[start + i]]
+                    rows[i][j] = cell
+            for row in rows:
+                sheet.append(row)
+        workbook.save(tmp)
+        os.replace(tmp, output_file)
+    finally:
+        if os.path.exists(tmp):
+            os.remove(tmp)
 
-    # 规则 4: 振幅 > 2.5% 且 涨跌幅 < 0，字体橙色
-    condition4 = (df['振幅(%)'] > 0.025) & (df['涨跌幅(%)'] < 0)
-    styles.loc[condition4, '振幅(%)'] = 'color: orange'
-    styles.loc[condition4, '涨跌幅(%)'] = 'color: orange'
 
-    return styles
\ No newline at end of file
+def _cell_values(series):
+    # 转换为 Python 值列表，缺失值写为空单元格，无穷大与 pandas 一样写为 'inf'/'-inf'
+    values = series.astype(object).where(series.notna(), None)
+    if pd.api.types.is_float_dtype(series):
+        values = values.mask(series == np.inf, 'inf').mask(series == -np.inf, '-inf')
+    return values.tolist()
@@ -1,4 +1,7 @@
 import pandas as pd
+import numpy as np
+
+from dtypes import from_codes, as_datetime
 
 def find_cross_under(df, index1, index2):
     """
@@ -29,10 +32,28 @@ def find_cross_under(df, index1, index2):
 
     return df
 
+def cross_under_flags(values1, values2):
+    """
+    find_cross_under 的数组版本：判断 values1 是否下穿 values2，直接返回布尔数组，不写回 DataFrame
+
+    参数:
+    values1 : array-like，要检测的第一个序列
+    values2 : array-like，要检测的第二个序列
+
+    返回:
+    np.ndarray : 布尔数组，发生下穿的位置为 True
+    """
+    curr_diff = np.asarray(values1, dtype=float) - np.asarray(values2, dtype=float)
+    # 前一行的差值，首行没有前值记为 NaN
+    prev_diff = np.empty_like(curr_diff)
+    prev_diff[:1] = np.nan
+    prev_diff[1:] = curr_diff[:-1]
+    return (prev_diff > 0) & (curr_diff < 0)
+
 def add_weekday_column(df):
     # 确保 '日期' 列是 datetime 类型
-    df['日期'] = pd.to_datetime(df['日期'])
+    df['日期'] = as_datetime(df['日期'])
     # 新增一列 '星期'，显示中文星期几
-    weekday_map = {0: '星期一', 1: '星期二', 2: '星期三', 3: '星期四', 4: '星期五', 5: '星期六', 6: '星期日'}
-    df['星期'] = df['日期'].dt.dayofweek.map(weekday_map)
+    # 分类类型，直接由 dayofweek 编码构造，缺失日期为缺失值
+    df['星期'] = from_codes(df['日期'].dt.dayofweek.fillna(-1).to_numpy(dtype=int), '星期')
     return df
\ No newline at end of file
@@ -0,0 +1,73 @@
+import numpy as np
+import pandas as pd
+
+# 中文星期，按 dayofweek 0~6 排列
+WEEKDAY_NAMES = ['星期一', '星期二', '星期三', '星期四', '星期五', '星期六', '星期日']
+
+# 取值固定的信号列：类别和顺序固定，用整数编码直接构造
+FIXED_CATEGORIES = {
+    '星期': WEEKDAY_NAMES,
+    'BBI信号': ['', '上穿', '下穿'],
+    'MACD信号': ['', '满足买入条件'],
+    '备注': ['', '非周五，跳过交易', '下一周周五买入', '下一周周五卖出'],
+}
+
+# 取值由数据决定的标签列：类别为按首次出现顺序排列的取值，
+# 增量计算分段拼接后重新编码，得到的类型与完整计算相同
+DATA_CATEGORY_COLUMNS = ('吸筹买卖', 'PCR_BBI卖出预警', 'PCR_BBI买入预警')
+
+CATEGORY_COLUMNS = tuple(FIXED_CATEGORIES) + DATA_CATEGORY_COLUMNS
+
+# 振幅距离基准的日期为整数列，基准日由单独的布尔列标记，导出时合并为原来的 '基准'
+BASE_DIST_COLUMN = '振幅距离基准的日期'
+BASE_DAY_COLUMN = '振幅基准日'
+
+
+def as_datetime(values):
+    """
+    将日期列转换为 datetime64 类型，已经是日期类型时原样返回。
+    pd.to_datetime 对超过 50 个元素的输入会先逐个元素检查是否值得缓存，已经转换过的列也要付出这部分开销，
+    逐根行情运行时每根行情都要经过各策略的日期转换。
+    """
+    if pd.api.types.is_datetime64_any_dtype(values):
+        return values
+    return pd.to_datetime(values)
+
+
+def from_codes(codes, column):
+    """
+    由整数编码构造取值固定的分类列，编码为 FIXED_CATEGORIES[column] 中的位置，-1 为缺失值。
+    """
+    return pd.Categorical.from_codes(codes, FIXED_CATEGORIES[column])
+
+
+def categorical(values, column):
+    """
+    将字符串数组转换为 column 对应的分类类型：取值固定的列使用 FIXED_CATEGORIES，
+    其他列的类别为按首次出现顺序排列的取值。None/NaN 为缺失值。
+    """
+    categories = FIXED_CATEGORIES.get(column)
+    if categories is not None:
+        return pd.Categorical(values, categories=categories)
+    codes, uniques = pd.factorize(np.asarray(values, dtype=object))
+    return pd.Categorical.from_codes(codes, uniques)
+
+
+def readable(df):
+    """
+    导出前将内部的紧凑类型还原为表格中显示的取值：分类列转换为字符串，
+    振幅距离基准的日期 在基准日写为 '基准'，并去掉 振幅基准日 列。
+
+    参数:
+    df (pd.DataFrame): run_strategies 的输出或其中的若干列
+
+    返回:
+    pd.DataFrame: 转换后的表，不修改 df
+    """
+    converted = {name: df[name].astype(object) for name in df.columns
+                 if isinstance(df[name].dtype, pd.CategoricalDtype)}
+    if BASE_DAY_COLUMN in df.columns:
+        if BASE_DIST_COLUMN in df.columns:
+            converted[BASE_DIST_COLUMN] = df[BASE_DIST_COLUMN].astype(object).mask(df[BASE_DAY_COLUMN], '基准')
+        df = df.drop(columns=BASE_DAY_COLUMN)
+    return df.assign(**converted) if converted else df
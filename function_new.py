@@ -1,93 +1,237 @@
 import pandas as pd
 import numpy as np
+import logging
 from datetime import timedelta
-import tradeday as td
-from cross import find_cross_under
+from tradeday import TradingCalendar, FridayResolver
+from cross import cross_under_flags
 from cross import add_weekday_column
+from params import StrategyParams
+from instrument import logger
+from dtypes import readable, as_datetime
 
-def function(df):
-    # 1. 预处理数据
-    df = add_weekday_column(df)  # 添加星期列
-    df['日期'] = pd.to_datetime(df['日期'])
-    
-    # 2. 初始化输出列
-    df['振幅距离预警的日期'] = 0
-    df['振幅指标调整仓位'] = 0.0
-    df['振幅卖出指标'] = 0  # 记录下穿
-    df['振幅预警指标'] = 0
-    df['振幅距离基准的日期'] = np.nan  # 使用 np.nan 初始化，允许混合类型
-    df['振幅距离基准的日期'] = df['振幅距离基准的日期'].astype('object')  # 设置为 object 类型
-
-    # 3. 初始化计数器
-    first_date = df['日期'].iloc[0]  # 第一次观察日期
-    last_date = None  # 预警开始日期
-    obs_cnt = 0  # 观察计数
-    flag = 0  # 预警触发标志
-    sell_done = False  # 是否已卖出
-
-    # 4. 计算下穿指标
-    df = find_cross_under(df, '收盘价', '日度BBI')
-
-    # 5. 逐行扫描
-    for idx, row in df.iterrows():
-        dt = row['日期']
-        amp = row['振幅(%)']
-        drop = row['涨跌幅(%)']
-        weekday = row['星期'].strip()
-        cross_down = row['振幅卖出指标']
 
+# 下穿后的卖出周五：下穿日为周一至周日时分别在第几周的周五卖出（0 为当周）。
+# 周一、周二为当周周五，周三至周五为下周周五，与 dt + Week(weekday=4)（周三、周四再加 Week(1)）一致
+SELL_WEEKS = (0, 0, 1, 1, 1, 2, 2)
+
+
+def amplitude_warning_engine(amp, drop, cross_down, day_lo, day_hi, sell_row,
+                             threshold=2.5, obs_count=3, warning_days=30, cycle_days=60, step=0.15,
+                             state=None, stop=None):
+    """
+    振幅预警 + 下穿卖出状态机，单次遍历，全部读写都在预分配的数组上完成。
+
+    交易日计数 count(a, b) = day_hi[b] - day_lo[a]（不小于 0），
+    与 TradingCalendar.count_between(日期[a], 日期[b]) 相同。
+
+    参数:
+    amp (np.ndarray): 振幅(%)
+    drop (np.ndarray): 涨跌幅(%)
+    cross_down (np.ndarray): 收盘价下穿日度BBI标记
+    day_lo (np.ndarray): 每行日期在交易日历中的左端序号
+    day_hi (np.ndarray): 每行日期在交易日历中的右端序号
+    sell_row (np.ndarray): 每行下穿后对应的卖出行号（FridayResolver.rows），-1 表示不卖出或卖出日尚未确定
+    threshold (float): 振幅阈值，默认 2.5
+    obs_count (int): 触发预警所需的观察次数，默认 3
+    warning_days (int): 预警有效的交易日数，默认 30
+    cycle_days (int): 观察周期的交易日数，默认 60
+    step (float): 卖出幅度，默认 0.15
+    state (dict): 续算时上一段结束时的状态（即上一次返回的 'state'），默认从头开始
+    stop (int): 只处理前 stop 行，默认处理全部行；卖出仍可能写在 stop 之后的行
+
+    返回:
+    dict: 各输出列对应的数组，卖出记录列表 'trades' [(下穿行, 卖出行), ...]，
+          以及处理到 stop 行之前的状态 'state'（基准日、预警日以交易日序号保存）
+    """
+    n = len(amp)
+    stop = n if stop is None else stop
+    warn_dist = np.zeros(n, dtype=np.int64)  # 振幅距离预警的日期
+    adjust = np.zeros(n, dtype=float)  # 振幅指标调整仓位
+    warn_flag = np.zeros(n, dtype=np.int64)  # 振幅预警指标
+    base_dist = np.zeros(n, dtype=np.int64)  # 振幅距离基准的日期
+    is_base = np.zeros(n, dtype=bool)  # 该行是否为基准日
+    trades = []
+
+    if state is None:
+        state = {'first_lo': day_lo[0] if n else 0, 'last_lo': -1, 'obs_cnt': 0, 'flag': 0, 'sell_done': False}
+    first_lo = state['first_lo']  # 第一次观察日期的交易日序号
+    last_lo = state['last_lo']  # 预警开始日期的交易日序号，-1 表示无
+    obs_cnt = state['obs_cnt']  # 观察计数
+    flag = state['flag']  # 预警触发标志
+    sell_done = state['sell_done']  # 是否已卖出
+
+    for i in range(stop):
+        hi = day_hi[i]
         # 计算距离基准日期的交易日数
-        df.at[idx, '振幅距离基准的日期'] = td.count_tradeday(df, first_date.date(), dt.date(), '日期')
+        base_dist[i] = max(hi - first_lo, 0)
 
         # ① 触发观察计数
-        if amp > 2.5 and drop < 0 and not sell_done:
+        if amp[i] > threshold and drop[i] < 0 and not sell_done:
             obs_cnt += 1
-            df.at[idx, '振幅预警指标'] = 1
+            warn_flag[i] = 1
             if obs_cnt == 1:
-                first_date = dt  # 设置基准日期
-                df.at[idx, '振幅距离基准的日期'] = '基准'
-            if obs_cnt == 3:
-                last_date = dt  # 标记预警开始日期
+                first_lo = day_lo[i]  # 设置基准日期
+                is_base[i] = True
+            if obs_cnt == obs_count:
+                last_lo = day_lo[i]  # 标记预警开始日期
                 flag = 1  # 触发预警
 
         # ② 预警后 30 天内未下穿或 60 天周期结束，清零计数
-        if flag == 1 and last_date is not None:
-            if td.count_tradeday(df, last_date.date(), dt.date(), '日期') > 30:
-                last_date, obs_cnt, flag = None, 0, 0
-        if flag == 0 and td.count_tradeday(df, first_date.date(), dt.date(), '日期') > 60:
+        if flag == 1 and last_lo >= 0:
+            if hi - last_lo > warning_days:
+                last_lo, obs_cnt, flag = -1, 0, 0
+        if flag == 0 and hi - first_lo > cycle_days:
             obs_cnt, sell_done = 0, False
-            first_date = dt  # 重置基准日期
+            first_lo = day_lo[i]  # 重置基准日期
 
         # ③ 预警后 30 天内下穿，确定卖出日期
-        if flag == 1 and not sell_done and td.count_tradeday(df, last_date.date(), dt.date(), '日期') < 30:
-            if cross_down == 1:
-                # 根据星期确定卖出日期
-                if weekday in ['星期一', '星期二','星期五']:
-                    # 当周周五
-                    sell_date = dt + pd.offsets.Week(weekday=4)  # 4 表示周五
-                else:  # 周三、周四
-                    # 下周周五
-                    sell_date = dt + pd.offsets.Week(weekday=4) + pd.offsets.Week(1)
-                
-                # 确保卖出日期在数据范围内
-                if sell_date in df['日期'].values:
-                    sell_idx = df[df['日期'] == sell_date].index[0]
-                    date_str1 = dt.strftime('%Y-%m-%d')
-                    date_str2 = sell_date.strftime('%Y-%m-%d')
-                    print(f"{date_str1} 下穿！{date_str2} 卖出！")
-                    df.at[sell_idx, '振幅指标调整仓位'] = -0.15
-                    last_date, flag, obs_cnt, sell_done = None, 0, 0, True
+        if flag == 1 and not sell_done and max(hi - last_lo, 0) < warning_days:
+            if cross_down[i] == 1 and sell_row[i] >= 0:
+                adjust[sell_row[i]] = -step
+                trades.append((i, sell_row[i]))
+                last_lo, flag, obs_cnt, sell_done = -1, 0, 0, True
 
         # ④ 更新“振幅距离预警的日期”
-        if last_date is not None and flag == 1:
-            df.at[idx, '振幅距离预警的日期'] = td.count_tradeday(df, last_date.date(), dt.date(), '日期')
+        if last_lo >= 0 and flag == 1:
+            warn_dist[i] = max(hi - last_lo, 0)
+
+    return {
+        '振幅距离预警的日期': warn_dist,
+        '振幅指标调整仓位': adjust,
+        '振幅预警指标': warn_flag,
+        '振幅距离基准的日期': base_dist,
+        '基准': is_base,
+        'trades': trades,
+        'state': {'first_lo': first_lo, 'last_lo': last_lo, 'obs_cnt': obs_cnt, 'flag': flag, 'sell_done': sell_done},
+    }
+
+
+def function(df, params=None):
+    """
+    振幅预警 + 日度收盘价下穿策略
+
+    参数:
+    df (pd.DataFrame): 包含'日期', '收盘价', '日度BBI', '振幅(%)', '涨跌幅(%)'列
+    params (StrategyParams): 策略参数，默认为 StrategyParams()
+
+    返回:
+    pd.DataFrame: 添加了星期和振幅相关列的DataFrame
+    """
+    params = params or StrategyParams()
+    # 1. 预处理数据
+    df = add_weekday_column(df)  # 添加星期列
+    df['日期'] = as_datetime(df['日期'])
+
+    # 2. 取出计算所需的数组
+    dates = df['日期'].values
+    amp = df['振幅(%)'].to_numpy(dtype=float)
+    drop = df['涨跌幅(%)'].to_numpy(dtype=float)
+    cross_down = cross_under_flags(df['收盘价'], df['日度BBI']).astype(int)  # 计算下穿指标
+
+    # 交易日历只构建一次，每行的交易日序号预先算好
+    day_lo, day_hi = TradingCalendar(dates).bounds(dates)
+
+    # 3. 单次遍历状态机，每行的卖出行由执行日期查找表一次得到
+    sell_row = FridayResolver(dates, params.holiday_policy).rows(SELL_WEEKS)
+    result = amplitude_warning_engine(
+        amp, drop, cross_down, day_lo, day_hi, sell_row,
+        threshold=params.amplitude_threshold, obs_count=params.amplitude_obs_count,
+        warning_days=params.amplitude_warning_days, cycle_days=params.amplitude_cycle_days,
+        step=params.amplitude_step,
+    )
+
+    if logger.isEnabledFor(logging.INFO):
+        for cross_idx, sell_idx in result['trades']:
+            date_str1 = pd.Timestamp(dates[cross_idx]).strftime('%Y-%m-%d')
+            date_str2 = pd.Timestamp(dates[sell_idx]).strftime('%Y-%m-%d')
+            logger.info(f"{date_str1} 下穿！{date_str2} 卖出！")
+
+    # 4. 一次性写回输出列
+    df['振幅距离预警的日期'] = result['振幅距离预警的日期']
+    df['振幅指标调整仓位'] = result['振幅指标调整仓位']
+    df['振幅卖出指标'] = cross_down  # 记录下穿
+    df['振幅预警指标'] = result['振幅预警指标']
+    df['振幅距离基准的日期'] = result['振幅距离基准的日期']
+    df['振幅基准日'] = result['基准']  # 导出时基准日的距离写为 '基准'
 
     return df
 
+
+def amplitude_initial_state():
+    """
+    amplitude_resume 从第一行开始计算时使用的状态。
+    """
+    return {'start': 0, 'engine': None, 'pending_sell': np.empty(0, dtype='datetime64[ns]')}
+
+
+def amplitude_resume(df, state, params=None, offset=0):
+    """
+    检查点续算：从 state['start'] 行开始运行振幅预警状态机，之前的行沿用上一次的结果。
+    下穿后的卖出周五晚于最后一个日期时该下穿被忽略，追加数据后可能变为有效，
+    因此下一次续算的起点是第一个卖出日期晚于最后一个日期的行；起点之前已经确定、
+    但卖出行在起点之后的卖出保存在 'pending_sell' 中。
+
+    参数:
+    df (pd.DataFrame): 完整日度表，包含'日期', '收盘价', '日度BBI', '振幅(%)', '涨跌幅(%)'列，日期严格递增
+    state (dict): 上一次返回的状态，首次计算使用 amplitude_initial_state()
+    params (StrategyParams): 策略参数，默认为 StrategyParams()
+    offset (int): df 第一行在完整日度表中的行号，df 只需包含 state['start'] 的前一行及之后的行
+
+    返回:
+    tuple: (start, outputs, new_state)。outputs 为 start 及之后各行的'星期'和振幅相关列的数组
+    """
+    params = params or StrategyParams()
+    start = state['start']
+    tail = df.iloc[start - offset:]
+    dates = tail['日期'].values.astype('datetime64[ns]')
+    day_lo, day_hi = TradingCalendar(dates).bounds(dates)
+    day_lo, day_hi = day_lo + start, day_hi + start
+
+    # 下穿需要前一行，续算时多取一行
+    lead = 1 if start > 0 else 0
+    cross_down = cross_under_flags(df['收盘价'].to_numpy()[start - offset - lead:],
+                                   df['日度BBI'].to_numpy()[start - offset - lead:])[lead:].astype(int)
+    amp = tail['振幅(%)'].to_numpy(dtype=float)
+    drop = tail['涨跌幅(%)'].to_numpy(dtype=float)
+    resolver = FridayResolver(dates, params.holiday_policy)
+    sell_row = resolver.rows(SELL_WEEKS)
+    sell_dates = resolver.target_fridays(SELL_WEEKS)
+    options = dict(threshold=params.amplitude_threshold, obs_count=params.amplitude_obs_count,
+                   warning_days=params.amplitude_warning_days, cycle_days=params.amplitude_cycle_days,
+                   step=params.amplitude_step)
+
+    n = len(tail)
+    late = np.flatnonzero(sell_dates > dates[-1]) if n else np.empty(0, dtype=np.int64)
+    split = int(late[0]) if len(late) else n
+    head = amplitude_warning_engine(amp, drop, cross_down, day_lo, day_hi, sell_row,
+                                    state=state['engine'], stop=split, **options)
+    rest = amplitude_warning_engine(amp[split:], drop[split:], cross_down[split:], day_lo[split:], day_hi[split:],
+                                    np.where(sell_row[split:] >= 0, sell_row[split:] - split, -1),
+                                    state=head['state'], **options)
+
+    columns = ['振幅距离预警的日期', '振幅预警指标', '振幅距离基准的日期', '基准']
+    outputs = {col: np.concatenate([head[col][:split], rest[col]]) for col in columns}
+    # 卖出按行赋值，两段和上一次遗留的卖出取并集
+    adjust = head['振幅指标调整仓位']
+    adjust[split:] = np.where(rest['振幅指标调整仓位'] != 0, rest['振幅指标调整仓位'], adjust[split:])
+    adjust[np.isin(dates, state['pending_sell'])] = -params.amplitude_step
+    carried = np.array([row for _, row in head['trades'] if row >= split], dtype=np.int64)
+    pending = np.r_[state['pending_sell'], dates[carried]]
+    pending = pending[pending >= dates[split]] if split < n else pending[:0]
+
+    outputs['振幅基准日'] = outputs.pop('基准')
+    outputs['振幅指标调整仓位'] = adjust
+    outputs['振幅卖出指标'] = cross_down
+    outputs['星期'] = add_weekday_column(tail[['日期']].copy())['星期'].to_numpy()
+
+    new_state = {'start': start + split, 'engine': head['state'], 'pending_sell': pending.astype('datetime64[ns]')}
+    return start, outputs, new_state
+
+
 if __name__ == '__main__':
     # 1. 读取数据
     path = r"D:\apps\中金项目\7-29-收益率\mian7月31日\main1\main\resource\resource.xlsx"
     out_file = r"D:\apps\中金项目\7-29-收益率\mian7月31日\main1\main\result\result44444444444.xlsx"
     df = pd.read_excel(path)
     df = function(df)
-    df.to_excel(out_file, index=False)
\ No newline at end of file
+    readable(df).to_excel(out_file, index=False)
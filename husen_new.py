@@ -1,9 +1,168 @@
 import pandas as pd
+import numpy as np
 import os
-import traceback
+from params import StrategyParams
+from tablecache import cached_table
+from instrument import logger
+from dtypes import from_codes
+from tradeday import FridayResolver
 from datetime import timedelta
 
-def analyze_market_signals_with_position(input_file_path, date_column='日期'):
+# 每行都映射到当周周五
+THIS_WEEK = (0,) * 7
+
+
+def weekly_signal_engine(close, bbi, macd, tradable, mark_ratio=1.05, warning_weeks=5):
+    """
+    周度BBI/MACD信号生成（向量化）。
+    上穿/下穿由前后两期错位数组直接比较得到；标记价、预警窗口和下一周周五执行
+    按“上穿开启的一段行情”整体求解，只对上穿次数循环，不逐周遍历。
+
+    参数:
+    close (np.ndarray): 周收盘价
+    bbi (np.ndarray): 周度BBI
+    macd (np.ndarray): MACD
+    tradable (np.ndarray): 布尔数组，该周是否参与交易（第一行和非周五为 False，见 week_end_rows）
+    mark_ratio (float): 标记价相对上穿当周收盘价的倍数，默认 1.05
+    warning_weeks (int): 预警后检查MACD条件的周数，默认 5
+
+    返回:
+    dict: 'up'/'down'（BBI上穿/下穿）、'macd_buy'（满足买入条件）、
+          'buy_exec'/'sell_exec'（待执行买入/卖出落在的行）五个布尔数组
+    """
+    n = len(close)
+    prev_close = np.r_[np.nan, close][:n]
+    prev_bbi = np.r_[np.nan, bbi][:n]
+    up = tradable & (prev_close < prev_bbi) & (close > bbi)
+    down = tradable & (prev_close >= prev_bbi) & (close < bbi)
+
+    # 每个交易周的下一个交易周（待执行信号在这一周执行），没有则为 -1
+    trade_rows = np.flatnonzero(tradable)
+    next_row = np.full(n, -1, dtype=np.int64)
+    next_row[trade_rows[:-1]] = trade_rows[1:]
+
+    up_rows = np.flatnonzero(up)
+    down_rows = np.flatnonzero(down)
+    macd_rows = np.flatnonzero(tradable & (macd > 0))
+
+    # 上穿设置的标记价一直有效，直到下一次上穿被替换，或下穿当周处理完后清除
+    next_down = np.searchsorted(down_rows, up_rows, side='right')
+    down_end = np.r_[down_rows, n - 1][next_down]
+    up_end = np.r_[up_rows[1:] - 1, n - 1]
+    episode_end = np.minimum(down_end, up_end)
+    mark_price = close[up_rows] * mark_ratio
+
+    macd_buy = np.zeros(n, dtype=bool)
+    buy_exec = np.zeros(n, dtype=bool)
+    for start, end, mark in zip(up_rows, episode_end, mark_price):
+        # 价格首次达到标记价的一周触发预警（上穿当周也参与判断）
+        lo = np.searchsorted(trade_rows, start, side='left')
+        hi = np.searchsorted(trade_rows, end, side='right')
+        weeks = trade_rows[lo:hi]
+        hit = np.flatnonzero(close[weeks] >= mark)
+        if not hit.size:
+            continue
+        warning_row = weeks[hit[0]]
+
+        # 预警后 warning_weeks 周内第一个 MACD > 0 的周满足买入条件，下一周周五执行后信号清除
+        lo = np.searchsorted(macd_rows, warning_row, side='left')
+        hi = np.searchsorted(macd_rows, min(end, warning_row + warning_weeks), side='right')
+        if lo >= hi:
+            continue
+        signal_row = macd_rows[lo]
+        macd_buy[signal_row] = True
+        exec_row = next_row[signal_row]
+        # 执行周距预警超过 warning_weeks 周时信号过期；下穿当周已清除预警，不再过期
+        if exec_row >= 0 and (down[signal_row] or exec_row - warning_row <= warning_weeks):
+            buy_exec[exec_row] = True
+
+    sell_exec = np.zeros(n, dtype=bool)
+    sell_rows = next_row[down_rows]
+    sell_exec[sell_rows[sell_rows >= 0]] = True
+
+    return {'up': up, 'down': down, 'macd_buy': macd_buy, 'buy_exec': buy_exec, 'sell_exec': sell_exec}
+
+
+def weekly_position_engine(buy_exec, sell_exec, size=0.15, limit=1.0, total_position=0.0):
+    """
+    周度仓位递推：只在执行周上按 [0, limit] 截断累加，同一周先买后卖。
+
+    参数:
+    buy_exec (np.ndarray): 布尔数组，执行买入的周
+    sell_exec (np.ndarray): 布尔数组，执行卖出的周
+    size (float): 单次调整幅度，默认 0.15
+    limit (float): 总仓位上限，默认 1.0
+    total_position (float): 期初总仓位，续算时为上一段的期末总仓位，默认 0
+
+    返回:
+    tuple: (周度bbi调整仓位数组, 执行类型数组, 期末总仓位)，执行类型 1 为买入、2 为卖出、0 为无操作
+    """
+    adjust = np.zeros(len(buy_exec), dtype=float)
+    action = np.zeros(len(buy_exec), dtype=np.int8)
+    for i in np.flatnonzero(buy_exec | sell_exec):
+        if buy_exec[i] and total_position < limit:
+            adjustment = min(size, limit - total_position)
+            total_position += adjustment
+            adjust[i], action[i] = adjustment, 1
+        if sell_exec[i] and total_position > 0:
+            adjustment = -min(size, total_position)
+            total_position += adjustment
+            adjust[i], action[i] = adjustment, 2
+    return adjust, action, total_position
+
+
+def week_end_rows(dates, last_trading_day=False, holiday_policy='skip'):
+    """
+    周表中哪些行参与交易：每周在当周周五的行交易，由 FridayResolver 按 holiday_policy 确定——
+    'skip' 只有周五的行参与交易，'last' 周五休市时该周周五之前的最后一行参与交易。
+    last_trading_day 为 True 时每行的日期都是该周最后一个交易日（indicators.weekly_bars 的输出），全部参与交易。
+    """
+    if last_trading_day:
+        return np.ones(len(dates), dtype=bool)
+    return FridayResolver(dates, holiday_policy).rows(THIS_WEEK) == np.arange(len(dates))
+
+
+def load_weekly_table(input_file_path, date_column='日期', use_cache=True):
+    """
+    读取并规范化周度表：按扩展名读取 Excel/CSV，检查必要列，转换日期列。
+
+    参数:
+    input_file_path (str or pd.DataFrame): 输入Excel/CSV文件的路径，或已读取的周度表（不会被修改）。
+    date_column (str): 日期列名，默认为'日期'。
+    use_cache (bool): 为 True 时通过 tablecache 缓存规范化后的表，文件未变化时不再解析 Excel/CSV。
+
+    返回:
+    pd.DataFrame: 规范化后的周度表；文件类型不支持或缺少必要列时打印错误并返回 None。
+    """
+    if use_cache and not isinstance(input_file_path, pd.DataFrame) and os.path.isfile(input_file_path):
+        return cached_table(input_file_path, f'weekly|{date_column}',
+                            lambda path: load_weekly_table(path, date_column, use_cache=False))
+
+    # 读取文件
+    file_extension = '' if isinstance(input_file_path, pd.DataFrame) else os.path.splitext(input_file_path)[1].lower()
+    if isinstance(input_file_path, pd.DataFrame):
+        df_weekly = input_file_path.copy()
+    elif file_extension == '.xlsx':
+        df_weekly = pd.read_excel(input_file_path)
+    elif file_extension == '.csv':
+        df_weekly = pd.read_csv(input_file_path, encoding='utf-8-sig')
+    else:
+        logger.error(f"错误: 不支持的文件类型 '{file_extension}'。请提供 .xlsx 或 .csv 文件。")
+        return None
+
+    # 检查所需列
+    required_weekly_columns = [date_column, '周收盘价', '周度BBI', 'MACD']
+    for col in required_weekly_columns:
+        if col not in df_weekly.columns:
+            logger.error(f"错误: 输入文件中缺少必要的列 '{col}'。请检查列名。")
+            return None
+
+    # 转换日期列为日期时间格式
+    df_weekly[date_column] = pd.to_datetime(df_weekly[date_column])
+    return df_weekly
+
+
+def analyze_market_signals_with_position(input_file_path, date_column='日期', params=None):
     """
     根据周度策略分析市场数据，生成交易信号并计算仓位变化。
     核心规则：
@@ -15,113 +174,47 @@ def analyze_market_signals_with_position(input_file_path, date_column='日期'):
     3. 仓位限制：总仓位在0%到100%之间。
 
     参数:
-    input_file_path (str): 输入Excel/CSV文件的路径。
+    input_file_path (str or pd.DataFrame): 输入Excel/CSV文件的路径，或已读取的周度表。
     date_column (str): Excel/CSV文件中表示日期的列名，默认为'日期'。
+    params (StrategyParams): 策略参数，默认为 StrategyParams()。
 
     返回:
     pd.DataFrame: 包含交易信号和仓位调整的DataFrame。
     """
+    params = params or StrategyParams()
     try:
-        # 读取文件
-        file_extension = os.path.splitext(input_file_path)[1].lower()
-        if file_extension == '.xlsx':
-            df_weekly = pd.read_excel(input_file_path)
-        elif file_extension == '.csv':
-            df_weekly = pd.read_csv(input_file_path, encoding='utf-8-sig')
-        else:
-            print(f"错误: 不支持的文件类型 '{file_extension}'。请提供 .xlsx 或 .csv 文件。")
+        df_weekly = load_weekly_table(input_file_path, date_column)
+        if df_weekly is None:
             return pd.DataFrame()
 
-        # 检查所需列
-        required_weekly_columns = [date_column, '周收盘价', '周度BBI', 'MACD']
-        for col in required_weekly_columns:
-            if col not in df_weekly.columns:
-                print(f"错误: 输入文件中缺少必要的列 '{col}'。请检查列名。")
-                return pd.DataFrame()
-
-        # 转换日期列为日期时间格式并排序
-        df_weekly[date_column] = pd.to_datetime(df_weekly[date_column])
+        # 按日期排序
         df_weekly = df_weekly.set_index(date_column).sort_index()
 
-        # 初始化信号和仓位相关列
-        df_weekly['BBI信号'] = ''
-        df_weekly['MACD信号'] = ''
-        df_weekly['周度bbi调整仓位'] = 0.0
-        df_weekly['备注'] = ''
-
-        # 状态变量
-        buy_mark_price = None
-        buy_warning_triggered = False
-        warning_week_index = -1
-        total_position = 0.0  # 跟踪当前总仓位
-        pending_buy = False  # 标记是否有待执行的买入
-        pending_sell = False  # 标记是否有待执行的卖出
-
-        print("\n--- 开始生成交易信号和计算仓位 ---")
-        # 遍历周度数据
-        for i in range(1, len(df_weekly)):
-            current_friday_date_obj = df_weekly.index[i]
-            prev_friday_date_obj = df_weekly.index[i - 1]
-
-            # 验证日期是否为周五
-            if current_friday_date_obj.weekday() != 4:  # 4 表示周五
-                df_weekly.loc[current_friday_date_obj, '备注'] = '非周五，跳过交易'
-                continue
-
-            # 提取当前和上一期数据
-            current_close = df_weekly.loc[current_friday_date_obj, '周收盘价']
-            prev_close = df_weekly.loc[prev_friday_date_obj, '周收盘价']
-            current_bbi = df_weekly.loc[current_friday_date_obj, '周度BBI']
-            prev_bbi = df_weekly.loc[prev_friday_date_obj, '周度BBI']
-            current_macd = df_weekly.loc[current_friday_date_obj, 'MACD']
-
-            # 信号过期逻辑
-            if buy_warning_triggered and warning_week_index != -1 and (i - warning_week_index) > 5:
-                buy_mark_price, buy_warning_triggered, warning_week_index = None, False, -1
-                pending_buy = False
-
-            # 处理待执行的买入或卖出（上一周触发的信号）
-            if pending_buy and i < len(df_weekly):
-                if total_position < 1.0:
-                    adjustment = min(0.15, 1.0 - total_position)
-                    total_position += adjustment
-                    df_weekly.loc[current_friday_date_obj, '周度bbi调整仓位'] = adjustment
-                    df_weekly.loc[current_friday_date_obj, '备注'] = '下一周周五买入'
-                pending_buy = False
-                buy_mark_price, buy_warning_triggered, warning_week_index = None, False, -1
-
-            if pending_sell and i < len(df_weekly):
-                if total_position > 0:
-                    adjustment = -min(0.15, total_position)
-                    total_position += adjustment
-                    df_weekly.loc[current_friday_date_obj, '周度bbi调整仓位'] = adjustment
-                    df_weekly.loc[current_friday_date_obj, '备注'] = '下一周周五卖出'
-                pending_sell = False
-                buy_mark_price, buy_warning_triggered, warning_week_index = None, False, -1
-
-            # BBI上穿，设置标记价
-            if prev_close < prev_bbi and current_close > current_bbi:
-                df_weekly.loc[current_friday_date_obj, 'BBI信号'] = '上穿'
-                buy_mark_price = current_close * 1.05
-                buy_warning_triggered, warning_week_index = False, -1
-
-            # 价格达到标记价，触发预警
-            if buy_mark_price is not None and not buy_warning_triggered and current_close >= buy_mark_price:
-                buy_warning_triggered, warning_week_index = True, i
-
-            # 预警后5周内，检查MACD条件以触发买入（下一周周五执行）
-            if buy_warning_triggered and warning_week_index != -1 and (i - warning_week_index) <= 5:
-                if current_macd > 0:
-                    df_weekly.loc[current_friday_date_obj, 'MACD信号'] = '满足买入条件'
-                    pending_buy = True  # 标记为下一周周五买入
-
-            # BBI下穿，触发卖出（下一周周五执行）
-            if prev_close >= prev_bbi and current_close < current_bbi:
-                df_weekly.loc[current_friday_date_obj, 'BBI信号'] = '下穿'
-                pending_sell = True  # 标记为下一周周五卖出
-                buy_mark_price, buy_warning_triggered, warning_week_index = None, False, -1
-
-        print("--- 信号生成和仓位计算完毕 ---")
+        logger.info("\n--- 开始生成交易信号和计算仓位 ---")
+        # 第一行没有上一期数据；非周五的行跳过交易（周表由日表生成时每行都是一周的最后一个交易日）
+        week_end = week_end_rows(df_weekly.index, params.weekly_last_trading_day, params.holiday_policy)
+        tradable = week_end.copy()
+        tradable[:1] = False
+
+        signals = weekly_signal_engine(
+            df_weekly['周收盘价'].to_numpy(dtype=float),
+            df_weekly['周度BBI'].to_numpy(dtype=float),
+            df_weekly['MACD'].to_numpy(dtype=float),
+            tradable,
+            mark_ratio=params.weekly_mark_ratio,
+            warning_weeks=params.weekly_warning_weeks,
+        )
+        adjust, action, _ = weekly_position_engine(signals['buy_exec'], signals['sell_exec'], size=params.weekly_step)
+
+        # 一次性写回信号和仓位列
+        df_weekly['BBI信号'] = from_codes(np.select([signals['up'], signals['down']], [1, 2], 0), 'BBI信号')
+        df_weekly['MACD信号'] = from_codes(signals['macd_buy'].astype(np.int8), 'MACD信号')
+        df_weekly['周度bbi调整仓位'] = adjust
+        skipped = ~week_end
+        skipped[:1] = False
+        df_weekly['备注'] = from_codes(np.select([skipped, action == 1, action == 2], [1, 2, 3], 0), '备注')
+
+        logger.info("--- 信号生成和仓位计算完毕 ---")
 
         # 恢复日期列为普通列
         df_weekly = df_weekly.reset_index()
@@ -129,10 +222,81 @@ def analyze_market_signals_with_position(input_file_path, date_column='日期'):
         return df_weekly
 
     except Exception as e:
-        print(f"发生严重错误: {e}")
-        traceback.print_exc()
+        logger.exception(f"发生严重错误: {e}")
         return pd.DataFrame()
 
+
+def weekly_initial_state():
+    """
+    weekly_resume 从第一行开始计算时使用的状态。
+    """
+    return {'start': 0, 'total_position': 0.0, 'pending_buy': False, 'pending_sell': False}
+
+
+def weekly_resume(df_weekly, state, params=None, date_column='日期', offset=0):
+    """
+    检查点续算：从 state['start'] 行开始生成周度信号和仓位，之前的行沿用上一次的结果。
+    起点取最后一次上穿所在的周：之前的每段行情都已经结束，它们的买卖最晚在这一周执行，
+    这一周待执行的买卖保存在 'pending_buy'/'pending_sell' 中；还没有上穿时从第一行开始。
+
+    参数:
+    df_weekly (pd.DataFrame): 按日期排序的完整周度表（load_weekly_table 的输出）
+    state (dict): 上一次返回的状态，首次计算使用 weekly_initial_state()
+    params (StrategyParams): 策略参数，默认为 StrategyParams()
+    date_column (str): 日期列名，默认为'日期'
+    offset (int): df_weekly 第一行在完整周度表中的行号，df_weekly 只需包含 state['start'] 的前一行及之后的行
+
+    返回:
+    tuple: (start, outputs, new_state)。outputs 为 start 及之后各行的
+           'BBI信号', 'MACD信号', '周度bbi调整仓位', '备注' 数组
+    """
+    params = params or StrategyParams()
+    start = state['start']
+    # 上穿/下穿需要前一周，续算时多取一行，这一行只提供前值、不参与交易
+    lead = 1 if start > 0 else 0
+    window = df_weekly.iloc[start - offset - lead:]
+    week_end = week_end_rows(window[date_column], params.weekly_last_trading_day, params.holiday_policy)
+    tradable = week_end.copy()
+    tradable[:1] = False
+
+    signals = weekly_signal_engine(
+        window['周收盘价'].to_numpy(dtype=float),
+        window['周度BBI'].to_numpy(dtype=float),
+        window['MACD'].to_numpy(dtype=float),
+        tradable,
+        mark_ratio=params.weekly_mark_ratio,
+        warning_weeks=params.weekly_warning_weeks,
+    )
+    signals = {key: value[lead:] for key, value in signals.items()}
+    week_end = week_end[lead:]
+    buy_exec, sell_exec = signals['buy_exec'], signals['sell_exec']
+    if len(buy_exec):
+        buy_exec[0] |= state['pending_buy']
+        sell_exec[0] |= state['pending_sell']
+
+    up_rows = np.flatnonzero(signals['up'])
+    split = int(up_rows[-1]) if len(up_rows) else 0
+    head_adjust, head_action, middle = weekly_position_engine(
+        buy_exec[:split], sell_exec[:split], size=params.weekly_step, total_position=state['total_position'])
+    rest_adjust, rest_action, _ = weekly_position_engine(
+        buy_exec[split:], sell_exec[split:], size=params.weekly_step, total_position=middle)
+    action = np.r_[head_action, rest_action]
+
+    skipped = ~week_end
+    if start == 0:
+        skipped[:1] = False
+    outputs = {
+        'BBI信号': from_codes(np.select([signals['up'], signals['down']], [1, 2], 0), 'BBI信号'),
+        'MACD信号': from_codes(signals['macd_buy'].astype(np.int8), 'MACD信号'),
+        '周度bbi调整仓位': np.r_[head_adjust, rest_adjust],
+        '备注': from_codes(np.select([skipped, action == 1, action == 2], [1, 2, 3], 0), '备注'),
+    }
+    new_state = {'start': start + split, 'total_position': middle,
+                 'pending_buy': bool(buy_exec[split]) if len(buy_exec) else state['pending_buy'],
+                 'pending_sell': bool(sell_exec[split]) if len(sell_exec) else state['pending_sell']}
+    return start, outputs, new_state
+
+
 if __name__ == "__main__":
     # --- 配置区 ---
     inputfile = r"D:\apps\中金项目\7-29-收益率\mian7月31日\main1\main\resource\husen.xlsx"
@@ -0,0 +1,398 @@
+import argparse
+import contextlib
+import io
+import os
+import pickle
+import uuid
+from dataclasses import asdict, replace
+
+import numpy as np
+import pandas as pd
+
+from pcr_bbi_new import load_daily_table, pcr_bbi_initial_state, pcr_bbi_resume
+from xichou_fun import xichou_initial_state, xichou_resume
+from function_new import amplitude_initial_state, amplitude_resume
+from husen_new import load_weekly_table, weekly_initial_state, weekly_resume
+from API import API
+from params import StrategyParams
+from dtypes import CATEGORY_COLUMNS, FIXED_CATEGORIES, categorical
+from indicators import weekly_bars
+from pipeline import run_strategies, export_result, POSITION_COLUMNS
+
+# 检查点格式版本，状态内容变化时加一，旧检查点自动失效
+CHECKPOINT_VERSION = 3
+
+# 冻结前缀的输出分段保存，段数超过该值时合并为一段
+PREFIX_SEGMENTS = 32
+
+
+def load_checkpoint(checkpoint_file):
+    """
+    读取检查点，文件不存在、无法读取或版本不符时返回 None。
+    """
+    if not checkpoint_file or not os.path.exists(checkpoint_file):
+        return None
+    try:
+        with open(checkpoint_file, 'rb') as f:
+            checkpoint = pickle.load(f)
+    except (OSError, pickle.UnpicklingError, EOFError) as e:
+        print(f"警告: 无法读取检查点 '{checkpoint_file}'，将完整重算: {e}")
+        return None
+    if checkpoint.get('version') != CHECKPOINT_VERSION:
+        return None
+    return checkpoint
+
+
+def save_checkpoint(checkpoint_file, checkpoint):
+    """
+    写入检查点：先写临时文件再替换，写入中断不会损坏上一次的检查点。
+    """
+    tmp = f'{checkpoint_file}.tmp'
+    with open(tmp, 'wb') as f:
+        pickle.dump(checkpoint, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp, checkpoint_file)
+
+
+def _digest(frame, columns, start, stop, base=0, offset=0):
+    """
+    在 base 上累加第 start 至 stop 行（columns 列）的摘要，frame 的第一行为第 offset 行。
+    每行的哈希包含行号，摘要为各行哈希之和（模 2**64），前缀延长时只需哈希新增的行。
+    """
+    rows = frame.iloc[start - offset:stop - offset][columns].set_axis(pd.RangeIndex(start, stop))
+    hashes = pd.util.hash_pandas_object(rows, index=True).to_numpy()
+    return (base + int(hashes.sum(dtype=np.uint64))) % 2 ** 64
+
+
+def _first_changed_row(previous, current, columns, offset):
+    """
+    previous 为上一次保存的第 offset 行及之后的数据，返回 current 在 columns 上第一个与之不同的行号；
+    都相同时返回较短一方的行数。缺失值与缺失值视为相同。
+    """
+    rows = max(min(len(previous), len(current) - offset), 0)
+    changed = np.zeros(rows, dtype=bool)
+    for col in columns:
+        old = previous[col].to_numpy()[:rows]
+        new = current[col].to_numpy()[offset:offset + rows]
+        changed |= ~((old == new) | (pd.isna(old) & pd.isna(new)))
+    hits = np.flatnonzero(changed)
+    return offset + (int(hits[0]) if len(hits) else rows)
+
+
+def _changed_rows(checkpoint, daily_df, weekly_df):
+    """
+    返回 (日表, 周表) 中第一个与检查点保存时不同的行号：冻结前缀只比较摘要，之后的行逐项比较。
+    列不同或冻结前缀被修改时返回 None。
+    """
+    changed = []
+    for key, frame in (('daily', daily_df), ('weekly', weekly_df)):
+        columns, frozen = checkpoint['columns'][key], checkpoint['frozen'][key]
+        if set(frame.columns) != set(columns) or len(frame) < frozen \
+                or _digest(frame, columns, 0, frozen) != checkpoint['digest'][key]:
+            return None
+        changed.append(_first_changed_row(checkpoint[key], frame, columns, frozen))
+    return tuple(changed)
+
+
+def _as_categorical(values, column):
+    if isinstance(values, pd.Series):
+        values = values.array
+    return values if isinstance(values, pd.Categorical) else categorical(values, column)
+
+
+def _concat(parts, column):
+    """
+    按行拼接 column 列的若干段取值。分类列只合并各段的编码，不重新比较字符串：
+    取值固定的列直接拼接编码，其他列的类别按拼接后首次出现的顺序排列，类型与完整计算相同。
+    """
+    if column not in CATEGORY_COLUMNS:
+        return np.concatenate([np.asarray(part) for part in parts])
+    parts = [_as_categorical(part, column) for part in parts]
+    if column in FIXED_CATEGORIES:
+        return pd.Categorical.from_codes(np.concatenate([part.codes for part in parts]), FIXED_CATEGORIES[column])
+    categories = pd.Index(np.concatenate([np.asarray(part.categories, dtype=object) for part in parts])).unique()
+    codes = np.concatenate([np.r_[categories.get_indexer(part.categories), -1][part.codes] for part in parts])
+    used = pd.unique(codes[codes >= 0])
+    order = np.full(len(categories) + 1, -1)
+    order[used] = np.arange(len(used))
+    return pd.Categorical.from_codes(order[codes], categories[used])
+
+
+def _tail(previous, column, frozen, start, values):
+    # 上一次保存的 frozen 至 start 行与本次从 start 行开始计算的结果，拼成冻结前缀之后的列
+    parts = [values] if previous is None else [previous[column].iloc[:start - frozen], values]
+    return _concat(parts, column)
+
+
+def resume_tail(daily_df, weekly_df, initial_pos, checkpoint, params, changed=None, offsets=(0, 0)):
+    """
+    resume_strategies 的续算部分：只计算并返回冻结前缀（各策略续算起点中最早一行之前、以后不会再重算的行）之后的行。
+    检查点只保存冻结前缀的摘要以及之后的行和输出；给出 changed 和 offsets 时不再核对冻结前缀，计算量与历史长度无关
+    （逐根行情的流式运行，见 stream.StreamRunner）。
+    检查点为 None、与当前参数或初始仓位不同、或者续算起点之前的数据被修改时，从第一行完整计算。
+
+    参数:
+    daily_df (pd.DataFrame): 规范化后的日表（load_daily_table 的输出），日期严格递增，不会被修改
+    weekly_df (pd.DataFrame): 规范化后的周表，按日期排序，不会被修改
+    initial_pos (float): pcr_bbi 初始仓位
+    checkpoint (dict): 上一次返回的检查点，没有时为 None
+    params (StrategyParams): 策略参数
+    changed (tuple): 调用方已知的 (日表, 周表) 第一个改动的行号，给出时不再比较数据；默认由摘要和保存的行比较得到
+    offsets (tuple): daily_df、weekly_df 第一行在完整表中的行号。不为 0 时两个表只需包含检查点冻结前缀的
+                     最后一行及之后的行，此时必须给出 changed，检查点不可用时抛出 ValueError
+
+    返回:
+    tuple: (日度表第 starts['冻结前缀'] 行及之后的行（输入列和策略列，列顺序与 run_strategies 相同）, 新的检查点,
+            {阶段: 重算起点} 以及新增或修订的行数、沿用的冻结前缀行数)
+    """
+    base, week_base = offsets
+    daily_columns, weekly_columns = list(daily_df.columns), list(weekly_df.columns)
+    rows, week_rows = base + len(daily_df), week_base + len(weekly_df)
+    daily_dates, week_dates = daily_df['日期'].values, weekly_df['日期'].values
+    # 检查点可用的条件：参数和初始仓位相同，且旧数据只在各策略续算起点及之后有改动（追加新行、修订最后几行）
+    resumable = False
+    if checkpoint is not None and checkpoint['params'] == asdict(params) and checkpoint['initial_pos'] == initial_pos:
+        state = checkpoint['state']
+        if changed is None and not base and not week_base:
+            changed = _changed_rows(checkpoint, daily_df, weekly_df)
+        resumable = changed is not None and (
+            changed[0] >= max(state['pcr']['start'], state['xichou']['start'], state['amplitude']['start'])
+            and changed[1] >= state['weekly']['start'])
+        # 冻结前缀之后的周度行须晚于冻结的最后一个日度行，否则修订后的周度行会对齐到冻结的日度行上
+        frozen, week_frozen = checkpoint['frozen']['daily'], checkpoint['frozen']['weekly']
+        if resumable and frozen and week_frozen < week_rows:
+            resumable = week_dates[week_frozen - week_base] > daily_dates[frozen - 1 - base]
+    if resumable:
+        daily_changed, weekly_changed = changed
+        prev_daily, prev_weekly = checkpoint['daily'], checkpoint['weekly']
+        digest = checkpoint['digest']
+    else:
+        if base or week_base:
+            raise ValueError("检查点不可用，需要从第一行开始的完整日表和周表")
+        if checkpoint is not None:
+            print("检查点与当前参数或数据不一致，完整重算")
+        prev_daily = prev_weekly = None
+        daily_changed = frozen = week_frozen = 0
+        digest = {'daily': 0, 'weekly': 0}
+        state = {'pcr': pcr_bbi_initial_state(initial_pos), 'xichou': xichou_initial_state(),
+                 'amplitude': amplitude_initial_state(), 'weekly': weekly_initial_state()}
+
+    # 日度三个策略只写冻结前缀之后的行，按 run_strategies 的顺序写列，列顺序与完整计算相同
+    tail = daily_df.iloc[frozen - base:].copy()
+    pcr_start, outputs, pcr_state = pcr_bbi_resume(daily_df, state['pcr'], params, offset=base)
+    for col, values in outputs.items():
+        tail[col] = _tail(prev_daily, col, frozen, pcr_start, values)
+
+    xichou_start, outputs, xichou_state = xichou_resume(tail, state['xichou'], pcr_state['start'], params,
+                                                        offset=frozen)
+    for col, values in outputs.items():
+        tail[col] = _tail(prev_daily, col, frozen, xichou_start, values)
+
+    amplitude_start, outputs, amplitude_state = amplitude_resume(daily_df, state['amplitude'], params, offset=base)
+    for col in ['星期', '振幅距离预警的日期', '振幅指标调整仓位', '振幅卖出指标', '振幅预警指标', '振幅距离基准的日期',
+                '振幅基准日']:
+        tail[col] = _tail(prev_daily, col, frozen, amplitude_start, outputs[col])
+
+    # 周度策略，同样只保留冻结前缀之后的行
+    weekly_start, outputs, weekly_state = weekly_resume(weekly_df, state['weekly'], params, offset=week_base)
+    week_tail = weekly_df.iloc[week_frozen - week_base:].copy()
+    for col, values in outputs.items():
+        week_tail[col] = _tail(prev_weekly, col, week_frozen, weekly_start, values)
+
+    def daily_row(date):
+        return base + np.searchsorted(daily_dates, date)
+
+    def weekly_row(date, side='left'):
+        return week_base + np.searchsorted(week_dates, date, side=side)
+
+    # 只重新对齐周度结果有变化的日期之后、以及新增的日度行
+    api_start = min(frozen + len(prev_daily), daily_changed) if prev_daily is not None else 0
+    if weekly_start < week_rows:
+        api_start = min(api_start, daily_row(week_dates[weekly_start - week_base]))
+    if prev_weekly is not None and weekly_changed < week_frozen + len(prev_weekly):
+        # 修订的周度行原来的日期也要重新对齐（由日表生成的周表，本周追加交易日后最后一行的日期后移）
+        api_start = min(api_start, daily_row(prev_weekly['日期'].values[weekly_changed - week_frozen]))
+    week_from = weekly_row(daily_dates[api_start - base]) if api_start < rows else week_rows
+    joined = API(tail.iloc[api_start - frozen:][['日期']], week_tail.iloc[week_from - week_frozen:])
+    for col in week_tail.columns:
+        if col != '日期':
+            tail[col] = _tail(prev_daily, col, frozen, api_start, joined[col].to_numpy())
+
+    sum_start = min(xichou_start, amplitude_start, api_start)
+    total = tail[POSITION_COLUMNS].iloc[sum_start - frozen:].sum(axis=1, skipna=True)
+    tail['组合总仓位'] = _tail(prev_daily, '组合总仓位', frozen, sum_start, total.to_numpy())
+
+    # 新的冻结前缀：各策略的续算起点、周度续算起点所在日期之前的行；周表取不晚于冻结日度行最后一个日期的行
+    new_frozen = min(pcr_state['start'], xichou_state['start'], amplitude_state['start'])
+    if weekly_state['start'] < week_rows:
+        new_frozen = min(new_frozen, daily_row(week_dates[weekly_state['start'] - week_base]))
+    new_week_frozen = weekly_state['start']
+    if new_frozen < rows:
+        new_week_frozen = min(new_week_frozen,
+                              weekly_row(daily_dates[new_frozen - 1 - base], 'right') if new_frozen else 0)
+    new_frozen, new_week_frozen = int(new_frozen), int(new_week_frozen)
+
+    starts = {'新增或修订': rows - daily_changed, '冻结前缀': frozen, 'pcr_bbi': pcr_start, '吸筹': xichou_start,
+              '振幅': amplitude_start, '周度': weekly_start, '对齐': api_start, '组合': sum_start}
+    checkpoint = {
+        'version': CHECKPOINT_VERSION,
+        'params': asdict(params),
+        'initial_pos': initial_pos,
+        'columns': {'daily': daily_columns, 'weekly': weekly_columns},
+        'frozen': {'daily': new_frozen, 'weekly': new_week_frozen},
+        'digest': {'daily': _digest(tail, daily_columns, frozen, new_frozen, digest['daily'], offset=frozen),
+                   'weekly': _digest(weekly_df, weekly_columns, week_frozen, new_week_frozen, digest['weekly'],
+                                     offset=week_base)},
+        'daily': tail.iloc[new_frozen - frozen:].copy(),
+        'weekly': week_tail.iloc[new_week_frozen - week_frozen:].copy(),
+        'state': {'pcr': pcr_state, 'xichou': xichou_state, 'amplitude': amplitude_state, 'weekly': weekly_state},
+    }
+    return tail, checkpoint, starts
+
+
+def resume_strategies(daily_df, weekly_df, initial_pos, checkpoint, params, prefix=None):
+    """
+    从检查点续算全部策略（见 resume_tail），再把冻结前缀的输出和续算结果拼成完整的日度表，run_incremental 使用。
+
+    参数:
+    daily_df (pd.DataFrame): 规范化后的日表（load_daily_table 的输出），日期严格递增，会被添加策略列
+    weekly_df (pd.DataFrame): 规范化后的周表，按日期排序，不会被修改
+    initial_pos (float): pcr_bbi 初始仓位
+    checkpoint (dict): 上一次返回的检查点，没有时为 None
+    params (StrategyParams): 策略参数
+    prefix (pd.DataFrame): 上一次结果的前 checkpoint['frozen']['daily'] 行（可以更长），没有时完整计算
+
+    返回:
+    tuple: (与 run_strategies 相同的日度表, 新的检查点, {阶段: 重算起点} 以及新增或修订的行数、沿用的冻结前缀行数)
+    """
+    if checkpoint is not None and (prefix is None or len(prefix) < checkpoint['frozen']['daily']):
+        checkpoint = None
+    tail, checkpoint, starts = resume_tail(daily_df, weekly_df, initial_pos, checkpoint, params)
+    frozen = starts['冻结前缀']
+    df = daily_df
+    for col in tail.columns:
+        if col not in df.columns:
+            df[col] = _concat([prefix[col].iloc[:frozen], tail[col]], col) if frozen else tail[col].array
+    return df, checkpoint, starts
+
+
+def _prefix_dir(checkpoint_file):
+    return f'{checkpoint_file}.prefix'
+
+
+def load_prefix(checkpoint_file, checkpoint):
+    """
+    读取检查点冻结前缀的输出（run_incremental 按段保存在检查点旁的目录中），没有冻结前缀时为空表，读取失败时返回 None。
+    """
+    parts = []
+    try:
+        for _, name in checkpoint.get('segments', []):
+            with open(os.path.join(_prefix_dir(checkpoint_file), name), 'rb') as f:
+                parts.append(pickle.load(f))
+    except (OSError, pickle.UnpicklingError, EOFError) as e:
+        print(f"警告: 无法读取检查点的前缀结果，将完整重算: {e}")
+        return None
+    if not parts:
+        return pd.DataFrame()
+    return pd.DataFrame({col: _concat([part[col] for part in parts], col) for col in parts[0].columns})
+
+
+def save_checkpoint_with_prefix(checkpoint_file, checkpoint, df, segments=(), reused=0):
+    """
+    写入检查点以及新的冻结前缀的输出：上一次的分段（检查点的 'segments'）中沿用的前 reused 行保留，
+    之后新冻结的行追加为一段；完整重算或段数超过 PREFIX_SEGMENTS 时重写为一段。
+    分段文件先于检查点写入，检查点替换后再删除不再引用的分段，写入中断不会损坏上一次的检查点。
+
+    参数:
+    checkpoint_file (str): 检查点文件路径，分段保存在 '<检查点>.prefix' 目录中
+    checkpoint (dict): resume_strategies 返回的新检查点
+    df (pd.DataFrame): resume_strategies 返回的日度表
+    segments (list): 上一次检查点的分段
+    reused (int): 本次沿用的冻结前缀行数（resume_strategies 返回的 '冻结前缀'）
+    """
+    frozen = checkpoint['frozen']['daily']
+    outputs = [col for col in df.columns if col not in checkpoint['columns']['daily']]
+    segments = [segment for segment in segments if segment[0] <= reused]
+    if len(segments) >= PREFIX_SEGMENTS:
+        segments = []
+    start = segments[-1][0] if segments else 0
+    folder = _prefix_dir(checkpoint_file)
+    os.makedirs(folder, exist_ok=True)
+    if frozen > start:
+        name = f'{start:09d}-{frozen:09d}-{uuid.uuid4().hex[:8]}.pkl'
+        with open(os.path.join(folder, name), 'wb') as f:
+            pickle.dump(df.iloc[start:frozen][outputs].reset_index(drop=True), f, protocol=pickle.HIGHEST_PROTOCOL)
+        segments.append((frozen, name))
+    checkpoint['segments'] = segments
+    save_checkpoint(checkpoint_file, checkpoint)
+    used = {name for _, name in segments}
+    for name in os.listdir(folder):
+        if name not in used:
+            os.remove(os.path.join(folder, name))
+
+
+def run_incremental(daily, weekly, initial_pos, checkpoint_file, params=None, verify=False):
+    """
+    增量运行全部策略：读取上一次保存的检查点，各策略只从各自保存的续算起点开始计算，
+    起点之前的行沿用上一次的结果，运行结束后把新的状态写回检查点。
+    追加 N 个新交易日时，策略计算量与 N（加上各策略尚未结束的波段/持仓/行情长度）成正比；
+    检查点只保存冻结前缀的摘要和之后的行，冻结前缀的输出按段追加保存，写入量也与 N 成正比。
+    读取表格、对冻结前缀求摘要以及拼接完整的结果表仍与历史长度成正比（均为整列的向量运算）。
+    只修订了续算起点之后的旧行（例如最后一行盘中数据）时仍然续算；检查点不存在、参数或初始仓位不同、
+    或者续算起点之前的数据被修改时，自动从第一行完整计算。
+
+    参数:
+    daily (str or pd.DataFrame): 日表路径或已读取的日表，日期必须严格递增
+    weekly (str or pd.DataFrame): 周表路径或已读取的周表；为 None 时由日表生成（见 indicators.weekly_bars）
+    initial_pos (float): pcr_bbi 初始仓位
+    checkpoint_file (str): 检查点文件路径
+    params (StrategyParams): 策略参数，默认为 StrategyParams()
+    verify (bool): 为 True 时再用 run_strategies 完整重算一次，结果不一致时抛出 AssertionError
+
+    返回:
+    pd.DataFrame: 与 run_strategies 相同的日度表
+    """
+    params = params or StrategyParams()
+    if not (0 <= initial_pos <= 1.0):
+        raise ValueError(f"初始仓位 ({initial_pos}) 必须在 0 和 1.0 之间")
+
+    daily_df = load_daily_table(daily, pcr_lookback=params.pcr_lookback, pcr_min_periods=params.pcr_min_periods)
+    if weekly is None:
+        params = replace(params, weekly_last_trading_day=True)
+    weekly_df = load_weekly_table(weekly) if weekly is not None or daily_df is None else weekly_bars(daily_df)
+    if daily_df is None or weekly_df is None:
+        raise ValueError("日表或周表读取失败")
+    if not (np.diff(daily_df['日期'].values) > np.timedelta64(0, 'ns')).all():
+        raise ValueError("增量模式要求日表日期严格递增（不能有重复日期）")
+    weekly_df = weekly_df.set_index('日期').sort_index().reset_index()
+
+    previous = load_checkpoint(checkpoint_file)
+    prefix = load_prefix(checkpoint_file, previous) if previous is not None else None
+    df, checkpoint, starts = resume_strategies(daily_df, weekly_df, initial_pos, previous, params, prefix)
+    print(f"增量计算: 新增或修订 {starts['新增或修订']} 行，重算起点 pcr_bbi={starts['pcr_bbi']} 吸筹={starts['吸筹']} "
+          f"振幅={starts['振幅']} 周度={starts['周度']} 对齐={starts['对齐']} 组合={starts['组合']}")
+    save_checkpoint_with_prefix(checkpoint_file, checkpoint, df,
+                                previous.get('segments', []) if previous is not None else [], starts['冻结前缀'])
+
+    if verify:
+        with contextlib.redirect_stdout(io.StringIO()):
+            full = run_strategies(daily, weekly, initial_pos, params)
+        pd.testing.assert_frame_equal(df, full, check_exact=True)
+        print("校验通过：增量结果与完整重算一致")
+
+    return df
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='增量运行全部策略（检查点续算）')
+    parser.add_argument('daily', help='日表文件')
+    parser.add_argument('weekly', nargs='?', default=None, help='周表文件，省略时由日表生成')
+    parser.add_argument('--checkpoint', required=True, help='检查点文件路径')
+    parser.add_argument('--initial-pos', type=float, default=0.7, help='初始仓位，默认 0.7')
+    parser.add_argument('--out', default=None, help='结果 Excel 输出路径')
+    parser.add_argument('--verify', action='store_true', help='与完整重算的结果逐项比较')
+    args = parser.parse_args()
+
+    result = run_incremental(args.daily, args.weekly, args.initial_pos, args.checkpoint, verify=args.verify)
+    if args.out:
+        export_result(result, args.out)
+        print(f"结果已保存到 {args.out}")
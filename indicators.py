@@ -0,0 +1,197 @@
+import numpy as np
+import pandas as pd
+
+from dtypes import as_datetime
+
+# BBI 为这几条收盘价均线的平均
+BBI_WINDOWS = (3, 6, 12, 24)
+# 持仓量PCR百分位的回看交易日数，以及给出百分位所需的最少交易日数
+PCR_LOOKBACK = 250
+PCR_MIN_PERIODS = 20
+
+# MACD 的快线、慢线和信号线周期
+MACD_SPANS = (12, 26, 9)
+
+# 原始行情列和期权持仓量列
+PRICE_COLUMNS = ['最高价', '最低价', '收盘价']
+OPEN_INTEREST_COLUMNS = ['认沽持仓量', '认购持仓量']
+
+
+def moving_average(values, window):
+    """
+    简单移动平均，前 window - 1 行不足一个窗口，为 NaN；窗口内有缺失值时为 NaN。
+    每行依次累加窗口内的 window 个值再除以 window，结果只取决于窗口内的值，逐根行情只计算最后一行时与整列计算完全相同
+    （pandas 的滚动均值增减累计和，每行会带上之前各行的舍入误差）。
+    """
+    values = np.asarray(values, dtype=float)
+    average = np.full(len(values), np.nan)
+    count = len(values) - window + 1
+    if count > 0:
+        total = values[:count].copy()
+        for k in range(1, window):
+            total += values[k:k + count]
+        average[window - 1:] = total / window
+    return average
+
+
+def bbi(close, windows=BBI_WINDOWS):
+    """
+    多空指标 BBI：各条收盘价均线的平均，最长的均线不足一个窗口的行为 NaN。
+
+    参数:
+    close (array-like): 收盘价
+    windows (tuple): 均线的窗口长度
+
+    返回:
+    np.ndarray: BBI
+    """
+    close = np.asarray(close, dtype=float)
+    return np.mean([moving_average(close, window) for window in windows], axis=0)
+
+
+def change_pct(close):
+    """
+    涨跌幅(%) = (收盘价 / 前收盘价 - 1) * 100，第一行没有前收盘价，为 NaN。
+    """
+    close = np.asarray(close, dtype=float)
+    change = np.full(len(close), np.nan)
+    change[1:] = (close[1:] / close[:-1] - 1) * 100
+    return change
+
+
+def amplitude_pct(high, low, close):
+    """
+    振幅(%) = (最高价 - 最低价) / 前收盘价 * 100，第一行没有前收盘价，为 NaN。
+    """
+    high, low, close = (np.asarray(values, dtype=float) for values in (high, low, close))
+    amplitude = np.full(len(close), np.nan)
+    amplitude[1:] = (high[1:] - low[1:]) / close[:-1] * 100
+    return amplitude
+
+
+def put_call_ratio(put_oi, call_oi):
+    """
+    持仓量PCR = 认沽持仓量 / 认购持仓量，认购持仓量为 0 或缺失时为 NaN。
+    """
+    put_oi = np.asarray(put_oi, dtype=float)
+    call_oi = np.asarray(call_oi, dtype=float)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.where(call_oi > 0, put_oi / call_oi, np.nan)
+
+
+def rolling_percentile(values, lookback=PCR_LOOKBACK, min_periods=PCR_MIN_PERIODS):
+    """
+    每行的值在过去 lookback 行（含当天）中的百分位排名：名次 / 窗口内的有效行数，取值 (0, 1]，
+    相同的值取平均名次。滚动排名用有序跳表维护窗口，复杂度为 O(n log lookback)，不逐行排序。
+
+    参数:
+    values (array-like): 序列，缺失值不参与排名，对应的行为 NaN
+    lookback (int): 回看行数
+    min_periods (int): 窗口内有效行数少于该值时为 NaN
+
+    返回:
+    np.ndarray: 百分位
+    """
+    if lookback < 1 or not 1 <= min_periods <= lookback:
+        raise ValueError(f"回看行数 ({lookback}) 必须大于 0，最少行数 ({min_periods}) 必须在 1 到回看行数之间")
+    series = pd.Series(values, dtype=float)
+    return series.rolling(lookback, min_periods=min_periods).rank(pct=True).to_numpy()
+
+
+def macd(close, spans=MACD_SPANS):
+    """
+    MACD 柱 = 2 * (DIF - DEA)：DIF 为快慢两条收盘价 EMA 之差，DEA 为 DIF 的 EMA，EMA 从第一期开始递推。
+
+    参数:
+    close (array-like): 收盘价
+    spans (tuple): 快线、慢线和信号线的周期
+
+    返回:
+    np.ndarray: MACD 柱
+    """
+    fast, slow, signal = spans
+    s = pd.Series(close, dtype=float)
+    dif = s.ewm(span=fast, adjust=False).mean() - s.ewm(span=slow, adjust=False).mean()
+    dea = dif.ewm(span=signal, adjust=False).mean()
+    return (2 * (dif - dea)).to_numpy()
+
+
+def week_last_rows(dates):
+    """
+    按自然周（周一至周日）分组，返回每周最后一个交易日所在的行号。dates 须按日期排序。
+    """
+    days = np.asarray(dates, dtype='datetime64[ns]').astype('datetime64[D]').astype(np.int64)
+    week = (days + 3) // 7  # 1970-01-01 是周四，加 3 后整除 7 得到以周一开始的周序号
+    return np.flatnonzero(np.r_[week[1:] != week[:-1], True]) if len(week) else np.empty(0, dtype=np.int64)
+
+
+def weekly_bars(daily, date_column='日期'):
+    """
+    由日度表生成周度表，代替单独准备的周表：每周取最后一个交易日的收盘价作为周收盘价，
+    日期为该交易日（节假日缩短的周可能是周四或更早），周度BBI 和 MACD 由周收盘价计算。
+    交给 analyze_market_signals_with_position 时需设置 weekly_last_trading_day=True，每行都参与交易。
+
+    参数:
+    daily (pd.DataFrame): 按日期排序的日度表（load_daily_table 的输出），包含日期列和 收盘价 列
+    date_column (str): 日期列名
+
+    返回:
+    pd.DataFrame: 包含 日期、周收盘价、周度BBI、MACD 列，每周一行
+    """
+    dates = as_datetime(daily[date_column]).values
+    last = week_last_rows(dates)
+    close = daily['收盘价'].to_numpy(dtype=float)[last]
+    return pd.DataFrame({
+        date_column: dates[last],
+        '周收盘价': close,
+        '周度BBI': bbi(close),
+        'MACD': macd(close),
+    })
+
+
+def compute_indicators(df, date_column='日期', pcr_lookback=PCR_LOOKBACK, pcr_min_periods=PCR_MIN_PERIODS,
+                       overwrite=False):
+    """
+    由原始行情和期权持仓量计算日度模型需要的指标列，结果可以直接交给 analyze_market_data、xichou 和 function：
+    日度BBI、涨跌幅(%)、振幅(%) 由 最高价/最低价/收盘价 计算，持仓量PCR、持仓量PCR百分位 由 认沽持仓量/认购持仓量 计算。
+    缺少某组原始列时跳过对应的指标；吸筹值等其他列原样保留。
+
+    参数:
+    df (pd.DataFrame): 日度原始数据，包含日期列以及 PRICE_COLUMNS 和/或 OPEN_INTEREST_COLUMNS
+    date_column (str): 日期列名
+    pcr_lookback (int): 持仓量PCR百分位的回看交易日数
+    pcr_min_periods (int): 给出持仓量PCR百分位所需的最少交易日数
+    overwrite (bool): 为 False 时只计算表中没有的指标列，已有的列保持不变
+
+    返回:
+    pd.DataFrame: 按日期排序并添加了指标列的新表，不修改 df
+    """
+    df = df.copy()
+    df[date_column] = pd.to_datetime(df[date_column])
+    df = df.sort_values(by=date_column, kind='stable').reset_index(drop=True)
+
+    def missing(column):
+        return overwrite or column not in df.columns
+
+    if all(col in df.columns for col in PRICE_COLUMNS):
+        close = df['收盘价'].to_numpy(dtype=float)
+        if missing('日度BBI'):
+            df['日度BBI'] = bbi(close)
+        if missing('振幅(%)'):
+            df['振幅(%)'] = amplitude_pct(df['最高价'], df['最低价'], close)
+        if missing('涨跌幅(%)'):
+            df['涨跌幅(%)'] = change_pct(close)
+    if all(col in df.columns for col in OPEN_INTEREST_COLUMNS):
+        if missing('持仓量PCR'):
+            df['持仓量PCR'] = put_call_ratio(df['认沽持仓量'], df['认购持仓量'])
+        if missing('持仓量PCR百分位'):
+            df['持仓量PCR百分位'] = rolling_percentile(df['持仓量PCR'], pcr_lookback, pcr_min_periods)
+    return df
+
+
+def has_raw_columns(df):
+    """
+    判断表中是否有可以计算指标的原始列。
+    """
+    return (all(col in df.columns for col in PRICE_COLUMNS)
+            or all(col in df.columns for col in OPEN_INTEREST_COLUMNS))
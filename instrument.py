@@ -0,0 +1,232 @@
+import contextlib
+import cProfile
+import io
+import json
+import logging
+import os
+import pstats
+import sys
+import threading
+import time
+import tracemalloc
+
+import pandas as pd
+
+# 策略逐笔交易信息使用的日志器名称
+LOGGER_NAME = 'strategy'
+
+
+class _StdoutHandler(logging.StreamHandler):
+    """
+    每次输出时取当前的 sys.stdout，与原来的 print 一样受 contextlib.redirect_stdout 影响，
+    批量回测写入 <标的>.log、增量校验时屏蔽输出等做法不需要修改。
+    """
+
+    def __init__(self):
+        super().__init__(sys.stdout)
+
+    @property
+    def stream(self):
+        return sys.stdout
+
+    @stream.setter
+    def stream(self, value):
+        pass
+
+
+def _create_logger():
+    logger = logging.getLogger(LOGGER_NAME)
+    if not logger.handlers:
+        handler = _StdoutHandler()
+        handler.setFormatter(logging.Formatter('%(message)s'))
+        logger.addHandler(handler)
+        logger.setLevel(logging.INFO)
+        logger.propagate = False
+    return logger
+
+
+# 各策略模块共用的日志器。INFO 为逐笔交易和波段信息，WARNING/ERROR 为数据问题。
+# 逐笔信息的循环都以 logger.isEnabledFor(logging.INFO) 为前提，设为 WARNING 后不再格式化任何交易信息
+logger = _create_logger()
+
+
+def set_log_level(level):
+    """
+    设置策略日志的级别，例如 'WARNING' 关闭逐笔交易信息，'INFO' 恢复默认。
+    """
+    logger.setLevel(level)
+
+
+@contextlib.contextmanager
+def log_level(level):
+    """
+    临时设置策略日志的级别，退出时恢复原级别。
+    """
+    previous = logger.level
+    logger.setLevel(level)
+    try:
+        yield
+    finally:
+        logger.setLevel(previous)
+
+
+class _ThreadLogFilter(logging.Filter):
+    """
+    拦下某个线程的策略日志并按顺序保存，其他线程的日志照常输出。
+    """
+
+    def __init__(self, thread_id):
+        super().__init__()
+        self.thread_id = thread_id
+        self.records = []
+
+    def filter(self, record):
+        if record.thread == self.thread_id:
+            self.records.append(record)
+            return False
+        return True
+
+
+@contextlib.contextmanager
+def captured_logs():
+    """
+    暂存当前线程输出的策略日志，yield 出保存日志记录的列表，之后交给 replay_logs 输出。
+    与日度链并行运行的分支用它把逐笔交易信息推迟到汇合时输出，输出顺序与依次运行时相同。
+    """
+    capture = _ThreadLogFilter(threading.get_ident())
+    logger.addFilter(capture)
+    try:
+        yield capture.records
+    finally:
+        logger.removeFilter(capture)
+
+
+def replay_logs(records):
+    """
+    按原来的顺序输出 captured_logs 暂存的日志记录。
+    """
+    for record in records:
+        logger.handle(record)
+
+
+class RunCancelled(Exception):
+    """
+    运行被 CancelToken 取消时抛出。
+    """
+
+
+class CancelToken:
+    """
+    协作式取消标记：其他线程调用 cancel()，运行中的流水线在阶段之间和导出的逐行循环中调用 check()，
+    已取消时抛出 RunCancelled。
+    """
+
+    def __init__(self):
+        self._event = threading.Event()
+
+    def cancel(self):
+        self._event.set()
+
+    def is_cancelled(self):
+        return self._event.is_set()
+
+    def check(self):
+        if self._event.is_set():
+            raise RunCancelled("运行已取消")
+
+
+class PipelineReport:
+    """
+    流水线各阶段的运行记录：耗时、每秒处理行数、峰值内存和事件数（交易次数等）。
+
+    trace_memory 为 True 时用 tracemalloc 记录每个阶段新分配内存的峰值，否则峰值内存为空；
+    profile 为 True 时用 cProfile 记录各阶段内的函数调用，dump 时另存为 .prof 文件。
+    两者都会明显拖慢运行，只在排查问题时打开。
+
+    on_stage(name) 在每个阶段开始前调用，可用于显示进度；给出 cancel_token 时每个阶段开始前检查是否已取消。
+    """
+
+    def __init__(self, profile=False, trace_memory=False, on_stage=None, cancel_token=None):
+        self.stages = []
+        self.profiler = cProfile.Profile() if profile else None
+        self.trace_memory = trace_memory
+        self.on_stage = on_stage
+        self.cancel_token = cancel_token
+
+    @contextlib.contextmanager
+    def stage(self, name, rows=0):
+        """
+        记录一个阶段。yield 出的记录可以在阶段内补充 '行数' 和 '事件数'。
+        """
+        if self.cancel_token is not None:
+            self.cancel_token.check()
+        if self.on_stage is not None:
+            self.on_stage(name)
+        record = {'阶段': name, '行数': rows, '耗时(秒)': 0.0, '每秒行数': None, '峰值内存(MB)': None, '事件数': None}
+        started_tracing = self.trace_memory and not tracemalloc.is_tracing()
+        if started_tracing:
+            tracemalloc.start()
+        if self.trace_memory:
+            tracemalloc.reset_peak()
+            baseline = tracemalloc.get_traced_memory()[0]
+        if self.profiler is not None:
+            self.profiler.enable()
+        start = time.perf_counter()
+        try:
+            yield record
+        finally:
+            elapsed = time.perf_counter() - start
+            if self.profiler is not None:
+                self.profiler.disable()
+            if self.trace_memory:
+                record['峰值内存(MB)'] = round((tracemalloc.get_traced_memory()[1] - baseline) / 2 ** 20, 3)
+            if started_tracing:
+                tracemalloc.stop()
+            record['耗时(秒)'] = round(elapsed, 6)
+            if record['行数'] and elapsed > 0:
+                record['每秒行数'] = round(record['行数'] / elapsed)
+            self.stages.append(record)
+
+    def to_frame(self):
+        """
+        返回每个阶段一行的 DataFrame。
+        """
+        frame = pd.DataFrame(self.stages, columns=['阶段', '行数', '耗时(秒)', '每秒行数', '峰值内存(MB)', '事件数'])
+        return frame.astype({'每秒行数': 'Int64', '事件数': 'Int64'})
+
+    def format(self):
+        """
+        返回可直接打印的文本报告。
+        """
+        frame = self.to_frame()
+        total = frame['耗时(秒)'].sum()
+        return f"{frame.to_string(index=False)}\n总耗时: {total:.3f} 秒"
+
+    def profile_text(self, sort='cumulative', limit=30):
+        """
+        返回 cProfile 统计中排名靠前的函数，未开启 profile 时返回空字符串。
+        """
+        if self.profiler is None:
+            return ''
+        out = io.StringIO()
+        pstats.Stats(self.profiler, stream=out).sort_stats(sort).print_stats(limit)
+        return out.getvalue()
+
+    def dump(self, output_file):
+        """
+        将报告写成 JSON；开启了 profile 时，同时把调用统计写入同名的 .prof 文件（可用 pstats 或 snakeviz 查看）。
+        """
+        report = {'stages': self.stages, '总耗时(秒)': round(sum(record['耗时(秒)'] for record in self.stages), 6)}
+        with open(output_file, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        if self.profiler is not None:
+            self.profiler.dump_stats(os.path.splitext(output_file)[0] + '.prof')
+
+
+def stage(report, name, rows=0):
+    """
+    report 为 None 时什么都不做（yield None），否则等同于 report.stage(name, rows)。
+    """
+    if report is None:
+        return contextlib.nullcontext()
+    return report.stage(name, rows)
@@ -0,0 +1,372 @@
+import numpy as np
+import pandas as pd
+
+from tradeday import TradingCalendar
+from cross import find_cross_under, add_weekday_column
+from params import StrategyParams
+from pcr_bbi_new import find_pcr_bands, load_daily_table
+from husen_new import load_weekly_table
+from dtypes import categorical, as_datetime
+
+# 原逐行实现（legacy 引擎）：四个策略阶段按改写为数组状态机之前的逐行循环保留，
+# 只把写死的阈值换成 StrategyParams、把执行周五的判断换成 holiday_policy，输出列和类型与快速实现相同。
+# 用于 pipeline 的 engine='legacy' 和 verify 的差异核对，速度慢，不输出逐笔交易信息。
+
+
+def _execution_date(dates, friday, holiday_policy='skip'):
+    """
+    目标周五的执行日期：'skip' 时周五是交易日才执行；'last' 时取该周周一至周五中最后一个交易日。
+    目标周五晚于最后一个日期时尚未确定，与不执行一样返回 None。
+
+    参数:
+    dates (np.ndarray): 全部交易日期（datetime64）
+    friday (pd.Timestamp): 目标周五
+    holiday_policy (str): 'skip' 或 'last'
+
+    返回:
+    pd.Timestamp: 执行日期，不执行时为 None
+    """
+    if friday > dates.max():
+        return None
+    if holiday_policy == 'skip':
+        return friday if friday in dates else None
+    window = dates[(dates >= friday - pd.Timedelta(days=4)) & (dates <= friday)]
+    return pd.Timestamp(window.max()) if len(window) else None
+
+
+def _next_friday(dt, this_week_days):
+    # 下穿/上穿日为 this_week_days 中的星期时为当周周五，其余为下周周五
+    if dt.weekday() in this_week_days:
+        return dt + pd.offsets.Week(weekday=4)
+    return dt + pd.offsets.Week(weekday=4) + pd.offsets.Week(1)
+
+
+def process_trade_signals(df, sell_bands, buy_bands, date_column='日期', holiday_policy='skip'):
+    """
+    逐个波段逐行查找第一个BBI下穿/上穿，返回卖出/买入的执行日期集合。
+    下穿/上穿发生在周一或周二 -> 当周周五，发生在周三至周五 -> 下周周五。
+    """
+    potential_sell_fridays = set()
+    potential_buy_fridays = set()
+    dates = df[date_column].values
+
+    for bands, is_cross, fridays in ((sell_bands, lambda c0, b0, c1, b1: c0 >= b0 and c1 < b1, potential_sell_fridays),
+                                     (buy_bands, lambda c0, b0, c1, b1: c0 < b0 and c1 > b1, potential_buy_fridays)):
+        for band_start_idx, band_end_idx in bands:
+            for i in range(band_start_idx, min(band_end_idx + 1, len(df) - 1)):
+                if is_cross(df.loc[i, '收盘价'], df.loc[i, '日度BBI'], df.loc[i + 1, '收盘价'], df.loc[i + 1, '日度BBI']):
+                    crossover_date_obj = df.loc[i + 1, date_column]
+                    trade_date = _execution_date(dates, _next_friday(crossover_date_obj, (0, 1)), holiday_policy)
+                    if trade_date is not None:
+                        fridays.add(trade_date.date())
+                    break  # 找到第一个交叉信号后，跳出循环
+
+    return potential_sell_fridays, potential_buy_fridays
+
+
+def analyze_market_data(input_file_path, date_column='日期', position=0.0, total_position_limit=1.0, params=None):
+    """
+    PCR_BBI 日度模型的逐行实现，参数和返回值同 pcr_bbi_new.analyze_market_data。
+    """
+    params = params or StrategyParams()
+    if not (0 <= position <= total_position_limit):
+        return pd.DataFrame()
+    df = load_daily_table(input_file_path, date_column, pcr_lookback=params.pcr_lookback,
+                          pcr_min_periods=params.pcr_min_periods)
+    if df is None:
+        return pd.DataFrame()
+
+    df['pcr_bbi仓位调整'] = 0.0
+    df['pcr_bbi总仓位'] = 0.0
+    df['PCR_BBI卖出预警'] = None
+    df['PCR_BBI买入预警'] = None
+
+    # --- 1. 识别PCR卖出和买入波段 ---
+    pcr_sell_condition = (df['持仓量PCR百分位'] > params.pcr_sell_percentile) & (df['持仓量PCR'] > params.pcr_sell_value)
+    pcr_buy_condition = (df['持仓量PCR百分位'] < params.pcr_buy_percentile)
+    sell_bands = _bands(find_pcr_bands(df, pcr_sell_condition, min_consecutive_days=params.pcr_sell_min_days))
+    buy_bands = _bands(find_pcr_bands(df, pcr_buy_condition, min_consecutive_days=params.pcr_buy_min_days))
+
+    sell_labels = [None] * len(df)
+    buy_labels = [None] * len(df)
+    for i, (start_idx, end_idx) in enumerate(sell_bands):
+        sell_labels[start_idx:end_idx + 1] = [f'SellBand_{i + 1}'] * (end_idx - start_idx + 1)
+    for i, (start_idx, end_idx) in enumerate(buy_bands):
+        buy_labels[start_idx:end_idx + 1] = [f'BuyBand_{i + 1}'] * (end_idx - start_idx + 1)
+    df['PCR_BBI卖出预警'] = categorical(sell_labels, 'PCR_BBI卖出预警')
+    df['PCR_BBI买入预警'] = categorical(buy_labels, 'PCR_BBI买入预警')
+
+    # --- 2. BBI交易信号分析 ---
+    potential_sell_fridays, potential_buy_fridays = process_trade_signals(
+        df, sell_bands, buy_bands, date_column, params.holiday_policy)
+
+    # --- 3. 应用周度调整和pcr_bbi总仓位限制，卖出优先 ---
+    final_trade_actions_by_friday = {}
+    for sell_friday in sorted(potential_sell_fridays):
+        final_trade_actions_by_friday[sell_friday] = -params.pcr_step
+    for buy_friday in sorted(potential_buy_fridays):
+        if buy_friday not in final_trade_actions_by_friday:
+            final_trade_actions_by_friday[buy_friday] = params.pcr_step
+
+    adjustments = np.zeros(len(df))
+    totals = np.zeros(len(df))
+    current_position = position
+    for idx in range(len(df)):
+        current_date_in_df = df.loc[idx, date_column].date()
+        if current_date_in_df in final_trade_actions_by_friday:
+            adjustment_value = final_trade_actions_by_friday[current_date_in_df]
+            actual_adjustment = 0
+            if adjustment_value > 0 and current_position < total_position_limit:
+                actual_adjustment = min(adjustment_value, total_position_limit - current_position)
+            elif adjustment_value < 0 and current_position > 0:
+                actual_adjustment = max(adjustment_value, -current_position)
+            adjustments[idx] = actual_adjustment
+            current_position += actual_adjustment
+            current_position = round(current_position, 2)  # 避免浮点数精度问题
+        totals[idx] = current_position
+
+    df['pcr_bbi仓位调整'] = adjustments
+    df['pcr_bbi总仓位'] = totals
+    return df
+
+
+def _bands(found):
+    # find_pcr_bands 返回 (起点, 终点, ...)，转换为 [(start_idx, end_idx), ...]
+    return list(zip(found[0].tolist(), found[1].tolist()))
+
+
+def xichou(df, params=None):
+    """
+    吸筹策略的逐行实现，参数和返回值同 xichou_fun.xichou。
+    """
+    params = params or StrategyParams()
+    df['日期'] = as_datetime(df['日期'])
+    calendar = TradingCalendar.from_frame(df, '日期')
+
+    P, X, sell_flag = 0, 0, 0
+    DATE = None
+    df['卫星吸筹调整仓位'] = 0.0
+    df['吸筹买卖'] = ''
+    df['收益率'] = 0.0
+    df['PCR吸筹总仓位'] = df['pcr_bbi总仓位'].astype(float)
+
+    for idx, row in df.iterrows():
+        xichou_value = row['吸筹值']
+        close = row['收盘价']
+        dt = row['日期']
+
+        # 买入逻辑
+        if xichou_value > params.xichou_threshold and P == 0:
+            if idx < len(df) - 1:
+                P = df.loc[idx + 1, '收盘价']  # 下一日的收盘价作为买入价格
+                X = 1 - df.loc[idx + 1, 'PCR吸筹总仓位']
+                df.loc[idx + 1, '卫星吸筹调整仓位'] = X
+                DATE = dt
+                sell_flag = 0
+                df.loc[idx, 'PCR吸筹总仓位'] = 1
+                df.loc[idx, '吸筹买卖'] = '买入'
+            continue
+
+        # 继承前一天的PCR吸筹总仓位
+        if idx > 0 and not df.loc[idx, '吸筹买卖'] and not df.loc[idx, 'pcr_bbi仓位调整']:
+            df.loc[idx, 'PCR吸筹总仓位'] = df.loc[idx - 1, 'PCR吸筹总仓位']
+        elif df.loc[idx, 'pcr_bbi仓位调整'] and idx > 0 and 0 < df.loc[idx - 1, 'PCR吸筹总仓位'] < 1:
+            df.loc[idx, 'PCR吸筹总仓位'] = df.loc[idx - 1, 'PCR吸筹总仓位'] + df.loc[idx, 'pcr_bbi仓位调整']
+        elif df.loc[idx, 'pcr_bbi仓位调整'] == -0.1 and idx > 0 and df.loc[idx - 1, 'PCR吸筹总仓位'] == 0:
+            df.loc[idx, 'PCR吸筹总仓位'] = 0
+        elif df.loc[idx, 'pcr_bbi仓位调整'] == 0.1 and idx > 0 and df.loc[idx - 1, 'PCR吸筹总仓位'] == 1:
+            df.loc[idx, 'PCR吸筹总仓位'] = 1
+
+        # 卖出逻辑
+        if P != 0 and X > 0:
+            if close >= P * params.xichou_take_profit_full and sell_flag != 2:
+                sell_amount = X
+                df.loc[idx, 'PCR吸筹总仓位'] -= sell_amount
+                X, sell_flag, P = 0, 2, 0
+                df.loc[idx, '吸筹买卖'] = f'卖出{sell_amount}'
+            elif close >= P * params.xichou_take_profit_half and sell_flag == 0:
+                sell_amount = 0.5 * X
+                df.loc[idx, 'PCR吸筹总仓位'] -= sell_amount
+                X -= sell_amount
+                sell_flag = 1
+                df.loc[idx, '吸筹买卖'] = f'卖出{sell_amount}'
+            elif calendar.count_between(DATE, dt) > params.xichou_timeout_days:  # 超时卖出
+                sell_amount = X
+                df.loc[idx, 'PCR吸筹总仓位'] -= sell_amount
+                return_pct = (df.loc[idx, '收盘价'] - P) / P * 100
+                X, sell_flag, P = 0, 2, 0
+                df.loc[idx, '吸筹买卖'] = f'自动止盈或止损{sell_amount}'
+                df.loc[idx, '收益率'] = return_pct
+
+    df['吸筹买卖'] = categorical(df['吸筹买卖'].to_numpy(), '吸筹买卖')
+    return df
+
+
+def function(df, params=None):
+    """
+    振幅预警 + 日度收盘价下穿策略的逐行实现，参数和返回值同 function_new.function。
+    """
+    params = params or StrategyParams()
+    df = add_weekday_column(df)
+    df['日期'] = as_datetime(df['日期'])
+    dates = df['日期'].values
+    calendar = TradingCalendar(dates)
+
+    df['振幅距离预警的日期'] = 0
+    df['振幅指标调整仓位'] = 0.0
+    df['振幅卖出指标'] = 0
+    df['振幅预警指标'] = 0
+    df['振幅距离基准的日期'] = 0
+    is_base = np.zeros(len(df), dtype=bool)  # 原实现在 振幅距离基准的日期 中写 '基准'，这里单独记录
+
+    first_date = df['日期'].iloc[0]  # 第一次观察日期
+    last_date = None  # 预警开始日期
+    obs_cnt = 0
+    flag = 0
+    sell_done = False
+
+    df = find_cross_under(df, '收盘价', '日度BBI')
+
+    for idx, row in df.iterrows():
+        dt = row['日期']
+        amp = row['振幅(%)']
+        drop = row['涨跌幅(%)']
+        cross_down = row['振幅卖出指标']
+
+        df.at[idx, '振幅距离基准的日期'] = calendar.count_between(first_date, dt)
+
+        # ① 触发观察计数
+        if amp > params.amplitude_threshold and drop < 0 and not sell_done:
+            obs_cnt += 1
+            df.at[idx, '振幅预警指标'] = 1
+            if obs_cnt == 1:
+                first_date = dt
+                is_base[idx] = True
+            if obs_cnt == params.amplitude_obs_count:
+                last_date = dt
+                flag = 1
+
+        # ② 预警后未下穿或观察周期结束，清零计数
+        if flag == 1 and last_date is not None:
+            if calendar.count_between(last_date, dt) > params.amplitude_warning_days:
+                last_date, obs_cnt, flag = None, 0, 0
+        if flag == 0 and calendar.count_between(first_date, dt) > params.amplitude_cycle_days:
+            obs_cnt, sell_done = 0, False
+            first_date = dt
+
+        # ③ 预警后下穿，确定卖出日期（周一、周二、周五为当周周五，周三、周四为下周周五）
+        if flag == 1 and not sell_done and calendar.count_between(last_date, dt) < params.amplitude_warning_days:
+            if cross_down == 1:
+                sell_date = _execution_date(dates, _next_friday(dt, (0, 1, 4)), params.holiday_policy)
+                if sell_date is not None:
+                    sell_idx = df[df['日期'] == sell_date].index[0]
+                    df.at[sell_idx, '振幅指标调整仓位'] = -params.amplitude_step
+                    last_date, flag, obs_cnt, sell_done = None, 0, 0, True
+
+        # ④ 更新“振幅距离预警的日期”
+        if last_date is not None and flag == 1:
+            df.at[idx, '振幅距离预警的日期'] = calendar.count_between(last_date, dt)
+
+    df['振幅基准日'] = is_base
+    return df
+
+
+def _week_end(dates, i, params):
+    # 第 i 行是否为该周的交易行：'skip' 为周五；'last' 为该周周一至周五中最后一个交易日，且该周周五不晚于最后一个日期
+    if params.weekly_last_trading_day:
+        return True
+    dt = pd.Timestamp(dates[i])
+    if params.holiday_policy == 'skip':
+        return dt.weekday() == 4
+    if dt.weekday() > 4:
+        return False
+    friday = dt + pd.Timedelta(days=4 - dt.weekday())
+    return friday <= dates.max() and not ((dates > dates[i]) & (dates <= friday)).any()
+
+
+def analyze_market_signals_with_position(input_file_path, date_column='日期', params=None):
+    """
+    周度策略的逐周实现，参数和返回值同 husen_new.analyze_market_signals_with_position。
+    """
+    params = params or StrategyParams()
+    df_weekly = load_weekly_table(input_file_path, date_column)
+    if df_weekly is None:
+        return pd.DataFrame()
+    df_weekly = df_weekly.set_index(date_column).sort_index().reset_index()
+    dates = df_weekly[date_column].values
+    close = df_weekly['周收盘价'].to_numpy(dtype=float)
+    bbi = df_weekly['周度BBI'].to_numpy(dtype=float)
+    macd = df_weekly['MACD'].to_numpy(dtype=float)
+
+    bbi_signal = [''] * len(df_weekly)
+    macd_signal = [''] * len(df_weekly)
+    adjust = np.zeros(len(df_weekly))
+    note = [''] * len(df_weekly)
+
+    buy_mark_price = None
+    buy_warning_triggered = False
+    warning_week_index = -1
+    total_position = 0.0
+    pending_buy = False
+    pending_sell = False
+
+    for i in range(1, len(df_weekly)):
+        if not _week_end(dates, i, params):
+            note[i] = '非周五，跳过交易'
+            continue
+
+        current_close, prev_close = close[i], close[i - 1]
+        current_bbi, prev_bbi = bbi[i], bbi[i - 1]
+        current_macd = macd[i]
+
+        # 信号过期逻辑
+        if buy_warning_triggered and warning_week_index != -1 and (i - warning_week_index) > params.weekly_warning_weeks:
+            buy_mark_price, buy_warning_triggered, warning_week_index = None, False, -1
+            pending_buy = False
+
+        # 处理待执行的买入或卖出（上一周触发的信号）
+        if pending_buy:
+            if total_position < 1.0:
+                adjustment = min(params.weekly_step, 1.0 - total_position)
+                total_position += adjustment
+                adjust[i] = adjustment
+                note[i] = '下一周周五买入'
+            pending_buy = False
+            buy_mark_price, buy_warning_triggered, warning_week_index = None, False, -1
+
+        if pending_sell:
+            if total_position > 0:
+                adjustment = -min(params.weekly_step, total_position)
+                total_position += adjustment
+                adjust[i] = adjustment
+                note[i] = '下一周周五卖出'
+            pending_sell = False
+            buy_mark_price, buy_warning_triggered, warning_week_index = None, False, -1
+
+        # BBI上穿，设置标记价
+        if prev_close < prev_bbi and current_close > current_bbi:
+            bbi_signal[i] = '上穿'
+            buy_mark_price = current_close * params.weekly_mark_ratio
+            buy_warning_triggered, warning_week_index = False, -1
+
+        # 价格达到标记价，触发预警
+        if buy_mark_price is not None and not buy_warning_triggered and current_close >= buy_mark_price:
+            buy_warning_triggered, warning_week_index = True, i
+
+        # 预警后若干周内，检查MACD条件以触发买入（下一周周五执行）
+        if buy_warning_triggered and warning_week_index != -1 and (i - warning_week_index) <= params.weekly_warning_weeks:
+            if current_macd > 0:
+                macd_signal[i] = '满足买入条件'
+                pending_buy = True
+
+        # BBI下穿，触发卖出（下一周周五执行）
+        if prev_close >= prev_bbi and current_close < current_bbi:
+            bbi_signal[i] = '下穿'
+            pending_sell = True
+            buy_mark_price, buy_warning_triggered, warning_week_index = None, False, -1
+
+    df_weekly['BBI信号'] = categorical(bbi_signal, 'BBI信号')
+    df_weekly['MACD信号'] = categorical(macd_signal, 'MACD信号')
+    df_weekly['周度bbi调整仓位'] = adjust
+    df_weekly['备注'] = categorical(note, '备注')
+    return df_weekly
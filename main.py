@@ -1,46 +1,34 @@
-import pandas as pd
-from datetime import timedelta
-import numpy as np
 import os
-from tradeday import count_tradeday as CD
 
-
-from pcr_bbi_new import analyze_market_data 
-from xichou_fun import xichou
-
-from cross import find_cross_under
-from cross import add_weekday_column
-from function_new import function
-
-from API import API
-from husen_new import analyze_market_signals_with_position as hs3
-from sum import sum
-
-from openpyxl import Workbook
-from openpyxl.styles import PatternFill, Font, Alignment
-from openpyxl.utils import get_column_letter
-
-from color import color
+from pipeline import run_strategies, export_result
+from params import StrategyParams
+from instrument import PipelineReport, set_log_level
+from stagecache import CACHE_DIR_NAME
 
 if __name__ == "__main__":
 
     # 替换为你的文件路径
     input_excel_file = r"D:\apps\中金项目\7-29-收益率\mian7月31日\main1\main\resource\resource.xlsx"
-    input_excel_file2 = r"D:\apps\中金项目\7-29-收益率\mian7月31日\main1\main\resource\husen.xlsx"
+    input_excel_file2 = r"D:\apps\中金项目\7-29-收益率\mian7月31日\main1\main\resource\husen.xlsx"  # 设为 None 时由日表生成周表
     output_excel_file = r"D:\apps\中金项目\7-29-收益率\mian7月31日\main1\main\result\result_color.xlsx"
     initial_pos = 0.7
-
-    processed_df = analyze_market_data(input_excel_file, date_column='日期', position=initial_pos)
-    df=xichou(processed_df)
-    df=function(df)
-    
-    week_df=hs3(input_excel_file2)
-    df=API(df,week_df)
-
-    df=sum(df,['吸筹总仓位','振幅指标仓位','周度bbi仓位调整'])
-    styled_df = df.style.apply(color, axis=None)
+    report_file = None  # 设为 .json 路径时保存各阶段耗时报告
+    profile = False  # 为 True 时同时记录 cProfile 调用统计和 tracemalloc 峰值内存（运行会变慢）
+    set_log_level('INFO')  # 'WARNING' 关闭逐笔交易信息
+    # 各阶段结果缓存在输出目录下，只修改某个策略的参数或代码时，其他策略直接读取缓存；设为 None 不缓存
+    cache_dir = os.path.join(os.path.dirname(output_excel_file), CACHE_DIR_NAME)
+    engine = 'fast'  # 'legacy' 使用原逐行实现（慢），用于核对结果，见 verify.py
+    # 日表只有认沽/认购持仓量时，持仓量PCR百分位的回看交易日数和最少交易日数
+    params = StrategyParams(pcr_lookback=250, pcr_min_periods=20)
+
+    report = PipelineReport(profile=profile, trace_memory=profile)
+    df = run_strategies(input_excel_file, input_excel_file2, initial_pos, params, report=report, cache_dir=cache_dir,
+                        engine=engine)
 
     # 保存到 Excel（颜色可能需要特定库支持，如 openpyxl）
-    styled_df.to_excel(output_excel_file , engine='openpyxl', index=False)
+    export_result(df, output_excel_file, columns=None, report=report)
 
     print("已生成带颜色的 Excel 文件：styled_output.xlsx")
+    print(report.format())
+    if report_file:
+        report.dump(report_file)
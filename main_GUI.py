@@ -1,56 +1,94 @@
-import pandas as pd
-from datetime import timedelta
-import numpy as np
 import os
-from tradeday import count_tradeday as CD
+import sys
+import itertools
+from collections import deque
 
-from pcr_bbi_new import analyze_market_data 
-from xichou_fun import xichou
+from pipeline import run_strategies, export_result, EXPORT_COLUMNS, PROGRESS_STAGES
+from params import StrategyParams
+from instrument import PipelineReport, CancelToken, RunCancelled
+from stagecache import CACHE_DIR_NAME
 
-from cross import find_cross_under
-from cross import add_weekday_column
-from function_new import function
+from PyQt5.QtCore import QThread, pyqtSignal
+from PyQt5.QtWidgets import QApplication, QMainWindow, QLabel, QLineEdit, QPushButton, QFileDialog, QMessageBox, QListWidget, QListWidgetItem
 
-from API import API
-from husen_new import analyze_market_signals_with_position as hs3
-from sum import sum
+def main(input_excel_file,input_excel_file2,output_excel_file,initial_pos,report_file=None,profile=False,use_cache=True,
+         on_stage=None,cancel_token=None,params=None):
+    """
+    运行全部策略并导出结果，返回各阶段的运行记录（instrument.PipelineReport）。
+    params 为策略参数（StrategyParams），默认为 StrategyParams()。
+    report_file 给出时把记录写成 JSON；profile 为 True 时同时记录 cProfile 调用统计和 tracemalloc 峰值内存。
+    use_cache 为 True 时各阶段结果缓存在输出目录下的 __stagecache__ 中，输入、参数和代码都没变的阶段不再重算。
+    on_stage(name) 在每个阶段开始前调用；cancel_token 被取消后在下一个检查点抛出 RunCancelled。
+    """
+    report = PipelineReport(profile=profile, trace_memory=profile, on_stage=on_stage, cancel_token=cancel_token)
+    cache_dir = os.path.join(os.path.dirname(os.path.abspath(output_excel_file)), CACHE_DIR_NAME) if use_cache else None
+    df = run_strategies(input_excel_file, input_excel_file2, initial_pos, params, report=report, cache_dir=cache_dir)
 
-import argparse
+    # 保存到 Excel（颜色可能需要特定库支持，如 openpyxl）
+    export_result(df, output_excel_file, EXPORT_COLUMNS, report=report)
 
-from PyQt5.QtWidgets import QApplication, QMainWindow, QLabel, QLineEdit, QPushButton, QFileDialog, QMessageBox
-import sys
-import os
+    print(report.format())
+    if report_file:
+        report.dump(report_file)
+    return report
 
-from color import color
-
-def main(input_excel_file,input_excel_file2,output_excel_file,initial_pos):
-    
-    processed_df = analyze_market_data(input_excel_file, date_column='日期', position=initial_pos)
-    df=xichou(processed_df)
-    df=function(df)
-    
-    week_df=hs3(input_excel_file2)
-    df=API(df,week_df)
-
-    df=sum(df,['PCR吸筹总仓位','振幅指标调整仓位','周度bbi调整仓位'])
-    
-    
-    df_new = df[["日期",'持仓量PCR百分位', '持仓量PCR', '吸筹值', '振幅(%)', '涨跌幅(%)',"pcr_bbi总仓位","PCR_BBI卖出预警","卫星吸筹调整仓位",'收益率',"PCR吸筹总仓位","振幅距离预警的日期","振幅指标调整仓位","振幅卖出指标","周度bbi调整仓位","备注","组合总仓位"]]
-
-    styled_df = df_new.style.apply(color, axis=None)
-    
-    
-    # 保存到 Excel（颜色可能需要特定库支持，如 openpyxl）
-    styled_df.to_excel(output_excel_file , engine='openpyxl', index=False)
 
 
+class PipelineWorker(QThread):
+    """
+    在后台线程中运行一次 main()，通过信号报告阶段进度和结果，界面线程不会被阻塞。
+    cancel() 之后，运行在下一个阶段开始前或导出的下一批行处停止。
+    """
+    stage_started = pyqtSignal(int, str, int)  # 运行编号, 阶段名, 第几个阶段（从 1 开始）
+    succeeded = pyqtSignal(int, str)  # 运行编号, 输出文件
+    failed = pyqtSignal(int, str)  # 运行编号, 错误信息
+    cancelled = pyqtSignal(int)  # 运行编号
+
+    def __init__(self, run_id, input_excel_file, input_excel_file2, output_excel_file, initial_pos, params=None,
+                 parent=None):
+        super().__init__(parent)
+        self.run_id = run_id
+        self.args = (input_excel_file, input_excel_file2, output_excel_file, initial_pos)
+        self.params = params
+        self.cancel_token = CancelToken()
+        self.stage_counter = itertools.count(1)  # 周度分支在另一个线程中报告阶段，计数要线程安全
+
+    def cancel(self):
+        self.cancel_token.cancel()
+
+    def _on_stage(self, name):
+        self.stage_started.emit(self.run_id, name, next(self.stage_counter))
+
+    def run(self):
+        try:
+            main(*self.args, on_stage=self._on_stage, cancel_token=self.cancel_token, params=self.params)
+        except RunCancelled:
+            self.cancelled.emit(self.run_id)
+        except Exception as e:
+            self.failed.emit(self.run_id, f'{type(e).__name__}: {e}')
+        else:
+            self.succeeded.emit(self.run_id, self.args[2])
+
+
+def output_file_for(output_path, initial_pos, count):
+    """
+    一次提交多个初始仓位时，在输出文件名后加上初始仓位，避免互相覆盖。
+    """
+    if count == 1:
+        return output_path
+    root, ext = os.path.splitext(output_path)
+    return f'{root}_{initial_pos:g}{ext}'
+
 
 #这一整个部分都是GUI
 class MainWindow(QMainWindow):
+    # 同时运行的任务数，其余任务排队
+    MAX_CONCURRENT_RUNS = 2
+
     def __init__(self):
         super().__init__()
         self.setWindowTitle("参数输入 GUI")
-        self.setGeometry(100, 100, 500, 400)
+        self.setGeometry(100, 100, 500, 440)
 
         # 输入文件路径 1
         self.label1 = QLabel("日表文件:", self)
@@ -66,6 +104,7 @@ class MainWindow(QMainWindow):
         self.label2.move(20, 60)
         self.input2 = QLineEdit(self)
         self.input2.setGeometry(120, 60, 300, 30)
+        self.input2.setPlaceholderText("可选，留空时由日表生成")
         self.browse_btn2 = QPushButton("浏览", self)
         self.browse_btn2.setGeometry(430, 60, 60, 30)
         self.browse_btn2.clicked.connect(self.browse_input2)
@@ -84,13 +123,36 @@ class MainWindow(QMainWindow):
         self.label4.move(20, 140)
         self.float_input = QLineEdit(self)  # 修改变量名
         self.float_input.setGeometry(120, 140, 300, 30)
-        self.float_input.setPlaceholderText("请输入一个初始仓位（例如 3.14）")  # 更新提示
+        self.float_input.setPlaceholderText("请输入初始仓位，多个用逗号分隔（例如 0.5, 0.7）")  # 更新提示
+
+        # 持仓量PCR百分位窗口：日表只有认沽/认购持仓量时计算百分位使用
+        self.label5 = QLabel("PCR百分位窗口:", self)
+        self.label5.move(20, 180)
+        self.pcr_window_input = QLineEdit(self)
+        self.pcr_window_input.setGeometry(120, 180, 300, 30)
+        self.pcr_window_input.setPlaceholderText(
+            f"可选，回看天数,最少天数（默认 {StrategyParams.pcr_lookback}, {StrategyParams.pcr_min_periods}）")
 
         # 运行按钮
         self.run_btn = QPushButton("运行", self)
-        self.run_btn.setGeometry(120, 200, 100, 40)
+        self.run_btn.setGeometry(120, 240, 100, 40)
         self.run_btn.clicked.connect(self.run_script)
 
+        # 取消按钮：取消选中的任务，没有选中时取消全部任务
+        self.cancel_btn = QPushButton("取消", self)
+        self.cancel_btn.setGeometry(240, 240, 100, 40)
+        self.cancel_btn.clicked.connect(self.cancel_runs)
+
+        # 任务列表：每个任务一行，显示当前阶段或结果
+        self.run_list = QListWidget(self)
+        self.run_list.setGeometry(20, 295, 470, 130)
+        self.run_list.setSelectionMode(QListWidget.ExtendedSelection)
+
+        self.next_run_id = 1
+        self.pending = deque()  # 排队中的任务 (运行编号, 日表, 周表, 输出文件, 初始仓位, 策略参数)
+        self.workers = {}  # 运行中的任务 {运行编号: PipelineWorker}
+        self.items = {}  # {运行编号: (QListWidgetItem, 初始仓位)}
+
     def browse_input1(self):
         file_path, _ = QFileDialog.getOpenFileName(self, "选择日表文件", "", "All Files (*);;Text Files (*.txt);;CSV Files (*.csv)")
         if file_path:
@@ -108,25 +170,106 @@ class MainWindow(QMainWindow):
 
     def run_script(self):
         input1_path = self.input1.text()
-        input2_path = self.input2.text()
+        input2_path = self.input2.text() or None  # 周表留空时由日表生成
         output_path = self.output.text()
         float_param_text = self.float_input.text()  # 修改变量名
 
         # 验证所有输入
-        if not input1_path or not input2_path or not output_path or not float_param_text:
-            QMessageBox.critical(self, "错误", "请填写所有输入文件路径、输出文件路径和初始仓位参数！")
+        if not input1_path or not output_path or not float_param_text:
+            QMessageBox.critical(self, "错误", "请填写日表文件路径、输出文件路径和初始仓位参数！")
             return
 
-        # 验证初始仓位输入
+        # 验证初始仓位输入，多个初始仓位各排队运行一次
         try:
-            float_param = float(float_param_text)
+            float_params = [float(text) for text in float_param_text.replace('，', ',').split(',') if text.strip()]
         except ValueError:
-            QMessageBox.critical(self, "错误", "初始仓位参数必须是一个有效的数字（例如 3.14）！")
+            QMessageBox.critical(self, "错误", "初始仓位参数必须是有效的数字，多个用逗号分隔（例如 0.5, 0.7）！")
+            return
+        if not float_params:
+            QMessageBox.critical(self, "错误", "请填写日表文件路径、输出文件路径和初始仓位参数！")
             return
 
-        result = main(input1_path, input2_path, output_path, float_param)
-        
-        QMessageBox.information(self, "成功", f"处理完成，结果已保存到 {output_path}")
+        # 验证PCR百分位窗口，留空时使用默认值
+        window_text = self.pcr_window_input.text().replace('，', ',')
+        params = StrategyParams()
+        if window_text.strip():
+            try:
+                lookback, min_periods = (int(text) for text in window_text.split(','))
+            except ValueError:
+                QMessageBox.critical(self, "错误", "PCR百分位窗口必须是两个整数，用逗号分隔（例如 250, 20）！")
+                return
+            if lookback < 1 or not 1 <= min_periods <= lookback:
+                QMessageBox.critical(self, "错误", "PCR百分位窗口的最少天数必须在 1 到回看天数之间！")
+                return
+            params = StrategyParams(pcr_lookback=lookback, pcr_min_periods=min_periods)
+
+        for float_param in float_params:
+            run_id = self.next_run_id
+            self.next_run_id += 1
+            item = QListWidgetItem()
+            self.run_list.addItem(item)
+            self.items[run_id] = (item, float_param)
+            self.pending.append((run_id, input1_path, input2_path,
+                                 output_file_for(output_path, float_param, len(float_params)), float_param, params))
+            self.set_status(run_id, "排队中")
+        self.start_pending()
+
+    def set_status(self, run_id, text):
+        item, float_param = self.items[run_id]
+        item.setText(f"#{run_id} 初始仓位 {float_param:g}：{text}")
+
+    def start_pending(self):
+        # 按提交顺序启动排队的任务，同时运行的任务数不超过 MAX_CONCURRENT_RUNS
+        while self.pending and len(self.workers) < self.MAX_CONCURRENT_RUNS:
+            run_id, input1_path, input2_path, output_path, float_param, params = self.pending.popleft()
+            worker = PipelineWorker(run_id, input1_path, input2_path, output_path, float_param, params, self)
+            worker.stage_started.connect(self.on_stage_started)
+            worker.succeeded.connect(self.on_succeeded)
+            worker.failed.connect(self.on_failed)
+            worker.cancelled.connect(self.on_cancelled)
+            worker.finished.connect(lambda run_id=run_id: self.on_worker_finished(run_id))
+            self.workers[run_id] = worker
+            self.set_status(run_id, "启动中")
+            worker.start()
+
+    def on_stage_started(self, run_id, name, index):
+        self.set_status(run_id, f"{name}（{index}/{len(PROGRESS_STAGES)}）")
+
+    def on_succeeded(self, run_id, output_path):
+        self.set_status(run_id, f"处理完成，结果已保存到 {output_path}")
+
+    def on_failed(self, run_id, error):
+        self.set_status(run_id, f"失败：{error}")
+
+    def on_cancelled(self, run_id):
+        self.set_status(run_id, "已取消")
+
+    def on_worker_finished(self, run_id):
+        worker = self.workers.pop(run_id, None)
+        if worker is not None:
+            worker.deleteLater()
+        self.start_pending()
+
+    def cancel_runs(self):
+        selected = {run_id for run_id, (item, _) in self.items.items() if item.isSelected()}
+        targets = selected or set(self.items)
+        # 排队中的任务直接移出队列，运行中的任务发出取消请求
+        for entry in [entry for entry in self.pending if entry[0] in targets]:
+            self.pending.remove(entry)
+            self.set_status(entry[0], "已取消")
+        for run_id, worker in self.workers.items():
+            if run_id in targets:
+                worker.cancel()
+                self.set_status(run_id, "正在取消…")
+
+    def closeEvent(self, event):
+        # 关闭窗口时取消全部任务，并等待后台线程结束
+        self.pending.clear()
+        for worker in self.workers.values():
+            worker.cancel()
+        for worker in list(self.workers.values()):
+            worker.wait()
+        super().closeEvent(event)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,69 @@
+from dataclasses import dataclass, fields, replace
+import itertools
+
+from indicators import PCR_LOOKBACK, PCR_MIN_PERIODS
+
+
+@dataclass(frozen=True)
+class StrategyParams:
+    """
+    全部策略阈值。默认值与原来写死在各策略函数中的数值一致。
+    """
+    # 执行周五不是交易日时：'skip' 不执行，'last' 改在该周周五之前的最后一个交易日执行（见 tradeday.FridayResolver）
+    holiday_policy: str = 'skip'
+
+    # PCR_BBI 日度模型
+    pcr_sell_percentile: float = 0.9  # 卖出波段：持仓量PCR百分位 > 该值
+    pcr_sell_value: float = 1.0  # 卖出波段：持仓量PCR > 该值
+    pcr_buy_percentile: float = 0.15  # 买入波段：持仓量PCR百分位 < 该值
+    pcr_sell_min_days: int = 3  # 卖出波段最少连续天数
+    pcr_buy_min_days: int = 1  # 买入波段最少连续天数
+    pcr_step: float = 0.10  # 单次加减仓幅度
+    pcr_lookback: int = PCR_LOOKBACK  # 由认沽/认购持仓量计算持仓量PCR百分位时的回看交易日数
+    pcr_min_periods: int = PCR_MIN_PERIODS  # 给出持仓量PCR百分位所需的最少交易日数
+
+    # 吸筹模型
+    xichou_threshold: float = 80  # 吸筹值 > 该值买入
+    xichou_take_profit_half: float = 1.08  # 达到买入价的该倍数卖出一半
+    xichou_take_profit_full: float = 1.1  # 达到买入价的该倍数全部卖出
+    xichou_timeout_days: int = 60  # 超过该交易日数自动止盈或止损
+
+    # 振幅模型
+    amplitude_threshold: float = 2.5  # 振幅(%) > 该值且下跌计一次观察
+    amplitude_obs_count: int = 3  # 观察次数达到该值触发预警
+    amplitude_warning_days: int = 30  # 预警后该交易日数内下穿才卖出
+    amplitude_cycle_days: int = 60  # 观察周期交易日数
+    amplitude_step: float = 0.15  # 卖出幅度
+
+    # 周度模型
+    weekly_mark_ratio: float = 1.05  # 上穿后标记价 = 周收盘价 * 该值
+    weekly_warning_weeks: int = 5  # 预警后该周数内满足MACD条件才买入
+    weekly_step: float = 0.15  # 单次加减仓幅度
+    weekly_last_trading_day: bool = False  # 周表日期为每周最后一个交易日（由日表生成）时为 True，不再跳过非周五的行
+
+
+def expand_grid(grid, base=None):
+    """
+    将参数网格展开为参数组合列表。
+
+    参数:
+    grid (dict): {参数名: 取值列表}，参数名为 StrategyParams 的字段名；
+                 也可以包含 'initial_pos'，表示初始仓位的取值列表
+    base (StrategyParams): 网格之外的参数取值，默认为 StrategyParams()
+
+    返回:
+    list: [(StrategyParams, initial_pos or None), ...]，按网格的笛卡尔积顺序排列
+    """
+    base = base or StrategyParams()
+    names = {f.name for f in fields(StrategyParams)} | {'initial_pos'}
+    unknown = set(grid) - names
+    if unknown:
+        raise ValueError(f"未知的参数: {sorted(unknown)}")
+
+    keys = list(grid)
+    combos = []
+    for values in itertools.product(*(grid[k] for k in keys)):
+        setting = dict(zip(keys, values))
+        initial_pos = setting.pop('initial_pos', None)
+        combos.append((replace(base, **setting), initial_pos))
+    return combos
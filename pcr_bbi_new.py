@@ -2,108 +2,358 @@ import pandas as pd
 import numpy as np
 import pandas as pd
 import os  # 导入os模块，用于文件路径操作
+import logging
+from params import StrategyParams
+from tablecache import cached_table
+from instrument import logger
+from indicators import compute_indicators, has_raw_columns, PCR_LOOKBACK, PCR_MIN_PERIODS
+from tradeday import FridayResolver
+from dtypes import as_datetime
 from openpyxl import Workbook
 from openpyxl.styles import PatternFill, Font, Alignment
 from openpyxl.utils import get_column_letter
 
 
-def process_trade_signals(df, sell_bands, buy_bands, date_column='日期'):
+def bbi_crossing_rows(close, bbi):
+    """
+    一次性找出收盘价与日度BBI的全部交叉位置。
+    - 下穿：第 i 天收盘价 >= BBI，第 i+1 天收盘价 < BBI
+    - 上穿：第 i 天收盘价 < BBI，第 i+1 天收盘价 > BBI
+
+    参数:
+    close (array-like): 收盘价
+    bbi (array-like): 日度BBI
+
+    返回:
+    tuple: (down_rows, up_rows)，交叉前一天的行号数组（已排序）
+    """
+    close = np.asarray(close, dtype=float)
+    bbi = np.asarray(bbi, dtype=float)
+    down_rows = np.flatnonzero((close[:-1] >= bbi[:-1]) & (close[1:] < bbi[1:]))
+    up_rows = np.flatnonzero((close[:-1] < bbi[:-1]) & (close[1:] > bbi[1:]))
+    return down_rows, up_rows
+
+
+def first_crossing_in_bands(crossing_rows, bands):
+    """
+    用 searchsorted 为每个波段找到区间内的第一个交叉位置。
+
+    参数:
+    crossing_rows (np.ndarray): bbi_crossing_rows 返回的交叉行号数组
+    bands: 波段的起始和结束索引 [(start_idx, end_idx), ...]
+
+    返回:
+    np.ndarray: 每个波段第一个交叉的行号，区间内没有交叉时为 -1
+    """
+    bands = np.asarray(list(bands), dtype=np.int64).reshape(-1, 2)
+    pos = np.searchsorted(crossing_rows, bands[:, 0], side='left')
+    candidate = np.r_[crossing_rows, np.iinfo(np.int64).max][pos]
+    return np.where(candidate <= bands[:, 1], candidate, -1)
+
+
+# 交叉后的执行周五：交叉日为周一至周日时分别在第几周的周五执行（0 为当周）。
+# 周一、周二为当周周五，周三、周四为下周周五；周五与 dt + Week(weekday=4) + Week(1) 一致，为两周后的周五
+EXECUTION_WEEKS = (0, 0, 1, 1, 2, 2, 2)
+
+
+def process_trade_signals(df, sell_bands, buy_bands, date_column='日期', holiday_policy='skip'):
     """
     处理买卖信号，根据BBI下穿/上穿确定卖出/买入000852.SH。
     规则：
     - 下穿/上穿发生在周一或周二 -> 当周周五卖出/买入
     - 下穿/上穿发生在周三、周四或周五 -> 下周周五卖出/买入
+    全部交叉位置只计算一次，每个波段的第一个交叉用 searchsorted 定位，
+    执行行由 FridayResolver 查找表一次得到（执行周五不是交易日时按 holiday_policy 处理）。
     参数：
     - df: DataFrame，包含000852.SH、收盘价、日度BBI等列
     - sell_bands: 卖出波段的起始和结束索引列表 [(start_idx, end_idx), ...]
     - buy_bands: 买入波段的起始和结束索引列表 [(start_idx, end_idx), ...]
     - date_column: 000852.SH列名，默认为'日期'
+    - holiday_policy: 执行周五不是交易日时的处理，'skip' 或 'last'
     返回：
     - potential_sell_fridays: 卖出000852.SH集合
     - potential_buy_fridays: 买入000852.SH集合
     """
-    potential_sell_fridays = set()
-    potential_buy_fridays = set()
-
     # 确保000852.SH列为 datetime 类型
-    df[date_column] = pd.to_datetime(df[date_column])
-
-    # 处理卖出波段：查找每个波段后的第一个BBI下穿信号
-    for band_start_idx, band_end_idx in sell_bands:
-        for i in range(band_start_idx, min(band_end_idx + 1, len(df) - 1)):
-            # 检查BBI下穿：当前收盘价 >= BBI，下一交易日收盘价 < BBI
-            if df.loc[i, '收盘价'] >= df.loc[i, '日度BBI'] and df.loc[i + 1, '收盘价'] < df.loc[i + 1, '日度BBI']:
-                crossover_date_obj = df.loc[i + 1, date_column]  # 下穿发生000852.SH
-                crossover_weekday = crossover_date_obj.weekday()  # 0=周一, 4=周五
-
-                # 根据星期确定卖出000852.SH
-                if crossover_weekday in [0, 1]:  # 周一或周二
-                    sell_date = crossover_date_obj + pd.offsets.Week(weekday=4)  # 当周周五
-                else:  # 周三、周四、周五
-                    sell_date = crossover_date_obj + pd.offsets.Week(weekday=4) + pd.offsets.Week(1)  # 下周周五
-
-                # 确保卖出000852.SH在数据范围内
-                if sell_date in df[date_column].values:
-                    potential_sell_fridays.add(sell_date.date())
-                break  # 找到第一个下穿信号后，跳出循环
-
-    # 处理买入波段：查找每个波段后的第一个BBI上穿信号
-    for band_start_idx, band_end_idx in buy_bands:
-        for i in range(band_start_idx, min(band_end_idx + 1, len(df) - 1)):
-            # 检查BBI上穿：当前收盘价 < BBI，下一交易日收盘价 > BBI
-            if df.loc[i, '收盘价'] < df.loc[i, '日度BBI'] and df.loc[i + 1, '收盘价'] > df.loc[i + 1, '日度BBI']:
-                crossover_date_obj = df.loc[i + 1, date_column]  # 上穿发生000852.SH
-                crossover_weekday = crossover_date_obj.weekday()  # 0=周一, 4=周五
-
-                # 根据星期确定买入000852.SH
-                if crossover_weekday in [0, 1]:  # 周一或周二
-                    buy_date = crossover_date_obj + pd.offsets.Week(weekday=4)  # 当周周五
-                else:  # 周三、周四、周五
-                    buy_date = crossover_date_obj + pd.offsets.Week(weekday=4) + pd.offsets.Week(1)  # 下周周五
-
-                # 确保买入000852.SH在数据范围内
-                if buy_date in df[date_column].values:
-                    potential_buy_fridays.add(buy_date.date())
-                break  # 找到第一个上穿信号后，跳出循环
+    df[date_column] = as_datetime(df[date_column])
+    dates = df[date_column].values
+    resolver = FridayResolver(dates, holiday_policy)
 
-    return potential_sell_fridays, potential_buy_fridays
+    down_rows, up_rows = bbi_crossing_rows(df['收盘价'], df['日度BBI'])
+
+    def fridays_for(crossing_rows, bands):
+        first = first_crossing_in_bands(crossing_rows, bands)
+        first = first[first >= 0]
+        # 执行行不在数据中（或执行周五不是交易日且规则为 'skip'）时为 -1
+        rows = resolver.rows(EXECUTION_WEEKS, at=first + 1)
+        return set(pd.DatetimeIndex(dates[rows[rows >= 0]]).date)
 
+    potential_sell_fridays = fridays_for(down_rows, sell_bands)
+    potential_buy_fridays = fridays_for(up_rows, buy_bands)
 
+    return potential_sell_fridays, potential_buy_fridays
 
 
 def find_pcr_bands(df, pcr_condition_series, min_consecutive_days=3):
     """
     识别DataFrame中满足特定PCR条件的连续交易日波段。
     一个波段必须至少包含 min_consecutive_days 个连续交易日满足条件。
+    对条件数组做游程编码（diff/flatnonzero），不逐行扫描。
 
     参数:
-    df (pd.DataFrame): 完整的DataFrame。
-    pcr_condition_series (pd.Series): 布尔Series，表示每天是否满足PCR条件。
-    min_consecutive_days (int): 构成有效波段所需的最小连续天数。
+    df (pd.DataFrame): 完整的DataFrame（仅用于核对行数，可传 None）。
+    pcr_condition_series (pd.Series or np.ndarray): 布尔序列，表示每天是否满足PCR条件；
+        也可以是 (行数, 条件组数) 的二维布尔矩阵，一次识别多组阈值的波段。
+    min_consecutive_days (int or array-like): 构成有效波段所需的最小连续天数，二维时可按列给出。
 
     返回:
-    list: 包含 (start_idx, end_idx) 元组的列表，表示每个识别到的波段的起始和结束索引。
+    tuple: (starts, ends, lengths, band_id)
+        starts/ends/lengths: 每个波段的起始索引、结束索引（含）和长度数组；二维输入时为按列的数组列表。
+        band_id: 每行所属波段的编号（从1开始，不在波段内为0），形状与输入相同。
+    """
+    condition = np.asarray(pcr_condition_series, dtype=bool)
+    if df is not None and len(condition) != len(df):
+        raise ValueError("PCR条件的长度与DataFrame行数不一致")
+    matrix = condition[:, None] if condition.ndim == 1 else condition
+    n, k = matrix.shape
+
+    # 每列首尾各补一个 False 后按列展平，列与列之间不会连成一个波段
+    padded = np.zeros((n + 2, k), dtype=np.int8)
+    padded[1:-1] = matrix
+    edges = np.diff(padded.ravel(order='F'))
+    starts = np.flatnonzero(edges == 1) + 1
+    ends = np.flatnonzero(edges == -1)  # 展平后最后一个满足条件的位置
+    columns = starts // (n + 2)
+    lengths = ends - starts + 1
+
+    # 检查识别到的波段长度是否满足最小连续天数要求
+    min_days = np.broadcast_to(np.asarray(min_consecutive_days), (k,))
+    keep = lengths >= min_days[columns]
+    starts, ends, lengths, columns = starts[keep], ends[keep], lengths[keep], columns[keep]
+
+    # 波段编号：列内从1开始计数，在起点 +id、终点后一位 -id 后累加展开到每一行
+    first_of_column = np.searchsorted(columns, np.arange(k), side='left')
+    numbers = np.arange(len(starts)) - first_of_column[columns] + 1
+    marks = np.zeros(k * (n + 2) + 1, dtype=np.int64)
+    np.add.at(marks, starts, numbers)
+    np.add.at(marks, ends + 1, -numbers)
+    band_id = np.cumsum(marks)[:-1].reshape((n + 2, k), order='F')[1:-1]
+
+    # 展平位置换回行号
+    starts = starts - columns * (n + 2) - 1
+    ends = ends - columns * (n + 2) - 1
+    if condition.ndim == 1:
+        return starts, ends, lengths, band_id[:, 0]
+    splits = first_of_column[1:]
+    return np.split(starts, splits), np.split(ends, splits), np.split(lengths, splits), band_id
+
+
+def band_labels(band_id, prefix):
     """
-    bands = []  # 存储识别到的所有波段的起始和结束索引
-    i = 0  # 初始化循环变量，用于遍历DataFrame的每一行
-    while i < len(df):  # 遍历所有数据
-        if pcr_condition_series.iloc[i]:  # 如果当前交易日满足PCR条件
-            band_start_idx = i  # 记录波段的起始索引
-            j = i  # 初始化内部循环变量
-            while j < len(df) and pcr_condition_series.iloc[j]:
-                j += 1  # 向后查找，直到条件不满足或数据结束
-            band_end_idx = j - 1  # 波段的结束索引是最后一个满足条件的000852.SH
-
-            # 检查识别到的波段长度是否满足最小连续天数要求
-            if (band_end_idx - band_start_idx + 1) >= min_consecutive_days:
-                bands.append((band_start_idx, band_end_idx))  # 将有效波段添加到列表中
-            i = j  # 将主循环的索引移动到当前波段结束的下一个位置，继续查找新波段
+    将波段编号数组一次性转换为分类类型的波段标签（如 'SellBand_1'），不在波段内的行为缺失值。
+    类别只包含出现的波段，按编号排列；波段按行依次编号，与按首次出现排列的顺序相同。
+
+    参数:
+    band_id (np.ndarray): find_pcr_bands 返回的每行波段编号
+    prefix (str): 标签前缀，如 'SellBand_'、'BuyBand_'
+
+    返回:
+    pd.Categorical: 标签
+    """
+    present = np.unique(band_id[band_id > 0])
+    codes = np.where(band_id > 0, np.searchsorted(present, band_id), -1)
+    return pd.Categorical.from_codes(codes, [f'{prefix}{i}' for i in present])
+
+
+def trade_actions_to_rows(dates, trade_actions_by_date):
+    """
+    将按日期记录的仓位调整（{date: 调整值}）映射到行号。同一日期出现在多行时，每行都会执行。
+
+    参数:
+    dates (array-like): 日期序列
+    trade_actions_by_date (dict): {datetime.date: 调整值}
+
+    返回:
+    tuple: (trade_rows, trade_adjust)，按行号排序的执行行和对应的调整值
+    """
+    trade_days = np.array(sorted(trade_actions_by_date), dtype='datetime64[D]')
+    trade_values = np.array([trade_actions_by_date[d] for d in sorted(trade_actions_by_date)], dtype=float)
+    row_days = pd.to_datetime(np.asarray(dates)).values.astype('datetime64[D]')
+    if not len(trade_days):
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=float)
+    pos = np.minimum(np.searchsorted(trade_days, row_days), len(trade_days) - 1)
+    hit = trade_days[pos] == row_days
+    return np.flatnonzero(hit), trade_values[pos[hit]]
+
+
+def pcr_position_engine(trade_rows, trade_adjust, n_rows, position=0.0, total_position_limit=1.0):
+    """
+    pcr_bbi仓位递推：只在执行行上按 [0, total_position_limit] 截断累加（每次保留两位小数），
+    其余行的总仓位由执行行的结果一次性向前填充。
+
+    参数:
+    trade_rows (np.ndarray): 执行行号（升序）
+    trade_adjust (np.ndarray): 每个执行行的目标调整值（+0.10 加仓 / -0.10 减仓）
+    n_rows (int): 总行数
+    position (float or array-like): 初始仓位；传入数组时一次计算每个初始仓位的仓位路径
+    total_position_limit (float): pcr_bbi总仓位的上限，默认为1.0
+
+    返回:
+    tuple: (pcr_bbi仓位调整, pcr_bbi总仓位)。初始仓位为标量时形状为 (n_rows,)，
+           为数组时形状为 (n_rows, len(position))，每列对应一个初始仓位
+    """
+    initial = np.atleast_1d(np.asarray(position, dtype=float))
+    adjustments = np.zeros((n_rows, len(initial)), dtype=float)
+    event_totals = np.empty((len(trade_rows), len(initial)), dtype=float)
+
+    current_position = initial.copy()
+    for k, (idx, adjustment_value) in enumerate(zip(trade_rows, trade_adjust)):
+        if adjustment_value > 0:  # 尝试加仓，确保不超过上限
+            actual_adjustment = np.where(current_position < total_position_limit,
+                                         np.minimum(adjustment_value, total_position_limit - current_position), 0)
+        elif adjustment_value < 0:  # 尝试减仓，确保不低于0
+            actual_adjustment = np.where(current_position > 0, np.maximum(adjustment_value, -current_position), 0)
         else:
-            i += 1  # 如果当前交易日不满足条件，则检查下一个
-    return bands  # 返回所有识别到的波段
+            actual_adjustment = np.zeros_like(current_position)
+        adjustments[idx] = actual_adjustment
+        # 逐元素使用内置 round，与逐行实现的舍入结果完全一致
+        current_position = np.array([round(p, 2) for p in (current_position + actual_adjustment).tolist()])
+        event_totals[k] = current_position
+
+    # 每行取不晚于它的最后一个执行行的总仓位，之前的行为初始仓位
+    last_event = np.zeros(n_rows + 1, dtype=np.int64)
+    np.add.at(last_event, np.asarray(trade_rows, dtype=np.int64) + 1, 1)
+    last_event = np.cumsum(last_event)[1:]
+    totals = np.vstack([initial, event_totals])[last_event]
 
+    if np.ndim(position) == 0:
+        return adjustments[:, 0], totals[:, 0]
+    return adjustments, totals
 
-def analyze_market_data(input_file_path, date_column='日期', position=0.0, total_position_limit=1.0):
+
+def log_bands(df, sell_bands, buy_bands, date_column='日期'):
+    """
+    输出识别到的PCR卖出/买入波段（INFO 级别）。
+    """
+    if sell_bands:
+        logger.info("--- 已识别到以下PCR卖出波段 ---")
+        for i, (start_idx, end_idx) in enumerate(sell_bands):
+            logger.info(
+                f"波段 {i + 1}: 从 {df.loc[start_idx, date_column].strftime('%Y-%m-%d')} 到 {df.loc[end_idx, date_column].strftime('%Y-%m-%d')}")
+    else:
+        logger.info("没有找到满足条件的PCR卖出波段。")
+
+    if buy_bands:
+        logger.info("\n--- 已识别到以下PCR买入波段 ---")
+        for i, (start_idx, end_idx) in enumerate(buy_bands):
+            logger.info(
+                f"波段 {i + 1}: 从 {df.loc[start_idx, date_column].strftime('%Y-%m-%d')} 到 {df.loc[end_idx, date_column].strftime('%Y-%m-%d')}")
+    else:
+        logger.info("没有找到满足条件的PCR买入波段。")
+
+
+def log_trades(df, trade_rows, trade_adjust, adjustments, totals, position, date_column='日期'):
+    """
+    输出最终执行的加减仓操作，以及因仓位上下限被跳过的操作（INFO 级别）。
+    """
+    sell_signals_for_print = []
+    buy_signals_for_print = []
+    skipped_signals_for_print = []
+    for idx, adjustment_value in zip(trade_rows, trade_adjust):
+        current_date_in_df = df.loc[idx, date_column].date()
+        actual_adjustment = adjustments[idx]
+        if actual_adjustment > 0:
+            buy_signals_for_print.append({
+                '操作000852.SH': current_date_in_df.strftime('%Y-%m-%d'),
+                '类型': '加仓',
+                '调整幅度': actual_adjustment
+            })
+        elif actual_adjustment < 0:
+            sell_signals_for_print.append({
+                '操作000852.SH': current_date_in_df.strftime('%Y-%m-%d'),
+                '类型': '减仓',
+                '调整幅度': actual_adjustment
+            })
+        elif adjustment_value > 0:
+            position_before = totals[idx - 1] if idx > 0 else position
+            skipped_signals_for_print.append(
+                f"跳过操作: 000852.SH {current_date_in_df.strftime('%Y-%m-%d')}，尝试加仓但pcr_bbi总仓位已达上限 {position_before:.0%}")
+        elif adjustment_value < 0:
+            skipped_signals_for_print.append(
+                f"跳过操作: 000852.SH {current_date_in_df.strftime('%Y-%m-%d')}，尝试减仓但pcr_bbi总仓位已为0")
+
+    if sell_signals_for_print:
+        logger.info("\n--- 已识别到以下最终卖出操作 ---")
+        for signal in sell_signals_for_print:
+            logger.info(
+                f"操作000852.SH: {signal['操作000852.SH']}, 类型: {signal['类型']}, 调整幅度: {signal['调整幅度'] * 100:.0f}%")
+
+    if buy_signals_for_print:
+        logger.info("\n--- 已识别到以下最终买入操作 ---")
+        for signal in buy_signals_for_print:
+            logger.info(
+                f"操作000852.SH: {signal['操作000852.SH']}, 类型: {signal['类型']}, 调整幅度: {signal['调整幅度'] * 100:.0f}%")
+
+    if skipped_signals_for_print:
+        logger.info("\n--- 以下操作因pcr_bbi总仓位限制被跳过或调整 ---")
+        for note in skipped_signals_for_print:
+            logger.info(note)
+
+    if not sell_signals_for_print and not buy_signals_for_print and not skipped_signals_for_print:
+        logger.info("\n在此期间没有执行任何pcr_bbi仓位调整操作。")
+
+
+def load_daily_table(input_file_path, date_column='日期', use_cache=True, pcr_lookback=PCR_LOOKBACK,
+                     pcr_min_periods=PCR_MIN_PERIODS):
+    """
+    读取并规范化日度表：按扩展名读取 Excel/CSV，去掉持仓量PCR中的'%'，由原始行情和期权持仓量计算缺少的指标列
+    （见 indicators.compute_indicators），检查必要列，转换日期并排序。
+
+    参数:
+    input_file_path (str or pd.DataFrame): 输入Excel/CSV文件的路径，或已读取的日度表（不会被修改）。
+    date_column (str): 日期列名，默认为'日期'。
+    use_cache (bool): 为 True 时通过 tablecache 缓存规范化后的表，文件未变化时不再解析 Excel/CSV。
+    pcr_lookback (int): 由持仓量计算持仓量PCR百分位时的回看交易日数，表中已有该列时不使用。
+    pcr_min_periods (int): 由持仓量计算持仓量PCR百分位时所需的最少交易日数。
+
+    返回:
+    pd.DataFrame: 规范化后的日度表；文件类型不支持或缺少必要列时打印错误并返回 None。
+    """
+    if use_cache and not isinstance(input_file_path, pd.DataFrame) and os.path.isfile(input_file_path):
+        return cached_table(input_file_path, f'daily|{date_column}|{pcr_lookback}|{pcr_min_periods}',
+                            lambda path: load_daily_table(path, date_column, False, pcr_lookback, pcr_min_periods))
+
+    # 根据文件扩展名确定文件类型并读取
+    file_extension = '' if isinstance(input_file_path, pd.DataFrame) else os.path.splitext(input_file_path)[1].lower()
+    if isinstance(input_file_path, pd.DataFrame):
+        df = input_file_path.copy()
+    elif file_extension == '.xlsx':
+        df = pd.read_excel(input_file_path)
+    elif file_extension == '.csv':
+        df = pd.read_csv(input_file_path)
+    else:
+        logger.error(f"错误: 不支持的文件类型 '{file_extension}'。请提供 .xlsx 或 .csv 文件。")
+        return None
+
+    if '持仓量PCR' in df.columns and not pd.api.types.is_numeric_dtype(df['持仓量PCR']):
+        df['持仓量PCR'] = df['持仓量PCR'].astype(str).str.replace('%', '', regex=False).astype(float)
+    # 表中只有原始行情（最高价/最低价/收盘价）或期权持仓量（认沽持仓量/认购持仓量）时，先计算缺少的指标列
+    if date_column in df.columns and has_raw_columns(df):
+        df = compute_indicators(df, date_column, pcr_lookback, pcr_min_periods)
+
+    required_columns = [date_column, '持仓量PCR百分位', '持仓量PCR', '收盘价', '日度BBI']
+    for col in required_columns:
+        if col not in df.columns:
+            logger.error(f"错误: 输入文件中缺少必要的列 '{col}'。请检查列名。")
+            return None
+
+    df[date_column] = as_datetime(df[date_column])
+    df = df.sort_values(by=date_column).reset_index(drop=True)
+    df['持仓量PCR'] = df['持仓量PCR'].astype(float)
+    return df
+
+
+def analyze_market_data(input_file_path, date_column='日期', position=0.0, total_position_limit=1.0, params=None):
     """
     分析Excel/CSV文件中的市场数据，包括：
     1. 找出连续满足特定PCR卖出条件（持仓量PCR百分位 > 0.9 且 持仓量PCR > 1.0）的波段（至少3天）。
@@ -118,41 +368,28 @@ def analyze_market_data(input_file_path, date_column='日期', position=0.0, tot
     7. 新增规则：pcr_bbi总仓位上限为1.0（100%），下限为0。
 
     参数:
-    input_file_path (str): 输入Excel/CSV文件的路径。
+    input_file_path (str or pd.DataFrame): 输入Excel/CSV文件的路径，或已读取的日度表。
     date_column (str): Excel/CSV文件中表示000852.SH的列名，默认为'日期'。
     position (float): 初始仓位，必须在0到1之间。
     total_position_limit (float): pcr_bbi总仓位的上限，默认为1.0。
+    params (StrategyParams): 策略参数（波段阈值、加减仓幅度），默认为 StrategyParams()。
 
     返回:
     pd.DataFrame: 包含原始数据、新增的'pcr_bbi仓位调整'、'pcr_bbi总仓位'、'PCR_BBI卖出预警'和'PCR_BBI买入预警'列的DataFrame。
                   如果发生错误，则返回空的DataFrame。
     """
+    params = params or StrategyParams()
     try:
         # 验证初始仓位是否在有效范围内
         if not (0 <= position <= total_position_limit):
-            print(f"错误: 初始仓位 ({position}) 必须在 0 和 {total_position_limit} 之间。")
+            logger.error(f"错误: 初始仓位 ({position}) 必须在 0 和 {total_position_limit} 之间。")
             return pd.DataFrame()
 
-        # 根据文件扩展名确定文件类型并读取
-        file_extension = os.path.splitext(input_file_path)[1].lower()
-        if file_extension == '.xlsx':
-            df = pd.read_excel(input_file_path)
-        elif file_extension == '.csv':
-            df = pd.read_csv(input_file_path)
-        else:
-            print(f"错误: 不支持的文件类型 '{file_extension}'。请提供 .xlsx 或 .csv 文件。")
+        df = load_daily_table(input_file_path, date_column, pcr_lookback=params.pcr_lookback,
+                              pcr_min_periods=params.pcr_min_periods)
+        if df is None:
             return pd.DataFrame()
 
-        required_columns = [date_column, '持仓量PCR百分位', '持仓量PCR', '收盘价', '日度BBI']
-        for col in required_columns:
-            if col not in df.columns:
-                print(f"错误: 输入文件中缺少必要的列 '{col}'。请检查列名。")
-                return pd.DataFrame()
-
-        df[date_column] = pd.to_datetime(df[date_column])
-        df = df.sort_values(by=date_column).reset_index(drop=True)
-        df['持仓量PCR'] = df['持仓量PCR'].astype(str).str.replace('%', '', regex=False).astype(float)
-
         # --- 初始化新增列 ---
         df['pcr_bbi仓位调整'] = 0.0
         df['pcr_bbi总仓位'] = 0.0  # 临时初始化，后续会填充
@@ -161,125 +398,171 @@ def analyze_market_data(input_file_path, date_column='日期', position=0.0, tot
 
 
         # --- 1. 识别PCR卖出和买入波段 ---
-        pcr_sell_condition = (df['持仓量PCR百分位'] > 0.9) & (df['持仓量PCR'] > 1.0)
-        pcr_buy_condition = (df['持仓量PCR百分位'] < 0.15)
-        sell_bands = find_pcr_bands(df, pcr_sell_condition, min_consecutive_days=3)
-        buy_bands = find_pcr_bands(df, pcr_buy_condition, min_consecutive_days=1)
-
-        # 在DataFrame中标记卖出波段ID
-        for i, (start_idx, end_idx) in enumerate(sell_bands):
-            df.loc[start_idx:end_idx, 'PCR_BBI卖出预警'] = f'SellBand_{i + 1}'
-        # 在DataFrame中标记买入波段ID
-        for i, (start_idx, end_idx) in enumerate(buy_bands):
-            df.loc[start_idx:end_idx, 'PCR_BBI买入预警'] = f'BuyBand_{i + 1}'
+        pcr_sell_condition = (df['持仓量PCR百分位'] > params.pcr_sell_percentile) & (df['持仓量PCR'] > params.pcr_sell_value)
+        pcr_buy_condition = (df['持仓量PCR百分位'] < params.pcr_buy_percentile)
+        sell_starts, sell_ends, _, sell_band_id = find_pcr_bands(df, pcr_sell_condition, min_consecutive_days=params.pcr_sell_min_days)
+        buy_starts, buy_ends, _, buy_band_id = find_pcr_bands(df, pcr_buy_condition, min_consecutive_days=params.pcr_buy_min_days)
+        sell_bands = list(zip(sell_starts.tolist(), sell_ends.tolist()))
+        buy_bands = list(zip(buy_starts.tolist(), buy_ends.tolist()))
 
-        if sell_bands:
-            print("--- 已识别到以下PCR卖出波段 ---")
-            for i, (start_idx, end_idx) in enumerate(sell_bands):
-                print(
-                    f"波段 {i + 1}: 从 {df.loc[start_idx, date_column].strftime('%Y-%m-%d')} 到 {df.loc[end_idx, date_column].strftime('%Y-%m-%d')}")
-        else:
-            print("没有找到满足条件的PCR卖出波段。")
+        # 在DataFrame中标记卖出/买入波段ID
+        df['PCR_BBI卖出预警'] = band_labels(sell_band_id, 'SellBand_')
+        df['PCR_BBI买入预警'] = band_labels(buy_band_id, 'BuyBand_')
 
-        if buy_bands:
-            print("\n--- 已识别到以下PCR买入波段 ---")
-            for i, (start_idx, end_idx) in enumerate(buy_bands):
-                print(
-                    f"波段 {i + 1}: 从 {df.loc[start_idx, date_column].strftime('%Y-%m-%d')} 到 {df.loc[end_idx, date_column].strftime('%Y-%m-%d')}")
-        else:
-            print("没有找到满足条件的PCR买入波段。")
+        if logger.isEnabledFor(logging.INFO):
+            log_bands(df, sell_bands, buy_bands, date_column)
 
         # --- 2. BBI交易信号分析 ---
         potential_sell_fridays = set()
         potential_buy_fridays = set()
-        potential_sell_fridays, potential_buy_fridays=process_trade_signals(df, sell_bands, buy_bands, date_column='日期')
+        potential_sell_fridays, potential_buy_fridays=process_trade_signals(df, sell_bands, buy_bands, date_column='日期',
+                                                                         holiday_policy=params.holiday_policy)
 
         # --- 3. 应用周度调整和pcr_bbi总仓位限制 ---
         final_trade_actions_by_friday = {}
         # 优先处理卖出信号
         for sell_friday in sorted(list(potential_sell_fridays)):
-            final_trade_actions_by_friday[sell_friday] = -0.10
+            final_trade_actions_by_friday[sell_friday] = -params.pcr_step
         # 再处理买入信号
         for buy_friday in sorted(list(potential_buy_fridays)):
             if buy_friday not in final_trade_actions_by_friday:
-                final_trade_actions_by_friday[buy_friday] = 0.10
-
-        sell_signals_for_print = []
-        buy_signals_for_print = []
-        skipped_signals_for_print = []
-
-        current_position = position  # 使用传入的初始仓位
-        for idx in range(len(df)):
-            current_date_in_df = df.loc[idx, date_column].date()
-
-            if current_date_in_df in final_trade_actions_by_friday:
-                adjustment_value = final_trade_actions_by_friday[current_date_in_df]
-                actual_adjustment = 0
-
-                if adjustment_value > 0:  # 尝试加仓
-                    if current_position < total_position_limit:
-                        # 计算实际可加仓位，确保不超过上限
-                        actual_adjustment = min(adjustment_value, total_position_limit - current_position)
-                        buy_signals_for_print.append({
-                            '操作000852.SH': current_date_in_df.strftime('%Y-%m-%d'),
-                            '类型': '加仓',
-                            '调整幅度': actual_adjustment
-                        })
-                    else:
-                        skipped_signals_for_print.append(
-                            f"跳过操作: 000852.SH {current_date_in_df.strftime('%Y-%m-%d')}，尝试加仓但pcr_bbi总仓位已达上限 {current_position:.0%}")
-
-                elif adjustment_value < 0:  # 尝试减仓
-                    if current_position > 0:
-                        # 计算实际可减仓位，确保不低于0
-                        actual_adjustment = max(adjustment_value, -current_position)
-                        sell_signals_for_print.append({
-                            '操作000852.SH': current_date_in_df.strftime('%Y-%m-%d'),
-                            '类型': '减仓',
-                            '调整幅度': actual_adjustment
-                        })
-                    else:
-                        skipped_signals_for_print.append(
-                            f"跳过操作: 000852.SH {current_date_in_df.strftime('%Y-%m-%d')}，尝试减仓但pcr_bbi总仓位已为0")
-
-                # 更新pcr_bbi仓位调整列和pcr_bbi总仓位
-                df.loc[idx, 'pcr_bbi仓位调整'] = actual_adjustment
-                current_position += actual_adjustment
-                current_position = round(current_position, 2)  # 避免浮点数精度问题
-
-            # 记录每一天的pcr_bbi总仓位
-            df.loc[idx, 'pcr_bbi总仓位'] = current_position
-
-        if sell_signals_for_print:
-            print("\n--- 已识别到以下最终卖出操作 ---")
-            for signal in sell_signals_for_print:
-                print(
-                    f"操作000852.SH: {signal['操作000852.SH']}, 类型: {signal['类型']}, 调整幅度: {signal['调整幅度'] * 100:.0f}%")
-
-        if buy_signals_for_print:
-            print("\n--- 已识别到以下最终买入操作 ---")
-            for signal in buy_signals_for_print:
-                print(
-                    f"操作000852.SH: {signal['操作000852.SH']}, 类型: {signal['类型']}, 调整幅度: {signal['调整幅度'] * 100:.0f}%")
-
-        if skipped_signals_for_print:
-            print("\n--- 以下操作因pcr_bbi总仓位限制被跳过或调整 ---")
-            for note in skipped_signals_for_print:
-                print(note)
-
-        if not sell_signals_for_print and not buy_signals_for_print and not skipped_signals_for_print:
-            print("\n在此期间没有执行任何pcr_bbi仓位调整操作。")
+                final_trade_actions_by_friday[buy_friday] = params.pcr_step
+
+        # 交易周五映射到行号，只在这些行上递推仓位
+        trade_rows, trade_adjust = trade_actions_to_rows(df[date_column], final_trade_actions_by_friday)
+        adjustments, totals = pcr_position_engine(trade_rows, trade_adjust, len(df), position, total_position_limit)
+        df['pcr_bbi仓位调整'] = adjustments
+        df['pcr_bbi总仓位'] = totals
+
+        if logger.isEnabledFor(logging.INFO):
+            log_trades(df, trade_rows, trade_adjust, adjustments, totals, position, date_column)
 
         return df
 
     except FileNotFoundError:
-        print(f"错误: 文件未找到，请检查路径: {input_file_path}")
+        logger.error(f"错误: 文件未找到，请检查路径: {input_file_path}")
         return pd.DataFrame()
     except Exception as e:
-        print(f"发生错误: {e}")
+        logger.error(f"发生错误: {e}")
         return pd.DataFrame()
 
 
+def pcr_bbi_initial_state(position=0.0):
+    """
+    pcr_bbi_resume 从第一行开始计算时使用的状态。
+    """
+    empty = np.empty(0, dtype='datetime64[ns]')
+    return {'start': 0, 'position': float(position), 'sell_count': 0, 'buy_count': 0,
+            'pending_sell': empty, 'pending_buy': empty}
+
+
+def pcr_bbi_resume(df, state, params=None, total_position_limit=1.0, date_column='日期', offset=0):
+    """
+    检查点续算：从 state['start'] 行开始识别PCR波段、生成交易信号并递推仓位，之前的行沿用上一次的结果。
+    起点取数据末尾仍在延续的条件游程的第一行（没有时为末尾之后）：之前的波段都已结束，
+    它们的编号数量、以及执行日期不早于起点的候选交易日期（卖出/买入分别保存，合并时仍然卖出优先）
+    保存在状态中，起点之前一行的pcr_bbi总仓位即起点的初始仓位。
+
+    参数:
+    df (pd.DataFrame): 规范化后的完整日度表（load_daily_table 的输出），日期严格递增
+    state (dict): 上一次返回的状态，首次计算使用 pcr_bbi_initial_state(初始仓位)
+    params (StrategyParams): 策略参数，默认为 StrategyParams()
+    total_position_limit (float): pcr_bbi总仓位的上限，默认为1.0
+    date_column (str): 日期列名，默认为'日期'
+    offset (int): df 第一行在完整日度表中的行号，df 只需包含 state['start'] 及之后的行
+
+    返回:
+    tuple: (start, outputs, new_state)。outputs 为 start 及之后各行的
+           'pcr_bbi仓位调整', 'pcr_bbi总仓位', 'PCR_BBI卖出预警', 'PCR_BBI买入预警' 数组
+    """
+    params = params or StrategyParams()
+    start = state['start']
+    tail = df.iloc[start - offset:]
+    n = len(tail)
+    dates = tail[date_column].values.astype('datetime64[ns]')
+
+    percentile = tail['持仓量PCR百分位'].to_numpy(dtype=float)
+    pcr = tail['持仓量PCR'].to_numpy(dtype=float)
+    sell_condition = (percentile > params.pcr_sell_percentile) & (pcr > params.pcr_sell_value)
+    buy_condition = percentile < params.pcr_buy_percentile
+    sell_starts, sell_ends, _, sell_band_id = find_pcr_bands(None, sell_condition, params.pcr_sell_min_days)
+    buy_starts, buy_ends, _, buy_band_id = find_pcr_bands(None, buy_condition, params.pcr_buy_min_days)
+
+    # 候选执行周五：每个波段第一个交叉对应的目标周五，执行行由查找表确定
+    down_rows, up_rows = bbi_crossing_rows(tail['收盘价'], tail['日度BBI'])
+    resolver = FridayResolver(dates, params.holiday_policy)
+
+    def candidates(crossing_rows, starts, ends):
+        first = first_crossing_in_bands(crossing_rows, np.column_stack([starts, ends]))
+        found = first >= 0
+        return resolver.target_fridays(EXECUTION_WEEKS, at=first[found] + 1), starts[found]
+
+    def executed(fridays):
+        rows = resolver.rows_for_fridays(fridays)
+        return pd.DatetimeIndex(dates[rows[rows >= 0]]).date
+
+    sell_dates, sell_from = candidates(down_rows, sell_starts, sell_ends)
+    buy_dates, buy_from = candidates(up_rows, buy_starts, buy_ends)
+    all_sell = np.unique(np.r_[state['pending_sell'], sell_dates])
+    all_buy = np.unique(np.r_[state['pending_buy'], buy_dates])
+
+    # 与 analyze_market_data 相同：只保留执行行在数据中的交易，同一日期卖出优先
+    final_trade_actions_by_friday = {}
+    for sell_friday in executed(all_sell):
+        final_trade_actions_by_friday[sell_friday] = -params.pcr_step
+    for buy_friday in executed(all_buy):
+        if buy_friday not in final_trade_actions_by_friday:
+            final_trade_actions_by_friday[buy_friday] = params.pcr_step
+    trade_rows, trade_adjust = trade_actions_to_rows(dates, final_trade_actions_by_friday)
+    adjustments, totals = pcr_position_engine(trade_rows, trade_adjust, n, state['position'], total_position_limit)
+
+    outputs = {
+        'pcr_bbi仓位调整': adjustments,
+        'pcr_bbi总仓位': totals,
+        'PCR_BBI卖出预警': band_labels(np.where(sell_band_id > 0, sell_band_id + state['sell_count'], 0), 'SellBand_'),
+        'PCR_BBI买入预警': band_labels(np.where(buy_band_id > 0, buy_band_id + state['buy_count'], 0), 'BuyBand_'),
+    }
+
+    # 起点只能放在游程之间：前后两行既不在同一个卖出游程中，也不在同一个买入游程中
+    inside = (sell_condition[:-1] & sell_condition[1:]) | (buy_condition[:-1] & buy_condition[1:])
+    boundaries = np.r_[0, np.flatnonzero(~inside) + 1, n]
+
+    def boundary_before(row):
+        return int(boundaries[np.searchsorted(boundaries, row, side='right') - 1])
+
+    # 下一次的起点：末尾仍在延续的卖出、买入游程中较早的第一行。卖出、买入阈值可以重叠，
+    # 两种游程可能同时延续或交错，取不晚于该行的最后一个游程边界
+    split = n
+    for condition in (sell_condition, buy_condition):
+        if n and condition[-1]:
+            breaks = np.flatnonzero(~condition)
+            split = min(split, int(breaks[-1]) + 1 if len(breaks) else 0)
+    split = boundary_before(split)
+    unresolved = np.r_[all_sell, all_buy]
+    unresolved = unresolved[unresolved > dates[-1]] if n else unresolved[:0]
+    if params.holiday_policy == 'last' and len(unresolved):
+        # 目标周五尚未确定时，该周已有的行可能成为执行行（周五休市），下一次需要重算这些行
+        week_start = np.searchsorted(dates, unresolved.min() - np.timedelta64(4, 'D'))
+        if week_start < split:
+            split = boundary_before(week_start)
+
+    def pending(previous, candidate_dates, band_starts):
+        kept = np.r_[previous, candidate_dates[band_starts < split]]
+        if split < n:
+            return kept[kept >= dates[split]]
+        return kept[kept > dates[-1]] if n else kept
+
+    new_state = {
+        'start': start + split,
+        'position': float(totals[split - 1]) if split > 0 else state['position'],
+        'sell_count': state['sell_count'] + int(np.count_nonzero(sell_starts < split)),
+        'buy_count': state['buy_count'] + int(np.count_nonzero(buy_starts < split)),
+        'pending_sell': pending(state['pending_sell'], sell_dates, sell_from),
+        'pending_buy': pending(state['pending_buy'], buy_dates, buy_from),
+    }
+    return start, outputs, new_state
+
+
 if __name__ == "__main__":
     # 替换为你的文件路径
     input_excel_file = r"D:\apps\中金项目\7-29-收益率\mian7月31日\main_color\code\副本中证1000.xlsx"
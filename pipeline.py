@@ -0,0 +1,303 @@
+from concurrent.futures import ThreadPoolExecutor, wait
+from dataclasses import dataclass, asdict, fields, replace
+from typing import Callable
+
+from pcr_bbi_new import analyze_market_data, load_daily_table
+from xichou_fun import xichou
+from function_new import function
+from API import API
+from husen_new import analyze_market_signals_with_position as hs3, load_weekly_table
+from sum import sum
+from params import StrategyParams
+from color import to_excel_colored
+from instrument import stage, captured_logs, replay_logs
+from stagecache import StageCache, frame_digest
+from analytics import performance_metrics
+from dtypes import readable
+from indicators import weekly_bars
+import legacy
+
+# 组合总仓位由这三列求和（PCR吸筹总仓位已经包含了pcr_bbi仓位）
+POSITION_COLUMNS = ['PCR吸筹总仓位', '振幅指标调整仓位', '周度bbi调整仓位']
+
+# 导出表格保留的列
+EXPORT_COLUMNS = ["日期", '持仓量PCR百分位', '持仓量PCR', '吸筹值', '振幅(%)', '涨跌幅(%)', "pcr_bbi总仓位", "PCR_BBI卖出预警",
+                  "卫星吸筹调整仓位", '收益率', "PCR吸筹总仓位", "振幅距离预警的日期", "振幅指标调整仓位", "振幅卖出指标",
+                  "周度bbi调整仓位", "备注", "组合总仓位"]
+
+
+def _field_names(prefix):
+    return tuple(f.name for f in fields(StrategyParams) if f.name.startswith(prefix))
+
+
+def _run_pcr_bbi(daily_df, params, initial_pos):
+    df = analyze_market_data(daily_df, date_column='日期', position=initial_pos, params=params)
+    if df.empty:
+        raise ValueError("日表处理失败，请检查日表文件和初始仓位")
+    return df
+
+
+def _run_weekly(weekly_df, params, initial_pos):
+    week_df = hs3(weekly_df, params=params)
+    if week_df.empty:
+        raise ValueError("周表处理失败，请检查周表文件")
+    return week_df
+
+
+def _run_legacy_pcr_bbi(daily_df, params, initial_pos):
+    df = legacy.analyze_market_data(daily_df, date_column='日期', position=initial_pos, params=params)
+    if df.empty:
+        raise ValueError("日表处理失败，请检查日表文件和初始仓位")
+    return df
+
+
+def _run_legacy_weekly(weekly_df, params, initial_pos):
+    week_df = legacy.analyze_market_signals_with_position(weekly_df, params=params)
+    if week_df.empty:
+        raise ValueError("周表处理失败，请检查周表文件")
+    return week_df
+
+
+# 各阶段可选的实现：'fast' 为数组状态机（默认），'legacy' 为原逐行实现（见 legacy.py），用于核对结果
+ENGINES = ('fast', 'legacy')
+
+
+@dataclass(frozen=True)
+class Stage:
+    """
+    流水线中的一个可缓存阶段。
+    """
+    slug: str  # 缓存子目录名，也是下游引用该阶段输出时使用的名称
+    name: str  # 报告中显示的名称
+    inputs: tuple  # 输入：'daily'、'weekly' 或上游阶段的 slug，按顺序作为 run 的前几个参数
+    params: tuple  # 用到的参数名（StrategyParams 字段或 'initial_pos'），只有这些参数变化时才重算
+    modules: tuple  # 实现所在的模块，源码变化时重算
+    run: Callable  # run(*inputs, params, initial_pos) 返回阶段输出
+    events: Callable  # events(output) 返回交易次数，写入报告
+    legacy: Callable  # engine 为 'legacy' 时代替 run 的逐行实现，参数和输出与 run 相同
+
+    def runner(self, engine):
+        """
+        返回 engine 对应的实现。
+        """
+        return self.legacy if engine == 'legacy' else self.run
+
+
+# 各阶段按依赖顺序排列。周度阶段只依赖周表，修改日度策略不会让它重算
+STAGES = [
+    Stage('pcr_bbi', 'pcr_bbi', ('daily',), _field_names('pcr_') + ('holiday_policy', 'initial_pos'),
+          ('pcr_bbi_new', 'tradeday'),
+          _run_pcr_bbi, lambda df: int((df['pcr_bbi仓位调整'] != 0).sum()), _run_legacy_pcr_bbi),
+    Stage('xichou', '吸筹', ('pcr_bbi',), _field_names('xichou_'), ('xichou_fun', 'tradeday', 'dtypes'),
+          lambda df, params, initial_pos: xichou(df, params), lambda df: int((df['吸筹买卖'] != '').sum()),
+          lambda df, params, initial_pos: legacy.xichou(df, params)),
+    Stage('amplitude', '振幅', ('xichou',), _field_names('amplitude_') + ('holiday_policy',),
+          ('function_new', 'cross', 'tradeday', 'dtypes'),
+          lambda df, params, initial_pos: function(df, params), lambda df: int((df['振幅指标调整仓位'] != 0).sum()),
+          lambda df, params, initial_pos: legacy.function(df, params)),
+    Stage('weekly', '周度', ('weekly',), _field_names('weekly_') + ('holiday_policy',), ('husen_new', 'tradeday', 'dtypes'),
+          _run_weekly, lambda df: int((df['周度bbi调整仓位'] != 0).sum()), _run_legacy_weekly),
+]
+
+# run_strategies 和 export_result 依次经过的阶段，界面按此显示进度
+PROGRESS_STAGES = ['读取日表', '读取周表'] + [item.name for item in STAGES] + ['周度对齐', '组合总仓位', '导出']
+
+
+def _branch(root):
+    # 输入最终来自 root（'daily' 或 'weekly'）的阶段，按 STAGES 的顺序排列
+    names, branch = {root}, []
+    for item in STAGES:
+        if names & set(item.inputs):
+            names.add(item.slug)
+            branch.append(item)
+    return branch
+
+
+def _stage_engines(engine):
+    """
+    将 run_strategies 的 engine 参数展开为 {阶段 slug: 实现}。
+    """
+    engines = {item.slug: 'fast' for item in STAGES}
+    engines.update({slug: engine for slug in engines} if isinstance(engine, str) else engine)
+    unknown = set(engines) - {item.slug for item in STAGES}
+    if unknown:
+        raise ValueError(f"未知的阶段: {sorted(unknown)}")
+    invalid = {value for value in engines.values() if value not in ENGINES}
+    if invalid:
+        raise ValueError(f"不支持的实现 {sorted(invalid)}，请使用 'fast' 或 'legacy'")
+    return engines
+
+
+def _run_stages(items, outputs, keys, cache, params, initial_pos, report, engines):
+    """
+    依次运行 items 中的阶段，输出和缓存键写入 outputs 和 keys（cache 为 None 时 keys 不使用）。
+    engines 为 {阶段 slug: 实现}，逐行实现的缓存键另外包含实现名和 legacy 模块的源码。
+    """
+    settings = {**asdict(params), 'initial_pos': initial_pos}
+    for item in items:
+        engine = engines[item.slug]
+        inputs = [outputs[name] for name in item.inputs]
+        output = key = None
+        if cache:
+            used = {name: settings[name] for name in item.params}
+            keyed = item
+            if engine != 'fast':
+                used['engine'] = engine
+                keyed = replace(item, modules=item.modules + ('legacy',))
+            key = cache.key(keyed, [keys[name] for name in item.inputs], used)
+            output = cache.load(item.slug, key)
+        with stage(report, item.name if output is None else f'{item.name}(缓存)', len(inputs[0])) as record:
+            if output is None:
+                output = item.runner(engine)(*inputs, params, initial_pos)
+                if cache:
+                    cache.save(item.slug, key, output)
+            if record is not None:
+                record['事件数'] = item.events(output)
+        outputs[item.slug] = output
+        keys[item.slug] = key
+
+
+def run_strategies(daily, weekly, initial_pos, params=None, report=None, cache_dir=None, parallel=False, engine='fast'):
+    """
+    运行日度 PCR_BBI、吸筹、振幅模型和周度模型，合并周度结论并计算组合总仓位。
+
+    周度分支（读取周表和周度模型）不依赖日度链，parallel 为 True 时在单独的线程中与日度链（读取日表、pcr_bbi、吸筹、振幅）
+    同时运行，只在周度对齐处汇合；没有周表时在日表读取完之后开始生成周表。周度分支的日志暂存到汇合时输出，
+    逐笔交易信息的内容和顺序与依次运行时相同。任一分支出错时等另一分支结束后抛出该错误，两个分支都出错时抛出日度链的错误。
+    report 开启了 profile 或 trace_memory 时按阶段剖析，总是依次运行。
+    parallel 为试验选项：读取 Excel 和各策略阶段都要持有 GIL，两个线程实际上轮流运行，
+    在 2 万行日表、4 千行周表（都未缓存）上与依次运行耗时相同（约 1.19 秒），表已缓存时略慢，因此默认依次运行。
+
+    给出 cache_dir 时，STAGES 中每个阶段的输出按缓存键保存在该目录下。缓存键由输入表内容、上游阶段的键、
+    该阶段用到的参数和实现模块的源码决定，只有键变化的阶段及其下游重新计算，其余阶段直接读取缓存
+    （读取缓存的阶段不会再次输出逐笔交易信息）。
+
+    engine 选择各阶段的实现：'fast' 为数组状态机，'legacy' 为原逐行实现（慢，不输出逐笔交易信息），
+    两者的输出应当完全相同，verify.py 用它逐列核对。
+
+    参数:
+    daily (str or pd.DataFrame): 日表路径或已读取的日表
+    weekly (str or pd.DataFrame): 周表路径或已读取的周表；为 None 时由日表生成（见 indicators.weekly_bars）
+    initial_pos (float): pcr_bbi 初始仓位
+    params (StrategyParams): 策略参数，默认为 StrategyParams()
+    report (instrument.PipelineReport): 给出时记录每个阶段的耗时、行数、内存和交易次数
+    cache_dir (str): 阶段缓存目录，默认不缓存
+    parallel (bool): 试验选项，为 True 时周度分支在单独的线程中运行，默认依次运行
+    engine (str or dict): 'fast' 或 'legacy'，作用于全部阶段；也可以是 {阶段 slug: 实现}，未给出的阶段为 'fast'
+
+    返回:
+    pd.DataFrame: 包含全部策略列和'组合总仓位'列的日度表
+    """
+    params = params or StrategyParams()
+    engines = _stage_engines(engine)
+    cache = StageCache(cache_dir) if cache_dir else None
+    parallel = parallel and (report is None or (report.profiler is None and not report.trace_memory))
+    # 没有周表时由日表生成，日期为每周最后一个交易日，周度策略不再跳过非周五的行
+    if weekly is None:
+        params = replace(params, weekly_last_trading_day=True)
+
+    pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix='weekly') if parallel else None
+    futures = []
+    logs = []
+
+    def start_weekly(daily_df):
+        # 并行时把周度分支交给线程池；依次运行时在日度链结束后再运行
+        if pool is not None:
+            futures.append(pool.submit(captured_weekly_branch, daily_df))
+
+    def daily_branch():
+        with stage(report, '读取日表') as record:
+            daily_df = load_daily_table(daily, pcr_lookback=params.pcr_lookback, pcr_min_periods=params.pcr_min_periods)
+            if record is not None and daily_df is not None:
+                record['行数'] = len(daily_df)
+        if daily_df is None:
+            raise ValueError("日表处理失败，请检查日表文件和初始仓位")
+        if weekly is None:
+            start_weekly(daily_df)
+        outputs = {'daily': daily_df}
+        keys = {'daily': frame_digest(daily_df)} if cache else {}
+        _run_stages(_branch('daily'), outputs, keys, cache, params, initial_pos, report, engines)
+        return outputs
+
+    def weekly_branch(daily_df):
+        with stage(report, '读取周表' if weekly is not None else '生成周表') as record:
+            weekly_df = load_weekly_table(weekly) if weekly is not None else weekly_bars(daily_df)
+            if record is not None and weekly_df is not None:
+                record['行数'] = len(weekly_df)
+        if weekly_df is None:
+            raise ValueError("周表处理失败，请检查周表文件")
+        outputs = {'weekly': weekly_df}
+        keys = {'weekly': frame_digest(weekly_df)} if cache else {}
+        _run_stages(_branch('weekly'), outputs, keys, cache, params, initial_pos, report, engines)
+        return outputs
+
+    def captured_weekly_branch(daily_df):
+        with captured_logs() as records:
+            try:
+                return weekly_branch(daily_df)
+            finally:
+                logs.extend(records)
+
+    if pool is None:
+        daily_outputs = daily_branch()
+        weekly_outputs = weekly_branch(daily_outputs['daily'])
+    else:
+        with pool:
+            if weekly is not None:
+                start_weekly(None)
+            try:
+                daily_outputs = daily_branch()
+            finally:
+                # 日度链出错时也等周度分支结束，不留下仍在写报告和缓存的线程
+                wait(futures)
+                replay_logs(logs)
+            weekly_outputs = futures[0].result()
+
+    df = daily_outputs['amplitude']
+    with stage(report, '周度对齐', len(df)):
+        df = API(df, weekly_outputs['weekly'])
+
+    with stage(report, '组合总仓位', len(df)):
+        df = sum(df, POSITION_COLUMNS)
+    return df
+
+
+def summarize_run(df):
+    """
+    将一次完整运行的结果压缩为一行汇总。
+
+    参数:
+    df (pd.DataFrame): run_strategies 的输出
+
+    返回:
+    dict: 各策略交易次数、组合总仓位统计，以及按组合总仓位持有标的的绩效指标
+    """
+    metrics = performance_metrics(df['收盘价'], df['组合总仓位']).iloc[0]
+    return {
+        'pcr_bbi交易次数': int((df['pcr_bbi仓位调整'] != 0).sum()),
+        '吸筹买入次数': int((df['吸筹买卖'] == '买入').sum()),
+        '振幅卖出次数': int((df['振幅指标调整仓位'] != 0).sum()),
+        '周度交易次数': int((df['周度bbi调整仓位'].fillna(0) != 0).sum()),
+        '期末pcr_bbi总仓位': float(df['pcr_bbi总仓位'].iloc[-1]),
+        '期末PCR吸筹总仓位': float(df['PCR吸筹总仓位'].iloc[-1]),
+        '平均组合总仓位': float(df['组合总仓位'].mean()),
+        '期末组合总仓位': float(df['组合总仓位'].iloc[-1]),
+        **{name: float(metrics[name]) for name in ['总收益', '年化收益', '夏普比率', '最大回撤', '年化换手率']},
+    }
+
+
+def export_result(df, output_file, columns=EXPORT_COLUMNS, report=None):
+    """
+    按 color 的规则给单元格上色并保存到 Excel。
+
+    参数:
+    df (pd.DataFrame): run_strategies 的输出
+    output_file (str): 输出 Excel 文件路径
+    columns (list): 导出的列，为 None 时导出全部列
+    report (instrument.PipelineReport): 给出时记录导出的耗时；report 带有 cancel_token 时导出过程中可以取消
+    """
+    with stage(report, '导出', len(df)):
+        df = readable(df)
+        if columns is not None:
+            df = df[columns]
+        to_excel_colored(df, output_file, cancel_token=report.cancel_token if report is not None else None)
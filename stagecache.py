@@ -0,0 +1,133 @@
+import hashlib
+import json
+import os
+import pickle
+import sys
+import uuid
+
+import pandas as pd
+
+# 缓存目录名，默认放在输出文件或日表所在目录下
+CACHE_DIR_NAME = '__stagecache__'
+# 缓存格式版本，存储格式变化时加一，旧缓存自动失效
+CACHE_VERSION = 1
+
+
+def frame_digest(df):
+    """
+    计算 DataFrame 内容的哈希（列名、类型和全部取值），用作下游阶段缓存键的一部分。
+    """
+    digest = hashlib.sha1()
+    digest.update(json.dumps([list(map(str, df.columns)), list(map(str, df.dtypes))], ensure_ascii=False).encode('utf-8'))
+    digest.update(pd.util.hash_pandas_object(df, index=True).to_numpy().tobytes())
+    return digest.hexdigest()
+
+
+def module_digest(modules):
+    """
+    计算若干模块源码的哈希，阶段实现的代码修改后缓存自动失效。
+
+    参数:
+    modules (tuple): 模块名，必须已经导入
+    """
+    digest = hashlib.sha1()
+    for name in modules:
+        with open(sys.modules[name].__file__, 'rb') as f:
+            digest.update(name.encode('utf-8'))
+            digest.update(f.read())
+    return digest.hexdigest()
+
+
+class StageCache:
+    """
+    流水线阶段输出的磁盘缓存：每个阶段一个子目录，每个缓存键一个 pickle 文件。
+    缓存键由上游的键、阶段用到的参数和实现模块的源码哈希组成，上游或参数任何变化都会得到新的键，
+    下游阶段随之失效；没有变化的阶段直接读取上一次的输出。
+    """
+
+    def __init__(self, cache_dir, keep=8):
+        """
+        参数:
+        cache_dir (str): 缓存目录
+        keep (int): 每个阶段最多保留的缓存数，超出时删除最久未使用的
+        """
+        self.cache_dir = cache_dir
+        self.keep = keep
+
+    def key(self, stage, input_keys, settings):
+        """
+        计算阶段的缓存键。
+
+        参数:
+        stage (pipeline.Stage): 阶段定义
+        input_keys (list): 各输入（输入表或上游阶段）的键
+        settings (dict): 阶段用到的参数取值
+        """
+        payload = {'version': CACHE_VERSION, 'stage': stage.slug, 'inputs': input_keys,
+                   'params': settings, 'code': module_digest(stage.modules)}
+        return hashlib.sha1(json.dumps(payload, sort_keys=True, ensure_ascii=False).encode('utf-8')).hexdigest()
+
+    def _path(self, slug, key):
+        return os.path.join(self.cache_dir, slug, f'{key}.pkl')
+
+    def load(self, slug, key):
+        """
+        读取缓存的阶段输出，没有缓存或文件损坏时返回 None。
+        读取期间被其他运行清理掉的缓存（更新使用时间时文件已不存在）同样视为没有缓存。
+        """
+        path = self._path(slug, key)
+        try:
+            with open(path, 'rb') as f:
+                output = pickle.load(f)
+            os.utime(path)  # 记录最近一次使用，清理时保留常用的缓存
+        except (OSError, pickle.UnpicklingError, EOFError):
+            return None
+        return output
+
+    def save(self, slug, key, output):
+        """
+        写入阶段输出：先写临时文件再替换，然后清理该阶段多余的旧缓存。目录不可写时只打印警告。
+        """
+        path = self._path(slug, key)
+        tmp = f'{path}.tmp-{uuid.uuid4().hex}'
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(tmp, 'wb') as f:
+                pickle.dump(output, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp, path)
+            self._prune(slug)
+        except OSError as e:
+            print(f"警告: 无法写入阶段缓存 '{path}': {e}")
+            if os.path.exists(tmp):
+                os.remove(tmp)
+
+    def _prune(self, slug):
+        # 多个运行可能同时清理同一个阶段，已被删除的文件直接跳过
+        folder = os.path.join(self.cache_dir, slug)
+        entries = []
+        for name in os.listdir(folder):
+            if name.endswith('.pkl'):
+                path = os.path.join(folder, name)
+                try:
+                    entries.append((os.path.getmtime(path), path))
+                except FileNotFoundError:
+                    pass
+        entries.sort(reverse=True)
+        for _, path in entries[self.keep:]:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+    def clear(self):
+        """
+        删除全部阶段缓存。
+        """
+        if not os.path.isdir(self.cache_dir):
+            return
+        for slug in os.listdir(self.cache_dir):
+            folder = os.path.join(self.cache_dir, slug)
+            if os.path.isdir(folder):
+                for name in os.listdir(folder):
+                    os.remove(os.path.join(folder, name))
+                os.rmdir(folder)
@@ -0,0 +1,558 @@
+import argparse
+import asyncio
+import contextlib
+import inspect
+import io
+import json
+import os
+import time
+from dataclasses import dataclass, replace
+
+import numpy as np
+import pandas as pd
+
+from pcr_bbi_new import load_daily_table
+from incremental import resume_strategies, resume_tail
+from indicators import BBI_WINDOWS, MACD_SPANS, bbi, weekly_bars
+from dtypes import categorical
+from params import StrategyParams
+from pipeline import run_strategies, export_result
+from instrument import set_log_level
+
+# 各策略的仓位调整列及策略名（与 pipeline.STAGES 的名称一致），调整值变化时发出事件
+TRADE_COLUMNS = {'pcr_bbi仓位调整': 'pcr_bbi', '卫星吸筹调整仓位': '吸筹', '振幅指标调整仓位': '振幅',
+                 '周度bbi调整仓位': '周度'}
+
+# 延迟报告中的百分位
+LATENCY_PERCENTILES = (50, 90, 99)
+
+
+@dataclass(frozen=True)
+class PositionEvent:
+    """
+    一次仓位调整：一根行情处理完后，某个策略在某个交易日的仓位调整值发生了变化。
+    revised 为 True 表示改动的是之前的交易日，例如由日表生成的周表在本周新增交易日后，周度结论移到新的周末行。
+    """
+    date: pd.Timestamp
+    strategy: str
+    before: float  # 变化前的调整值，新行或原来没有调整时为 0
+    after: float  # 变化后的调整值，没有调整时为 0
+    total: float  # 该交易日的组合总仓位
+    revised: bool
+
+
+# MACD 三条 EMA（快线、慢线、信号线）在第一周之前的递推状态，每条为 (当前值, 旧权重, 有效期数)
+MACD_START = np.array([np.nan, 1.0, 0.0] * 3)
+
+
+def _ewm_step(weighted, old_wt, nobs, value, span):
+    # pandas ewm(span=span, adjust=False).mean() 的一步递推（含缺失值的处理），与整列计算的结果完全相同
+    alpha = 1.0 / (1.0 + (span - 1) / 2.0)
+    observed = value == value
+    nobs += observed
+    if weighted == weighted:
+        old_wt *= 1.0 - alpha
+        if observed:
+            if weighted != value:
+                weighted = (old_wt * weighted + alpha * value) / (old_wt + alpha)
+            old_wt = 1.0
+    elif observed:
+        weighted = value
+    return weighted, old_wt, nobs
+
+
+def _macd_step(state, close):
+    """
+    在上一周的 EMA 状态上递推一周，返回 (新的状态, MACD 柱)，与 indicators.macd 整列计算的这一周相同。
+    """
+    fast, slow, signal = MACD_SPANS
+    fast_state = _ewm_step(*state[0:3], close, fast)
+    slow_state = _ewm_step(*state[3:6], close, slow)
+    dif = (fast_state[0] if fast_state[2] else np.nan) - (slow_state[0] if slow_state[2] else np.nan)
+    signal_state = _ewm_step(*state[6:9], dif, signal)
+    dea = signal_state[0] if signal_state[2] else np.nan
+    return np.array(fast_state + slow_state + signal_state), 2 * (dif - dea)
+
+
+def _week_number(date):
+    # 与 indicators.week_last_rows 相同的自然周序号
+    return (np.datetime64(date, 'ns').astype('datetime64[D]').astype(np.int64) + 3) // 7
+
+
+def _reserve(column, rows):
+    # 容量不足 rows 行时翻倍，只复制原有的行
+    if rows <= len(column):
+        return column
+    grown = np.empty((max(2 * len(column), rows, 16),) + column.shape[1:], dtype=column.dtype)
+    grown[:len(column)] = column
+    return grown
+
+
+def _with_last(columns, start, row, last):
+    """
+    由各列第 start 至 row - 1 行的已有取值和新的第 row 行组成 DataFrame，不修改各列。
+    last 为 {列名: (类型, 第 row 行的取值)}，类型可以是已有类型提升后的类型。
+    """
+    data = {}
+    for col, column in columns.items():
+        dtype, value = last[col]
+        values = np.empty(row + 1 - start, dtype=dtype)
+        values[:-1] = column[start:row]
+        values[-1] = value
+        data[col] = values
+    return pd.DataFrame(data)
+
+
+def _store(columns, row, last):
+    # 把新的第 row 行写入各列，类型提升时转换整列，容量不足时翻倍
+    for col, (dtype, value) in last.items():
+        column = columns[col]
+        if column.dtype != dtype:
+            column = column.astype(dtype)
+        column = _reserve(column, row + 1)
+        column[row] = value
+        columns[col] = column
+
+
+def _adjustments(outputs, start, stop):
+    # 各策略调整列第 start 至 stop 行，缺失值（周度列未对齐的行）视为 0
+    return np.nan_to_num(np.column_stack([outputs[col][start:stop].astype(float) for col in TRADE_COLUMNS]), nan=0.0)
+
+
+class StreamRunner:
+    """
+    逐根行情运行全部策略：每收到一根日度行情，追加到内存中的日表（与上一根日期相同时视为盘中修订，替换最后一行），
+    然后从上一次的状态续算（见 incremental.resume_tail），只重算各策略尚未结束的波段/持仓，
+    最后与上一次的结果比较，返回仓位调整发生变化的事件。
+
+    规范化后的日表、由日表生成的周表和策略结果都按列保存在预留了容量的数组中：每根行情只规范化最后一行、
+    只计算最后一周的周收盘价、周度BBI 和 MACD，续算只使用冻结前缀之后的行，事件只比较各策略重算起点之后的行，
+    每根行情的耗时与历史长度无关。新增列或类型无法兼容时才由完整的日表重新计算一次。
+
+    行情为 {列名: 取值} 的字典，列与日表相同；只有原始行情和期权持仓量时，指标列在每根行情到达后计算
+    （见 indicators.compute_indicators）。
+    """
+
+    def __init__(self, initial_pos, params=None, history=None):
+        """
+        参数:
+        initial_pos (float): pcr_bbi 初始仓位
+        params (StrategyParams): 策略参数，默认为 StrategyParams()；周表总是由日表生成
+        history (pd.DataFrame): 开始接收行情前已有的日表，日期严格递增，先完整计算一次
+        """
+        if not (0 <= initial_pos <= 1.0):
+            raise ValueError(f"初始仓位 ({initial_pos}) 必须在 0 和 1.0 之间")
+        self.initial_pos = initial_pos
+        self.params = replace(params or StrategyParams(), weekly_last_trading_day=True)
+        self._data = {}  # 原始行情：列名 -> 预留了容量的数组，前 self._rows 行有效，容量不足时翻倍
+        self._rows = 0
+        self._daily = {}  # 规范化后的日表各列，前 self._rows 行有效
+        self._weekly = {}  # 由日表生成的周表各列，前 self._weeks 行有效
+        self._weeks = 0
+        self._ewm = np.empty((0, len(MACD_START)))  # 每周处理完后 MACD 三条 EMA 的递推状态
+        self._outputs = {}  # 策略结果各列（分类列保存为 object），前 self._rows 行有效
+        self._dtypes = {}  # 策略结果各列的类型
+        self._result = None
+        self._checkpoint = None  # 处理完最近一根行情后的状态
+        self._before_last = None  # 最后一行写入之前的状态，盘中修订最后一行时从这里续算
+        if history is not None and len(history):
+            dates = pd.to_datetime(history['日期']).to_numpy(dtype='datetime64[ns]')
+            if not (np.diff(dates) > np.timedelta64(0, 'ns')).all():
+                raise ValueError("历史日表的日期必须严格递增（不能有重复日期）")
+            self._data = {col: history[col].to_numpy(copy=True) for col in history.columns}
+            self._data['日期'] = dates
+            self._rows = len(history)
+            self._checkpoint = self._rebuild()
+
+    def __len__(self):
+        return self._rows
+
+    @property
+    def result(self):
+        """
+        最近一次的策略结果，与 run_strategies(日表, None, ...) 相同；读取时才由各列组成 DataFrame。
+        """
+        if self._result is None and self._outputs:
+            self._result = pd.DataFrame({
+                col: categorical(column[:self._rows], col) if isinstance(self._dtypes[col], pd.CategoricalDtype)
+                else column[:self._rows].copy()
+                for col, column in self._outputs.items()})
+        return self._result
+
+    def _column(self, value):
+        # 新列：日期为 datetime64，数值为浮点，其他为 object，已有的行为缺失值
+        capacity = max(len(column) for column in self._data.values()) if self._data else 16
+        if isinstance(value, (int, float, np.number)) and not isinstance(value, bool):
+            return np.full(capacity, np.nan)
+        return np.full(capacity, np.nan, dtype=object)
+
+    def _append(self, bar):
+        """
+        写入一根行情，返回撤销所需的信息 (原行数, 新增的列, 被替换的最后一行)。
+        """
+        date = np.datetime64(pd.Timestamp(bar['日期']), 'ns')
+        rows = self._rows
+        if rows and date < self._data['日期'][rows - 1]:
+            raise ValueError(f"行情日期 {pd.Timestamp(date):%Y-%m-%d} 早于上一根行情 "
+                             f"{pd.Timestamp(self._data['日期'][rows - 1]):%Y-%m-%d}")
+        added = []
+        if '日期' not in self._data:
+            self._data['日期'] = np.full(16, np.datetime64('NaT'), dtype='datetime64[ns]')
+            added.append('日期')
+        for col, value in bar.items():
+            if col not in self._data:
+                self._data[col] = self._column(value)
+                added.append(col)
+
+        replaced = rows and date == self._data['日期'][rows - 1]
+        row = rows - 1 if replaced else rows
+        last = {col: column[row] for col, column in self._data.items()} if replaced else None
+        if row == len(self._data['日期']):
+            for col, column in self._data.items():
+                self._data[col] = _reserve(column, row + 1)
+        for col, column in self._data.items():
+            value = date if col == '日期' else bar.get(col, np.nan)
+            try:
+                column[row] = value
+            except (TypeError, ValueError):  # 数值列收到字符串（例如带 '%' 的持仓量PCR），改为 object 列
+                self._data[col] = column.astype(object)
+                self._data[col][row] = value
+        self._rows = row + 1
+        return rows, added, last
+
+    def _undo(self, rows, added, last):
+        for col in added:
+            del self._data[col]
+        if last is not None:
+            for col, value in last.items():
+                self._data[col][rows - 1] = value
+        self._rows = rows
+
+    def _normalize(self, table):
+        daily_df = load_daily_table(table, use_cache=False, pcr_lookback=self.params.pcr_lookback,
+                                    pcr_min_periods=self.params.pcr_min_periods)
+        if daily_df is None:
+            raise ValueError("日表缺少必要的列")
+        return daily_df
+
+    def _rebuild(self):
+        """
+        由完整的日表重新规范化、生成周表并完整计算，成功后才替换保存的各列，返回新的检查点。
+        """
+        daily_df = self._normalize(pd.DataFrame({col: column[:self._rows] for col, column in self._data.items()}))
+        weekly_df = weekly_bars(daily_df)
+        daily = {col: daily_df[col].to_numpy(copy=True) for col in daily_df.columns}
+        weekly = {col: weekly_df[col].to_numpy(copy=True) for col in weekly_df.columns}
+        ewm = np.empty((len(weekly_df), len(MACD_START)))
+        state = MACD_START
+        for week, close in enumerate(weekly['周收盘价']):
+            state, _ = _macd_step(state, close)
+            ewm[week] = state
+        df, checkpoint, _ = resume_strategies(daily_df, weekly_df, self.initial_pos, None, self.params)
+        self._daily, self._weekly, self._weeks, self._ewm = daily, weekly, len(weekly_df), ewm
+        self._dtypes = df.dtypes.to_dict()
+        self._outputs = {col: df[col].to_numpy(dtype=object) if isinstance(dtype, pd.CategoricalDtype)
+                         else df[col].to_numpy(copy=True) for col, dtype in self._dtypes.items()}
+        self._result = df
+        return checkpoint
+
+    def _last_rows(self):
+        """
+        只规范化日表的最后一行、只计算周表的最后一周，不修改保存的各列。
+        返回 (日表最后一行, 周序号, 周表这一周, 这一周的 MACD 递推状态)，两行都为 {列名: (类型, 取值)}；
+        最后一行的列与之前不同或类型无法兼容时返回 None。
+        """
+        row = self._rows - 1
+        # 日度BBI 需要最长的均线窗口、持仓量PCR百分位需要回看窗口、涨跌幅和振幅需要前一行，只取这么多行规范化
+        lead = max(max(BBI_WINDOWS), self.params.pcr_lookback)
+        window = self._normalize(pd.DataFrame({col: column[max(row - lead, 0):row + 1]
+                                               for col, column in self._data.items()}))
+        if list(window.columns) != list(self._daily):
+            return None
+        daily = {}
+        for col, values in window.items():
+            values = values.to_numpy()
+            try:
+                # 例如整数列出现缺失值后成为浮点列，与完整计算的类型相同
+                daily[col] = (np.promote_types(self._daily[col].dtype, values.dtype), values[-1])
+            except TypeError:
+                return None
+
+        date, close = daily['日期'][1], float(daily['收盘价'][1])
+        week = self._weeks
+        if week and _week_number(date) == _week_number(self._weekly['日期'][week - 1]):
+            week -= 1  # 同一周内的交易日：替换最后一周，日期后移到这一天
+        closes = np.r_[self._weekly['周收盘价'][max(week + 1 - max(BBI_WINDOWS), 0):week], close]
+        state, macd_value = _macd_step(self._ewm[week - 1] if week else MACD_START, close)
+        values = {'日期': date, '周收盘价': close, '周度BBI': bbi(closes)[-1], 'MACD': macd_value}
+        weekly = {col: (self._weekly[col].dtype, values[col]) for col in self._weekly}
+        return daily, week, weekly, state
+
+    def update(self, bar):
+        """
+        处理一根行情。
+
+        参数:
+        bar (dict): 一根日度行情，必须包含 '日期'
+
+        返回:
+        list: 本根行情引起的 PositionEvent，按日期和 TRADE_COLUMNS 的顺序排列
+        """
+        undo = self._append(bar)
+        previous_rows, added, last = undo
+        replaced = last is not None
+        rows = self._rows
+        outputs = self._outputs
+        # 盘中修订最后一行相当于在最后一行写入之前的状态上追加一行，不会因为改动了续算起点之前的行而完整重算
+        checkpoint = self._before_last if replaced else self._checkpoint
+        try:
+            step = self._last_rows() if checkpoint is not None and not added else None
+            if step is None:
+                new_checkpoint, lo = self._rebuild(), 0
+            else:
+                daily, week, weekly, state = step
+                frozen, week_frozen = checkpoint['frozen']['daily'], checkpoint['frozen']['weekly']
+                # 各策略只需要冻结前缀最后一行之后的日表和周表
+                base, week_base = max(frozen - 1, 0), max(week_frozen - 1, 0)
+                tail, new_checkpoint, starts = resume_tail(
+                    _with_last(self._daily, base, rows - 1, daily), _with_last(self._weekly, week_base, week, weekly),
+                    self.initial_pos, checkpoint, self.params, changed=(rows - 1, week), offsets=(base, week_base))
+                lo = min(starts['pcr_bbi'], starts['吸筹'], starts['振幅'], starts['对齐'])
+        except ValueError:
+            # 计算失败时撤销这根行情，状态保持为上一根行情处理完的样子
+            self._undo(*undo)
+            raise
+
+        # 仓位调整只可能在各策略的重算起点之后变化，只比较这些行，新行的原调整值为 0
+        before = np.zeros((rows - lo, len(TRADE_COLUMNS)))
+        if outputs:
+            kept = max(min(previous_rows, rows) - lo, 0)
+            before[:kept] = _adjustments(outputs, lo, lo + kept)
+        if step is not None:
+            _store(self._daily, rows - 1, daily)
+            _store(self._weekly, week, weekly)
+            self._ewm = _reserve(self._ewm, week + 1)
+            self._ewm[week] = state
+            self._weeks = week + 1
+            for col in tail.columns:
+                values = tail[col].to_numpy()
+                if not isinstance(self._dtypes[col], pd.CategoricalDtype) and values.dtype != self._dtypes[col]:
+                    self._dtypes[col] = np.promote_types(self._dtypes[col], values.dtype)
+                    self._outputs[col] = self._outputs[col].astype(self._dtypes[col])
+                column = _reserve(self._outputs[col], rows)
+                column[frozen:rows] = values
+                self._outputs[col] = column
+            self._result = None
+        if not replaced:
+            self._before_last = self._checkpoint
+        self._checkpoint = new_checkpoint
+
+        after = _adjustments(self._outputs, lo, rows)
+        changed_rows, cols = np.nonzero(after != before)
+        dates = self._outputs['日期']
+        total = self._outputs['组合总仓位']
+        strategies = list(TRADE_COLUMNS.values())
+        return [PositionEvent(pd.Timestamp(dates[lo + i]), strategies[j], float(before[i, j]), float(after[i, j]),
+                              float(total[lo + i]), lo + i < rows - 1)
+                for i, j in zip(changed_rows, cols)]
+
+
+def latency_summary(seconds, sla_ms=None):
+    """
+    汇总逐根行情的延迟。
+
+    参数:
+    seconds (list): 每根行情的延迟（秒）
+    sla_ms (float): 给出时统计超过该毫秒数的行情数
+
+    返回:
+    dict: 行情数、平均、各百分位和最大延迟（毫秒）
+    """
+    ms = np.asarray(seconds, dtype=float) * 1000
+    summary = {'行情数': len(ms), '平均(ms)': round(float(ms.mean()), 3) if len(ms) else None}
+    for q in LATENCY_PERCENTILES:
+        summary[f'p{q}(ms)'] = round(float(np.percentile(ms, q)), 3) if len(ms) else None
+    summary['最大(ms)'] = round(float(ms.max()), 3) if len(ms) else None
+    if sla_ms is not None:
+        summary[f'超过{sla_ms:g}ms'] = int((ms > sla_ms).sum())
+    return summary
+
+
+def format_latency(stats):
+    """
+    返回 run_stream 延迟统计的文本报告。
+    """
+    frame = pd.DataFrame([{'延迟': name, **stats[name]} for name in ('端到端', '处理')])
+    return f"{frame.to_string(index=False)}\n跳过的行情: {stats['跳过']}"
+
+
+async def run_stream(source, runner, on_event=None, sla_ms=None, queue_size=0):
+    """
+    从异步行情源逐根读取行情交给 runner 处理，每根行情处理完立即把事件交给 on_event。
+    行情源在单独的任务中读取，行情到达时记录时间，端到端延迟包括在队列中等待的时间，处理延迟只包括策略计算。
+    日期早于上一根或缺少必要列的行情打印警告后跳过。
+
+    参数:
+    source: 异步迭代器，逐根产生行情字典，例如 replay_source 或 tcp_source
+    runner (StreamRunner): 策略状态
+    on_event (callable): on_event(PositionEvent)，可以是协程函数；默认不处理
+    sla_ms (float): 给出时统计延迟超过该毫秒数的行情数
+    queue_size (int): 行情队列长度，0 为不限
+
+    返回:
+    dict: {'端到端': latency_summary, '处理': latency_summary, '跳过': 跳过的行情数}
+    """
+    queue = asyncio.Queue(queue_size)
+
+    async def produce():
+        try:
+            async for bar in source:
+                await queue.put((time.perf_counter(), bar))
+        finally:
+            await queue.put(None)
+
+    producer = asyncio.create_task(produce())
+    end_to_end, processing = [], []
+    skipped = 0
+    try:
+        while (item := await queue.get()) is not None:
+            arrived, bar = item
+            started = time.perf_counter()
+            try:
+                events = runner.update(bar)
+            except ValueError as e:
+                print(f"警告: 跳过行情 {bar.get('日期')}: {e}")
+                skipped += 1
+                continue
+            done = time.perf_counter()
+            end_to_end.append(done - arrived)
+            processing.append(done - started)
+            for event in events:
+                if on_event is not None:
+                    result = on_event(event)
+                    if inspect.isawaitable(result):
+                        await result
+        await producer
+    finally:
+        producer.cancel()
+    return {'端到端': latency_summary(end_to_end, sla_ms), '处理': latency_summary(processing, sla_ms), '跳过': skipped}
+
+
+def read_bars(table):
+    """
+    读取行情回放文件（.xlsx 或 .csv，列与日表相同），按日期排序，不计算指标。
+    """
+    if isinstance(table, pd.DataFrame):
+        df = table
+    else:
+        extension = os.path.splitext(table)[1].lower()
+        if extension == '.xlsx':
+            df = pd.read_excel(table)
+        elif extension == '.csv':
+            df = pd.read_csv(table)
+        else:
+            raise ValueError(f"不支持的文件类型 '{extension}'，请提供 .xlsx 或 .csv 文件")
+    df = df.assign(日期=pd.to_datetime(df['日期']))
+    return df.sort_values('日期', kind='stable').reset_index(drop=True)
+
+
+async def replay_source(table, interval=0.0, start=0):
+    """
+    按日期顺序逐行回放日表，作为行情源。
+
+    参数:
+    table (str or pd.DataFrame): 回放文件路径或已读取的表
+    interval (float): 相邻两根行情之间等待的秒数，0 为尽快回放
+    start (int): 从第几行开始回放（前面的行可作为 StreamRunner 的 history）
+    """
+    df = read_bars(table)
+    for bar in df.iloc[start:].to_dict('records'):
+        yield bar
+        await asyncio.sleep(interval)
+
+
+async def tcp_source(host, port):
+    """
+    连接行情服务，每行一个 JSON 对象（一根行情），连接关闭时结束。
+    """
+    reader, writer = await asyncio.open_connection(host, port)
+    try:
+        while line := await reader.readline():
+            if line.strip():
+                yield json.loads(line)
+    finally:
+        writer.close()
+        await writer.wait_closed()
+
+
+async def serve_replay(table, host='127.0.0.1', port=0, interval=0.0, start=0):
+    """
+    本地行情服务替身：每个连接上来的客户端都从 start 行开始收到一遍回放，每行一个 JSON 对象，发完后关闭连接。
+
+    返回:
+    asyncio.Server: 已开始监听的服务，port 为 0 时实际端口见 server.sockets[0].getsockname()
+    """
+    df = read_bars(table)
+
+    async def handle(reader, writer):
+        try:
+            async for bar in replay_source(df, interval, start):
+                writer.write((json.dumps(bar, ensure_ascii=False, default=str) + '\n').encode('utf-8'))
+                await writer.drain()
+        finally:
+            writer.close()
+            await writer.wait_closed()
+
+    return await asyncio.start_server(handle, host, port)
+
+
+def format_event(event):
+    """
+    返回一条事件的文本。
+    """
+    note = '（修订）' if event.revised else ''
+    return (f"{event.date:%Y-%m-%d} {event.strategy} 仓位调整 {event.before:g} -> {event.after:g}{note}，"
+            f"组合总仓位 {event.total:g}")
+
+
+async def _main(args):
+    bars = read_bars(args.daily)
+    warmup = min(args.warmup, len(bars))
+    runner = StreamRunner(args.initial_pos, history=bars.iloc[:warmup])
+    on_event = None if args.no_events else (lambda event: print(format_event(event)))
+    if args.tcp:
+        host, port = args.tcp.rsplit(':', 1)
+        server = await serve_replay(bars, host, int(port), args.interval, warmup)
+        port = server.sockets[0].getsockname()[1]
+        async with server:
+            stats = await run_stream(tcp_source(host, port), runner, on_event, args.sla_ms)
+    else:
+        stats = await run_stream(replay_source(bars, args.interval, warmup), runner, on_event, args.sla_ms)
+    return bars, runner, stats
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='逐根行情回放运行全部策略，并统计每根行情的处理延迟')
+    parser.add_argument('daily', help='日表文件，按日期顺序回放')
+    parser.add_argument('--initial-pos', type=float, default=0.7, help='初始仓位，默认 0.7')
+    parser.add_argument('--warmup', type=int, default=0, help='前多少行作为已有历史一次计算，不计入延迟，默认 0')
+    parser.add_argument('--interval', type=float, default=0.0, help='相邻两根行情的间隔秒数，默认 0（尽快回放）')
+    parser.add_argument('--tcp', default=None, metavar='HOST:PORT',
+                        help='经本地 TCP 行情服务替身回放（端口为 0 时自动选择），默认直接读取文件')
+    parser.add_argument('--sla-ms', type=float, default=None, help='统计延迟超过该毫秒数的行情数')
+    parser.add_argument('--no-events', action='store_true', help='不打印仓位调整事件')
+    parser.add_argument('--out', default=None, help='最终结果 Excel 输出路径')
+    parser.add_argument('--verify', action='store_true', help='结束后与完整重算的结果逐项比较')
+    args = parser.parse_args()
+
+    set_log_level('WARNING')  # 逐笔交易信息由事件代替
+    bars, runner, stats = asyncio.run(_main(args))
+    print(format_latency(stats))
+    if args.verify:
+        with contextlib.redirect_stdout(io.StringIO()):
+            full = run_strategies(bars, None, args.initial_pos)
+        pd.testing.assert_frame_equal(runner.result, full, check_exact=True)
+        print("校验通过：逐根行情的结果与完整重算一致")
+    if args.out:
+        export_result(runner.result, args.out)
+        print(f"结果已保存到 {args.out}")
@@ -0,0 +1,198 @@
+import argparse
+import csv
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from dataclasses import asdict, replace
+from multiprocessing import shared_memory
+
+import numpy as np
+import pandas as pd
+
+from pcr_bbi_new import load_daily_table
+from husen_new import load_weekly_table
+from indicators import weekly_bars
+from params import StrategyParams, expand_grid
+from pipeline import run_strategies, summarize_run
+from instrument import set_log_level
+
+# 策略计算需要的数值列，只有这些列放入共享内存
+DAILY_COLUMNS = ['收盘价', '日度BBI', '持仓量PCR', '持仓量PCR百分位', '吸筹值', '振幅(%)', '涨跌幅(%)']
+WEEKLY_COLUMNS = ['周收盘价', '周度BBI', 'MACD']
+
+# 网格中有多组持仓量PCR百分位窗口时，每组窗口的百分位另存为一列共享，列名见 _percentile_column
+PERCENTILE_COLUMN = '持仓量PCR百分位'
+
+# 子进程中的输入表，由 _init_worker 从共享内存重建
+_WORKER_INPUTS = {}
+
+
+def _percentile_column(params):
+    return f'{PERCENTILE_COLUMN}|{params.pcr_lookback}|{params.pcr_min_periods}'
+
+
+def share_frame(df, columns, date_column='日期'):
+    """
+    将日期列和数值列复制到共享内存，子进程按名称挂载，不需要 pickle DataFrame。
+
+    参数:
+    df (pd.DataFrame): 规范化后的输入表
+    columns (list): 需要共享的数值列
+    date_column (str): 日期列名
+
+    返回:
+    tuple: (spec, blocks)，spec 是可传给子进程的描述信息，blocks 是需要在结束后释放的共享内存
+    """
+    values = df[columns].to_numpy(dtype=np.float64)
+    dates = df[date_column].values.astype('datetime64[ns]').view(np.int64)
+    blocks = []
+    spec = {'columns': list(columns), 'date_column': date_column, 'rows': len(df)}
+    for key, array in (('values', values), ('dates', dates)):
+        block = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+        np.ndarray(array.shape, dtype=array.dtype, buffer=block.buf)[...] = array
+        spec[key] = block.name
+        blocks.append(block)
+    return spec, blocks
+
+
+def attach_frame(spec):
+    """
+    按 share_frame 返回的描述信息挂载共享内存并重建 DataFrame。
+
+    返回:
+    tuple: (DataFrame, blocks)，blocks 需要在进程内保持引用直到不再使用
+    """
+    blocks = []
+    arrays = {}
+    for key, dtype, shape in (('values', np.float64, (spec['rows'], len(spec['columns']))),
+                              ('dates', np.int64, (spec['rows'],))):
+        block = shared_memory.SharedMemory(name=spec[key])
+        arrays[key] = np.ndarray(shape, dtype=dtype, buffer=block.buf)
+        blocks.append(block)
+    df = pd.DataFrame(arrays['values'], columns=spec['columns'], copy=True)
+    df.insert(0, spec['date_column'], arrays['dates'].view('datetime64[ns]'))
+    return df, blocks
+
+
+def _init_worker(daily_spec, weekly_spec):
+    # 策略函数的逐笔信息在并行运行时没有意义：关闭 INFO 日志，其余输出直接丢弃
+    set_log_level('WARNING')
+    sys.stdout = open(os.devnull, 'w', encoding='utf-8')
+    daily, daily_blocks = attach_frame(daily_spec)
+    weekly, weekly_blocks = attach_frame(weekly_spec)
+    _WORKER_INPUTS.update(daily=daily, weekly=weekly, blocks=daily_blocks + weekly_blocks)
+
+
+def _daily_for(params):
+    # 按这组参数的百分位窗口取对应的持仓量PCR百分位列，其余窗口的列不交给策略
+    daily = _WORKER_INPUTS['daily']
+    windows = [col for col in daily.columns if col.startswith(f'{PERCENTILE_COLUMN}|')]
+    if not windows:
+        return daily
+    return daily.drop(columns=windows).assign(**{PERCENTILE_COLUMN: daily[_percentile_column(params)]})
+
+
+def _run_one(run_id, params, initial_pos):
+    row = {'run_id': run_id, 'initial_pos': initial_pos, **asdict(params)}
+    start = time.perf_counter()
+    try:
+        df = run_strategies(_daily_for(params), _WORKER_INPUTS['weekly'], initial_pos, params)
+        row.update(summarize_run(df))
+        row['error'] = ''
+    except Exception as e:
+        row['error'] = f'{type(e).__name__}: {e}'
+    row['seconds'] = round(time.perf_counter() - start, 4)
+    return row
+
+
+def run_sweep(daily_file, weekly_file, grid, initial_pos=0.7, base_params=None, max_workers=None, out_file=None):
+    """
+    参数扫描：日表、周表只读取和预处理一次，放入共享内存后分发到进程池，每组参数运行一次完整策略。
+    网格中有多组持仓量PCR百分位窗口（pcr_lookback、pcr_min_periods）时，每组窗口各读取一次日表，百分位分别共享。
+
+    参数:
+    daily_file (str or pd.DataFrame): 日表路径或已读取的日表
+    weekly_file (str or pd.DataFrame): 周表路径或已读取的周表；为 None 时由日表生成（见 indicators.weekly_bars）
+    grid (dict): {参数名: 取值列表}，见 params.expand_grid；可以包含 'initial_pos'
+    initial_pos (float): 网格中没有 'initial_pos' 时使用的初始仓位
+    base_params (StrategyParams): 网格之外的参数取值
+    max_workers (int): 进程数，默认为 CPU 核数
+    out_file (str): 汇总表 CSV 路径；给出时每完成一组参数就追加一行
+
+    返回:
+    pd.DataFrame: 每组参数一行的汇总表，按 run_id 排序
+    """
+    base_params = base_params or StrategyParams()
+    if weekly_file is None:
+        base_params = replace(base_params, weekly_last_trading_day=True)
+    combos = expand_grid(grid, base_params)
+    windows = list(dict.fromkeys(_percentile_column(params) for params, _ in combos))
+
+    daily = load_daily_table(daily_file, pcr_lookback=combos[0][0].pcr_lookback,
+                             pcr_min_periods=combos[0][0].pcr_min_periods)
+    weekly = load_weekly_table(weekly_file) if weekly_file is not None or daily is None else weekly_bars(daily)
+    if daily is None or weekly is None:
+        raise ValueError("日表或周表读取失败")
+    columns = DAILY_COLUMNS
+    if len(windows) > 1:
+        daily[windows[0]] = daily[PERCENTILE_COLUMN].to_numpy()
+        for params, _ in combos:
+            column = _percentile_column(params)
+            if column not in daily.columns:
+                table = load_daily_table(daily_file, pcr_lookback=params.pcr_lookback,
+                                         pcr_min_periods=params.pcr_min_periods)
+                daily[column] = table[PERCENTILE_COLUMN].to_numpy()
+        columns = DAILY_COLUMNS + windows
+
+    daily_spec, daily_blocks = share_frame(daily, columns)
+    weekly_spec, weekly_blocks = share_frame(weekly, WEEKLY_COLUMNS)
+
+    rows = []
+    writer = None
+    out = open(out_file, 'w', newline='', encoding='utf-8-sig') if out_file else None
+    try:
+        with ProcessPoolExecutor(max_workers=max_workers, initializer=_init_worker,
+                                 initargs=(daily_spec, weekly_spec)) as executor:
+            futures = [executor.submit(_run_one, run_id, params, initial_pos if pos is None else pos)
+                       for run_id, (params, pos) in enumerate(combos)]
+            for future in as_completed(futures):
+                row = future.result()
+                rows.append(row)
+                if out is not None:
+                    if writer is None:
+                        writer = csv.DictWriter(out, fieldnames=list(row))
+                        writer.writeheader()
+                    writer.writerow(row)
+                    out.flush()
+    finally:
+        if out is not None:
+            out.close()
+        for block in daily_blocks + weekly_blocks:
+            block.close()
+            block.unlink()
+
+    return pd.DataFrame(rows).sort_values('run_id').reset_index(drop=True)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='策略参数扫描')
+    parser.add_argument('daily', help='日表文件')
+    parser.add_argument('weekly', nargs='?', default=None, help='周表文件，省略时由日表生成')
+    parser.add_argument('--grid', required=True,
+                        help='参数网格，JSON 字符串或 JSON 文件路径，例如 {"xichou_threshold": [70, 80, 90]}')
+    parser.add_argument('--initial-pos', type=float, default=0.7, help='初始仓位，默认 0.7')
+    parser.add_argument('--workers', type=int, default=None, help='进程数，默认为 CPU 核数')
+    parser.add_argument('--out', default=None, help='汇总表 CSV 输出路径')
+    args = parser.parse_args()
+
+    if os.path.exists(args.grid):
+        with open(args.grid, encoding='utf-8') as f:
+            grid = json.load(f)
+    else:
+        grid = json.loads(args.grid)
+
+    summary = run_sweep(args.daily, args.weekly, grid, initial_pos=args.initial_pos,
+                        max_workers=args.workers, out_file=args.out)
+    print(summary.to_string())
@@ -0,0 +1,160 @@
+import hashlib
+import json
+import os
+import pickle
+import shutil
+import uuid
+
+import numpy as np
+import pandas as pd
+
+# 缓存目录名，默认放在输入文件所在目录下
+CACHE_DIR_NAME = '__tablecache__'
+MANIFEST_NAME = 'manifest.json'
+# 缓存格式版本，规范化逻辑或存储格式变化时加一，旧缓存自动失效
+CACHE_VERSION = 1
+
+
+def file_digest(path, chunk_size=1 << 20):
+    """
+    计算文件内容的 SHA-1，用于 mtime 变化但内容未变时避免重建缓存。
+    """
+    digest = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _entry_dir(path, kind, cache_dir):
+    path = os.path.abspath(path)
+    cache_dir = cache_dir or os.path.join(os.path.dirname(path), CACHE_DIR_NAME)
+    key = hashlib.sha1(f'{path}|{kind}'.encode('utf-8')).hexdigest()[:16]
+    return os.path.join(cache_dir, f'{os.path.basename(path)}.{key}')
+
+
+def _read_manifest(entry):
+    try:
+        with open(os.path.join(entry, MANIFEST_NAME), encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _write_entry(entry, df, source):
+    """
+    数值列和日期列各存为一个 .npy 文件（读取时可以内存映射），其余列合并存为一个 pickle。
+    先写入临时目录再整体替换，多个进程同时写同一个缓存也不会读到半成品。
+    """
+    tmp = f'{entry}.tmp-{uuid.uuid4().hex}'
+    os.makedirs(tmp)
+    columns = []
+    others = {}
+    for i, column in enumerate(df.columns):
+        values = df[column].to_numpy()
+        if values.dtype.kind in 'biufcmM':
+            np.save(os.path.join(tmp, f'{i}.npy'), values)
+            columns.append({'name': column, 'file': f'{i}.npy'})
+        else:
+            others[column] = df[column]
+            columns.append({'name': column, 'file': None})
+    if others:
+        with open(os.path.join(tmp, 'others.pkl'), 'wb') as f:
+            pickle.dump(others, f, protocol=pickle.HIGHEST_PROTOCOL)
+
+    manifest = {'version': CACHE_VERSION, 'source': source, 'rows': len(df), 'columns': columns}
+    with open(os.path.join(tmp, MANIFEST_NAME), 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, ensure_ascii=False)
+
+    shutil.rmtree(entry, ignore_errors=True)
+    try:
+        os.replace(tmp, entry)
+    except OSError:  # 其他进程已经写好了同一个缓存
+        shutil.rmtree(tmp, ignore_errors=True)
+
+
+def _update_manifest(entry, manifest):
+    """
+    改写已有缓存的记录：先写临时文件再替换，其他进程不会读到写了一半的 manifest.json。
+    目录不可写或缓存已被其他进程替换时只跳过更新。
+    """
+    path = os.path.join(entry, MANIFEST_NAME)
+    tmp = f'{path}.tmp-{uuid.uuid4().hex}'
+    try:
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump(manifest, f, ensure_ascii=False)
+        os.replace(tmp, path)
+    except OSError:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+
+
+def _read_entry(entry, manifest):
+    others = {}
+    if any(column['file'] is None for column in manifest['columns']):
+        with open(os.path.join(entry, 'others.pkl'), 'rb') as f:
+            others = pickle.load(f)
+    data = {}
+    for column in manifest['columns']:
+        if column['file'] is None:
+            data[column['name']] = others[column['name']].to_numpy()
+        else:
+            data[column['name']] = np.load(os.path.join(entry, column['file']), mmap_mode='r')
+    # 从内存映射复制一次，返回的表可以自由修改
+    return pd.DataFrame(data, columns=[column['name'] for column in manifest['columns']], copy=True)
+
+
+def cached_table(path, kind, build, cache_dir=None):
+    """
+    读取规范化后的输入表，优先使用缓存。缓存以文件路径、大小、修改时间和内容哈希为键：
+    大小和修改时间都未变时直接读缓存；修改时间变了但内容哈希未变时只更新缓存记录；
+    否则调用 build 重新读取并写入缓存。
+
+    参数:
+    path (str): 输入文件路径
+    kind (str): 表的种类和规范化参数，例如 'daily|日期'，不同种类分别缓存
+    build (callable): build(path) 返回规范化后的 DataFrame，失败时返回 None（不写缓存）
+    cache_dir (str): 缓存目录，默认为输入文件所在目录下的 __tablecache__
+
+    返回:
+    pd.DataFrame: 规范化后的表，或 build 返回的 None
+    """
+    entry = _entry_dir(path, kind, cache_dir)
+    stat = os.stat(path)
+    manifest = _read_manifest(entry)
+
+    if manifest is not None and manifest.get('version') == CACHE_VERSION:
+        source = manifest['source']
+        if source['size'] == stat.st_size and source['mtime_ns'] == stat.st_mtime_ns:
+            return _read_entry(entry, manifest)
+        if source['size'] == stat.st_size and source['sha1'] == file_digest(path):
+            source['mtime_ns'] = stat.st_mtime_ns
+            _update_manifest(entry, manifest)
+            return _read_entry(entry, manifest)
+
+    df = build(path)
+    if df is None:
+        return None
+    if not isinstance(df.index, pd.RangeIndex) or df.index.start != 0 or df.index.step != 1:
+        df = df.reset_index(drop=True)
+    source = {'path': os.path.abspath(path), 'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns,
+              'sha1': file_digest(path)}
+    try:
+        _write_entry(entry, df, source)
+    except OSError as e:  # 目录不可写等情况不影响正常读取
+        print(f"警告: 无法写入缓存 '{entry}': {e}")
+    return df
+
+
+def clear_cache(path, cache_dir=None):
+    """
+    删除某个输入文件的全部缓存（所有种类）。
+    """
+    path = os.path.abspath(path)
+    cache_dir = cache_dir or os.path.join(os.path.dirname(path), CACHE_DIR_NAME)
+    if not os.path.isdir(cache_dir):
+        return
+    prefix = f'{os.path.basename(path)}.'
+    for name in os.listdir(cache_dir):
+        if name.startswith(prefix):
+            shutil.rmtree(os.path.join(cache_dir, name), ignore_errors=True)
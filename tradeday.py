@@ -1,10 +1,210 @@
+import numpy as np
 import pandas as pd
 from datetime import datetime
 
+
+class TradingCalendar:
+    """
+    交易日历：由日表的日期列一次性构建，之后所有交易日计数、偏移都通过二分查找完成。
+
+    日期保存为排序后的 datetime64[ns] 数组，数组下标即交易日序号（ordinal）。
+    与 count_tradeday 一致，重复日期按多个交易日计数，缺失日期（NaT）被忽略。
+    """
+
+    def __init__(self, dates):
+        """
+        参数:
+            dates (array-like): 交易日期序列，可以是字符串、datetime 或 datetime64
+        """
+        values = pd.to_datetime(pd.Series(dates)).dropna().values.astype('datetime64[ns]')
+        self.dates = np.sort(values)
+
+    @classmethod
+    def from_frame(cls, trade_df, date_col='日期'):
+        """
+        从 DataFrame 的日期列构建交易日历
+
+        参数:
+            trade_df (pd.DataFrame): 包含交易日期列的 DataFrame
+            date_col (str): 交易日列名，默认 '日期'
+
+        返回:
+            TradingCalendar: 交易日历
+        """
+        return cls(trade_df[date_col])
+
+    def __len__(self):
+        return len(self.dates)
+
+    @staticmethod
+    def _to_datetime64(values):
+        # 标量和数组统一转换为 datetime64[ns]，便于 searchsorted
+        if np.ndim(values) == 0:
+            return np.datetime64(pd.to_datetime(values), 'ns')
+        return pd.to_datetime(np.asarray(values).ravel()).values.astype('datetime64[ns]').reshape(np.shape(values))
+
+    def ordinal(self, dates):
+        """
+        返回每个日期在日历中的交易日序号（不晚于该日期的最后一个交易日的下标）。
+        早于日历第一天的日期返回 -1。支持标量和数组。
+        """
+        return np.searchsorted(self.dates, self._to_datetime64(dates), side='right') - 1
+
+    def bounds(self, dates):
+        """
+        返回每个日期在日历中的左右端序号 (lo, hi)。
+        对任意两行 a、b，count_between(dates[a], dates[b]) == max(hi[b] - lo[a], 0)，
+        状态机可以预先算好序号，循环内只做整数减法。
+        """
+        values = self._to_datetime64(dates)
+        return (np.searchsorted(self.dates, values, side='left'),
+                np.searchsorted(self.dates, values, side='right'))
+
+    def count_between(self, start_date, end_date):
+        """
+        计算两个日期之间的交易日数量（包含首尾），O(log n)
+
+        参数:
+            start_date (str or datetime): 起始日期
+            end_date (str or datetime): 结束日期
+
+        返回:
+            int: 交易日数量
+        """
+        start = np.searchsorted(self.dates, self._to_datetime64(start_date), side='left')
+        end = np.searchsorted(self.dates, self._to_datetime64(end_date), side='right')
+        return int(max(end - start, 0))
+
+    def count_between_many(self, start_dates, end_dates):
+        """
+        count_between 的向量化版本，起止日期数组逐元素计算（支持广播）
+
+        参数:
+            start_dates (array-like): 起始日期数组
+            end_dates (array-like): 结束日期数组
+
+        返回:
+            np.ndarray: 每对起止日期之间的交易日数量（int64）
+        """
+        start = np.searchsorted(self.dates, self._to_datetime64(start_dates), side='left')
+        end = np.searchsorted(self.dates, self._to_datetime64(end_dates), side='right')
+        return np.maximum(end - start, 0).astype(np.int64)
+
+    def offset(self, date, k):
+        """
+        返回从 date 起偏移 k 个交易日的日期，O(log n)。
+        date 不是交易日时，以不晚于它的最后一个交易日为起点；结果超出日历范围时返回 NaT。
+
+        参数:
+            date (str or datetime): 起始日期
+            k (int): 偏移的交易日数，可以为负
+
+        返回:
+            pd.Timestamp: 偏移后的交易日
+        """
+        pos = self.ordinal(date) + k
+        if 0 <= pos < len(self.dates):
+            return pd.Timestamp(self.dates[pos])
+        return pd.NaT
+
+    def offset_many(self, dates, k):
+        """
+        offset 的向量化版本，dates 与 k 均可为数组（支持广播）
+
+        返回:
+            np.ndarray: datetime64[ns] 数组，超出日历范围的位置为 NaT
+        """
+        pos = self.ordinal(dates) + np.asarray(k)
+        valid = (pos >= 0) & (pos < len(self.dates))
+        result = np.full(np.shape(pos), np.datetime64('NaT'), dtype='datetime64[ns]')
+        result[valid] = self.dates[pos[valid]]
+        return result
+
+
+# 执行周五不是交易日时的处理：'skip' 不执行；'last' 改在该周周五之前的最后一个交易日执行
+HOLIDAY_POLICIES = ('skip', 'last')
+
+
+class FridayResolver:
+    """
+    执行日期查找表：由日表的日期列一次性构建，把每个自然周（周一至周日）映射到该周周五的执行行，
+    之后每一行“当周周五 / 下周周五”的执行行都是一次数组下标，不再做日期偏移和成员查找。
+
+    holiday_policy 决定目标周五不是交易日时的处理：'skip' 不执行（执行行为 -1），
+    'last' 在该周周五之前的最后一个交易日执行。目标周五晚于最后一个日期时执行行尚未确定，也为 -1，
+    追加数据后可能确定。同一日期出现在多行时取第一行。
+    """
+
+    def __init__(self, dates, holiday_policy='skip'):
+        """
+        参数:
+            dates (array-like): 每行的日期，不要求排序
+            holiday_policy (str): 'skip' 或 'last'，见 HOLIDAY_POLICIES
+        """
+        if holiday_policy not in HOLIDAY_POLICIES:
+            raise ValueError(f"不支持的节假日规则 '{holiday_policy}'，请使用 'skip' 或 'last'")
+        self.dates = pd.to_datetime(np.asarray(dates)).values.astype('datetime64[ns]')
+        days = self.dates.astype('datetime64[D]').astype(np.int64)
+        # 1970-01-01 是周四，加 3 后整除 7 得到以周一开始的周序号，第 w 周的周五为第 7w + 1 天
+        self.week = (days + 3) // 7
+        self.weekday = (days + 3) % 7  # 0=周一, 4=周五
+        self.last_day = int(days.max()) if len(days) else 0
+        self.first_week = int(self.week.min()) if len(days) else 0
+        self.table = np.full(int(self.week.max()) - self.first_week + 1 if len(days) else 0, -1, dtype=np.int64)
+
+        # 候选执行行：'skip' 只有周五，'last' 为周一至周五；每周取日期最晚的一行，同一日期取第一行
+        rows = np.flatnonzero(self.weekday == 4 if holiday_policy == 'skip' else self.weekday <= 4)
+        rows = rows[np.lexsort((-rows, days[rows]))]
+        weeks = self.week[rows]
+        last = np.r_[weeks[1:] != weeks[:-1], True] if len(rows) else np.zeros(0, dtype=bool)
+        self.table[weeks[last] - self.first_week] = rows[last]
+
+    def _lookup(self, target_week):
+        # 目标周五晚于最后一个日期时，该周的执行行尚未确定
+        pos = target_week - self.first_week
+        valid = (pos >= 0) & (pos < len(self.table)) & (target_week * 7 + 1 <= self.last_day)
+        result = np.full(np.shape(pos), -1, dtype=np.int64)
+        result[valid] = self.table[pos[valid]]
+        return result
+
+    def target_weeks(self, weeks_ahead, at=None):
+        """
+        每行目标周五所在的周序号。
+
+        参数:
+            weeks_ahead (sequence): 按星期（周一至周日）给出的 7 个周数，0 为当周周五，1 为下周周五，依此类推
+            at (array-like): 只计算这些行，默认全部行
+        """
+        at = slice(None) if at is None else at
+        return self.week[at] + np.asarray(weeks_ahead, dtype=np.int64)[self.weekday[at]]
+
+    def target_fridays(self, weeks_ahead, at=None):
+        """
+        每行的目标周五（datetime64[ns]），参数同 target_weeks。
+        """
+        return (self.target_weeks(weeks_ahead, at) * 7 + 1).astype('datetime64[D]').astype('datetime64[ns]')
+
+    def rows(self, weeks_ahead, at=None):
+        """
+        每行的执行行号，参数同 target_weeks。不执行或尚未确定时为 -1。
+        """
+        return self._lookup(self.target_weeks(weeks_ahead, at))
+
+    def rows_for_fridays(self, fridays):
+        """
+        给定目标周五（例如上一次续算保存的待执行日期）的执行行号，不执行或尚未确定时为 -1。
+        """
+        days = np.asarray(fridays, dtype='datetime64[ns]').astype('datetime64[D]').astype(np.int64)
+        return self._lookup((days + 3) // 7)
+
+
 def count_tradeday(trade_df, start_date, end_date, date_col='trade_date'):
     """
     计算两个日期之间的交易日数量（包含首尾）
 
+    兼容接口：每次调用都会重新构建交易日历。需要多次计数时，
+    请先用 TradingCalendar.from_frame 构建一次日历，再调用 count_between。
+
     参数:
         trade_df (pd.DataFrame): 包含交易日历的 DataFrame
         start_date (str or datetime): 起始日期
@@ -14,17 +214,7 @@ def count_tradeday(trade_df, start_date, end_date, date_col='trade_date'):
     返回:
         int: 交易日数量
     """
-    # 确保日期列为 datetime 类型
-    trade_df = trade_df.copy()
-    trade_df[date_col] = pd.to_datetime(trade_df[date_col])
-
-    # 转换输入为 datetime
-    start_date = pd.to_datetime(start_date)
-    end_date = pd.to_datetime(end_date)
-
-    # 筛选范围内的交易日
-    mask = (trade_df[date_col] >= start_date) & (trade_df[date_col] <= end_date)
-    return trade_df.loc[mask].shape[0]
+    return TradingCalendar.from_frame(trade_df, date_col).count_between(start_date, end_date)
 
 
 if __name__ =='__main__':
@@ -40,4 +230,4 @@ if __name__ =='__main__':
     path=r'D:\apps\中金项目\4\4\2(1).xlsx'
     trade_df=pd.read_excel(path)
     count = count_tradeday(trade_df, '2020-04-01', '2020-04-7','日期')
-    print("交易日天数：", count)
\ No newline at end of file
+    print("交易日天数：", count)
@@ -0,0 +1,249 @@
+import argparse
+import contextlib
+import io
+import os
+import sys
+import tempfile
+from dataclasses import replace
+
+import numpy as np
+import pandas as pd
+
+from pcr_bbi_new import load_daily_table
+from husen_new import load_weekly_table
+from params import StrategyParams
+from pipeline import run_strategies, STAGES
+from incremental import run_incremental
+from instrument import PipelineReport, log_level
+from dtypes import readable
+from benchmark.synthetic import synthetic_daily, synthetic_weekly
+
+# 浮点列（仓位、收益率等）允许的绝对误差
+DEFAULT_ATOL = 1e-9
+DEFAULT_SIZES = [1000, 5000]
+DEFAULT_SEEDS = [0, 1, 2, 3, 4]
+
+DIFF_COLUMNS = ['列', '不一致行数', '首个不一致日期', 'fast', 'legacy']
+
+# 增量核对：逐行追加日表最后的这么多行
+DEFAULT_APPEND_ROWS = 100
+# 卖出、买入阈值重叠的参数：两种 PCR 波段可以同时延续，检查点的续算起点要在两种游程的公共边界上
+OVERLAPPING_PCR = {'pcr_sell_percentile': 0.5, 'pcr_sell_value': 0.0, 'pcr_buy_percentile': 0.6}
+
+
+def _missing(values):
+    # 缺失值（NaN/None）统一为 None，与空值比较时视为相同
+    values = values.astype(object)
+    return values.where(values.notna(), None).to_numpy()
+
+
+def diff_frames(fast, legacy, date_column='日期', atol=DEFAULT_ATOL):
+    """
+    逐列比较两个引擎的输出（按导出时显示的取值比较，分类列为字符串，基准日为 '基准'）。
+    两边都是数值的浮点列允许 atol 的绝对误差，其余列要求完全相同，缺失值与缺失值相同。
+
+    参数:
+    fast (pd.DataFrame): engine='fast' 的输出
+    legacy (pd.DataFrame): engine='legacy' 的输出
+    date_column (str): 日期列名，用于报告第一个不一致的日期
+    atol (float): 浮点列允许的绝对误差
+
+    返回:
+    pd.DataFrame: 每个不一致的列一行，包含不一致行数、第一个不一致的日期以及该行两边的取值；完全一致时为空表
+    """
+    fast, legacy = readable(fast), readable(legacy)
+    rows = []
+    if len(fast) != len(legacy):
+        rows.append({'列': '(行数)', '不一致行数': abs(len(fast) - len(legacy)), '首个不一致日期': None,
+                     'fast': len(fast), 'legacy': len(legacy)})
+    n = min(len(fast), len(legacy))
+    fast, legacy = fast.iloc[:n], legacy.iloc[:n]
+    dates = fast[date_column].to_numpy() if date_column in fast.columns else np.arange(n)
+
+    for column in list(fast.columns) + [c for c in legacy.columns if c not in fast.columns]:
+        if column not in fast.columns or column not in legacy.columns:
+            rows.append({'列': column, '不一致行数': n, '首个不一致日期': None,
+                         'fast': '缺少该列' if column not in fast.columns else None,
+                         'legacy': '缺少该列' if column not in legacy.columns else None})
+            continue
+        a, b = fast[column], legacy[column]
+        if (pd.api.types.is_float_dtype(a) or pd.api.types.is_float_dtype(b)) \
+                and pd.api.types.is_numeric_dtype(a) and pd.api.types.is_numeric_dtype(b):
+            same = np.isclose(a.to_numpy(dtype=float), b.to_numpy(dtype=float), rtol=0, atol=atol, equal_nan=True)
+        else:
+            same = _missing(a) == _missing(b)
+        bad = np.flatnonzero(~same)
+        if len(bad):
+            first = bad[0]
+            rows.append({'列': column, '不一致行数': len(bad), '首个不一致日期': dates[first],
+                         'fast': a.iloc[first], 'legacy': b.iloc[first]})
+    return pd.DataFrame(rows, columns=DIFF_COLUMNS)
+
+
+def _stage_times(report):
+    # 各策略阶段的耗时，按阶段名称汇总
+    return {record['阶段']: record['耗时(秒)'] for record in report.stages}
+
+
+def verify_engines(daily, weekly, initial_pos, params=None, atol=DEFAULT_ATOL):
+    """
+    在同一输入上分别用 fast 和 legacy 引擎运行全部策略，逐列比较输出并统计各阶段的加速比。
+    两次运行都依次执行、不使用阶段缓存、关闭逐笔交易信息；输入表只读取一次，读取不计入耗时。
+
+    参数:
+    daily (str or pd.DataFrame): 日表路径或已读取的日表
+    weekly (str or pd.DataFrame): 周表路径或已读取的周表；为 None 时由日表生成
+    initial_pos (float): pcr_bbi 初始仓位
+    params (StrategyParams): 策略参数，默认为 StrategyParams()
+    atol (float): 浮点列允许的绝对误差
+
+    返回:
+    tuple: (diff_frames 的不一致列表, 各阶段耗时表)。耗时表包含 阶段、legacy耗时(秒)、fast耗时(秒)、加速比，
+           最后一行为全部策略阶段的合计
+    """
+    params = params or StrategyParams()
+    daily_df = load_daily_table(daily, pcr_lookback=params.pcr_lookback, pcr_min_periods=params.pcr_min_periods)
+    if daily_df is None:
+        raise ValueError("日表处理失败，请检查日表文件")
+    weekly_df = None
+    if weekly is not None:
+        weekly_df = load_weekly_table(weekly)
+        if weekly_df is None:
+            raise ValueError("周表处理失败，请检查周表文件")
+
+    outputs, times = {}, {}
+    with log_level('WARNING'):
+        for engine in ('legacy', 'fast'):
+            report = PipelineReport()
+            outputs[engine] = run_strategies(daily_df, weekly_df, initial_pos, params, report=report,
+                                             parallel=False, engine=engine)
+            times[engine] = _stage_times(report)
+
+    names = [item.name for item in STAGES]
+    legacy_times = [times['legacy'][name] for name in names]
+    fast_times = [times['fast'][name] for name in names]
+    timing = pd.DataFrame({'阶段': names + ['合计'],
+                           'legacy耗时(秒)': legacy_times + [sum(legacy_times)],
+                           'fast耗时(秒)': fast_times + [sum(fast_times)]})
+    timing['加速比'] = (timing['legacy耗时(秒)'] / timing['fast耗时(秒)'].where(timing['fast耗时(秒)'] > 0)).round(1)
+    return diff_frames(outputs['fast'], outputs['legacy'], atol=atol), timing
+
+
+def verify_synthetic(sizes=None, seeds=None, params=None, derive_weekly=False, atol=DEFAULT_ATOL):
+    """
+    在带随机种子的合成日表、周表上核对两个引擎（见 benchmark.synthetic），每个行数和种子一组输入，
+    初始仓位也由种子随机确定。
+
+    参数:
+    sizes (list): 日表行数，默认 DEFAULT_SIZES
+    seeds (list): 随机种子，默认 DEFAULT_SEEDS
+    params (StrategyParams): 策略参数，默认为 StrategyParams()
+    derive_weekly (bool): 为 True 时不使用合成周表，由日表生成周表
+    atol (float): 浮点列允许的绝对误差
+
+    返回:
+    tuple: (每组输入一行的汇总表, 全部不一致列表)。不一致列表在 diff_frames 的列之前加上 行数、种子 两列
+    """
+    sizes = sizes or DEFAULT_SIZES
+    seeds = seeds if seeds is not None else DEFAULT_SEEDS
+    summary, diffs = [], []
+    for n_rows in sizes:
+        for seed in seeds:
+            daily = synthetic_daily(n_rows, seed)
+            weekly = None if derive_weekly else synthetic_weekly(daily)
+            initial_pos = round(float(np.random.default_rng(seed).uniform(0, 1)), 2)
+            diff, timing = verify_engines(daily, weekly, initial_pos, params, atol)
+            total = timing.iloc[-1]
+            summary.append({'行数': n_rows, '种子': seed, '初始仓位': initial_pos, '不一致列数': len(diff),
+                            '首个不一致日期': diff['首个不一致日期'].min() if len(diff) else None,
+                            'legacy耗时(秒)': total['legacy耗时(秒)'], 'fast耗时(秒)': total['fast耗时(秒)'],
+                            '加速比': total['加速比']})
+            if len(diff):
+                diffs.append(diff.assign(行数=n_rows, 种子=seed)[['行数', '种子'] + DIFF_COLUMNS])
+    all_diffs = pd.concat(diffs, ignore_index=True) if diffs else pd.DataFrame(columns=['行数', '种子'] + DIFF_COLUMNS)
+    return pd.DataFrame(summary), all_diffs
+
+
+def verify_incremental(sizes=None, seeds=None, params=None, append_rows=DEFAULT_APPEND_ROWS):
+    """
+    在合成日表上核对增量运行：先计算去掉最后 append_rows 行的日表，再逐行追加，
+    每次都用 run_incremental(verify=True) 与完整重算比较。周表由日表生成，检查点写在临时目录中。
+
+    参数:
+    sizes (list): 日表行数，默认 DEFAULT_SIZES
+    seeds (list): 随机种子，默认 DEFAULT_SEEDS
+    params (StrategyParams): 策略参数，默认为 StrategyParams()
+    append_rows (int): 逐行追加的行数
+
+    返回:
+    pd.DataFrame: 每组输入一行，包含 行数、种子、追加次数，第一次不一致时的 不一致日期 和 错误（一致时为 None）
+    """
+    sizes = sizes or DEFAULT_SIZES
+    seeds = seeds if seeds is not None else DEFAULT_SEEDS
+    summary = []
+    for n_rows in sizes:
+        for seed in seeds:
+            daily = synthetic_daily(n_rows, seed)
+            initial_pos = round(float(np.random.default_rng(seed).uniform(0, 1)), 2)
+            record = {'行数': n_rows, '种子': seed, '追加次数': 0, '不一致日期': None, '错误': None}
+            with tempfile.TemporaryDirectory() as directory, log_level('WARNING'):
+                checkpoint_file = os.path.join(directory, 'checkpoint.pkl')
+                for rows in range(max(n_rows - append_rows, 1), n_rows + 1):
+                    try:
+                        with contextlib.redirect_stdout(io.StringIO()):
+                            run_incremental(daily.iloc[:rows], None, initial_pos, checkpoint_file, params, verify=True)
+                    except AssertionError as e:
+                        record['不一致日期'] = daily['日期'].iloc[rows - 1]
+                        record['错误'] = str(e).strip().splitlines()[0]
+                        break
+                    record['追加次数'] += 1
+            summary.append(record)
+    return pd.DataFrame(summary)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='核对 fast 与 legacy 两个引擎的输出是否一致，并统计加速比')
+    parser.add_argument('daily', nargs='?', default=None, help='日表文件；省略时在合成数据上核对')
+    parser.add_argument('weekly', nargs='?', default=None, help='周表文件，省略时由日表生成')
+    parser.add_argument('--initial-pos', type=float, default=0.7, help='初始仓位，默认 0.7（合成数据由种子决定）')
+    parser.add_argument('--sizes', type=int, nargs='+', default=DEFAULT_SIZES,
+                        help=f'合成日表的行数，默认 {" ".join(map(str, DEFAULT_SIZES))}')
+    parser.add_argument('--seeds', type=int, nargs='+', default=DEFAULT_SEEDS,
+                        help=f'合成数据的随机种子，默认 {" ".join(map(str, DEFAULT_SEEDS))}')
+    parser.add_argument('--derive-weekly', action='store_true', help='合成数据不使用合成周表，由日表生成周表')
+    parser.add_argument('--holiday-policy', default='skip', choices=['skip', 'last'],
+                        help="执行周五不是交易日时的处理，默认 'skip'")
+    parser.add_argument('--atol', type=float, default=DEFAULT_ATOL, help=f'浮点列允许的绝对误差，默认 {DEFAULT_ATOL}')
+    parser.add_argument('--incremental', action='store_true',
+                        help='改为在合成数据上逐行追加核对增量运行与完整重算，默认参数和卖出/买入阈值重叠的参数各核对一遍')
+    parser.add_argument('--append-rows', type=int, default=DEFAULT_APPEND_ROWS,
+                        help=f'增量核对逐行追加的行数，默认 {DEFAULT_APPEND_ROWS}')
+    args = parser.parse_args()
+
+    params = StrategyParams(holiday_policy=args.holiday_policy)
+    pd.set_option('display.width', 200)
+    if args.incremental:
+        records = []
+        for name, changes in (('默认', {}), ('阈值重叠', OVERLAPPING_PCR)):
+            checked = verify_incremental(args.sizes, args.seeds, replace(params, **changes), args.append_rows)
+            records += checked.assign(参数=name).to_dict('records')
+        summary = pd.DataFrame(records)
+        print(summary.to_string(index=False))
+        failed = summary['错误'].notna().sum()
+        if failed:
+            print(f"\n{failed} 组输入的增量结果与完整重算不一致。")
+            sys.exit(1)
+        print("\n增量运行的结果与完整重算完全一致。")
+        sys.exit(0)
+    if args.daily is not None:
+        diff, timing = verify_engines(args.daily, args.weekly, args.initial_pos, params, args.atol)
+        print(timing.to_string(index=False))
+    else:
+        summary, diff = verify_synthetic(args.sizes, args.seeds, params, args.derive_weekly, args.atol)
+        print(summary.to_string(index=False))
+
+    if len(diff):
+        print(f"\n发现 {len(diff)} 处不一致：")
+        print(diff.to_string(index=False))
+        sys.exit(1)
+    print("\n两个引擎的输出完全一致。")
@@ -1,83 +1,215 @@
 import pandas as pd
+import numpy as np
 import os
-from tradeday import count_tradeday as CD
+import logging
+from tradeday import TradingCalendar
+from params import StrategyParams
+from instrument import logger
+from dtypes import categorical, as_datetime
 
-def xichou(df):
+
+def xichou_engine(xichou_value, close, pcr_adjust, pcr_total, day_lo, day_hi,
+                  threshold=80, take_profit_half=1.08, take_profit_full=1.1, timeout_days=60,
+                  state=None, stop=None):
     """
-    吸筹策略函数，基于吸筹值和价格变化进行买入卖出吸筹买卖，并在每次卖出时计算收益率。
+    吸筹状态机，单次遍历，全部读写都在预分配的数组上完成。
+    买入、部分卖出、全部卖出、超时卖出的规则与原逐行实现完全一致。
+
+    超时判断的交易日计数 count(a, b) = day_hi[b] - day_lo[a]，
+    与 TradingCalendar.count_between(日期[a], 日期[b]) 相同。
+
     参数:
-        df (pd.DataFrame): 包含'日期', '收盘价', '吸筹值', 'PCR吸筹总仓位'列
+        xichou_value (np.ndarray): 吸筹值
+        close (np.ndarray): 收盘价
+        pcr_adjust (np.ndarray): pcr_bbi仓位调整
+        pcr_total (np.ndarray): pcr_bbi总仓位
+        day_lo (np.ndarray): 每行日期在交易日历中的左端序号
+        day_hi (np.ndarray): 每行日期在交易日历中的右端序号
+        threshold (float): 吸筹值买入阈值，默认 80
+        take_profit_half (float): 卖出一半的止盈倍数，默认 1.08
+        take_profit_full (float): 全部卖出的止盈倍数，默认 1.1
+        timeout_days (int): 超时卖出的交易日数，默认 60
+        state (dict): 续算时上一段结束时的状态（即上一次返回的 'state'），默认从空仓开始
+        stop (int): 只处理前 stop 行，之后的行只在买入时用于读取次日数据，默认处理全部行
+
     返回:
-        pd.DataFrame: 添加了'卫星吸筹调整仓位', '吸筹买卖', '收益率'列的DataFrame
+        dict: 'PCR吸筹总仓位', '卫星吸筹调整仓位', '吸筹买卖', '收益率' 四个输出数组，
+              按发生顺序记录的事件列表 'events' [(行号, 类型, 数值, 收益率), ...]，
+              以及处理到 stop 行之前的状态 'state'
     """
-    # 初始化变量
-    P, X, sell_flag, xichou_flag = 0, 0, 0, 0
-    df['卫星吸筹调整仓位'] = 0
-    df['吸筹买卖'] = ''
-    df['收益率'] = 0.0  # 初始化收益率列
-    df['PCR吸筹总仓位'] = df['pcr_bbi总仓位'].astype(float)  # 转换为浮点数
-
-    # 遍历数据
-    for idx, row in df.iterrows():
-        xichou = row['吸筹值']
-        close = row['收盘价']
-        dt = row['日期']
-        
+    n = len(close)
+    stop = n if stop is None else stop
+    total = np.array(pcr_total, dtype=float)  # PCR吸筹总仓位，从pcr_bbi总仓位开始
+    satellite = np.zeros(n, dtype=float)  # 卫星吸筹调整仓位
+    action = np.full(n, '', dtype=object)  # 吸筹买卖
+    returns = np.zeros(n, dtype=float)  # 收益率
+    events = []
+
+    state = state or {'P': 0, 'X': 0, 'sell_flag': 0, 'buy_lo': 0, 'prev_total': None}
+    P, X, sell_flag, buy_lo = state['P'], state['X'], state['sell_flag'], state['buy_lo']
+    prev_total = state['prev_total']  # 续算起点前一行的PCR吸筹总仓位，从头计算时为 None
+    for i in range(stop):
         # 买入逻辑
-        if xichou > 80 and P == 0:
-            if idx < len(df) - 1:
-                P = df.loc[idx + 1, '收盘价']  # 下一日的收盘价作为买入价格
-                X = 1 - df.loc[idx + 1, 'PCR吸筹总仓位']  # 计算卫星吸筹调整仓位
-                df.loc[idx + 1, '卫星吸筹调整仓位'] = X  # 更新卫星吸筹调整仓位
-                DATE = dt
+        if xichou_value[i] > threshold and P == 0:
+            if i < n - 1:
+                P = close[i + 1]  # 下一日的收盘价作为买入价格
+                X = 1 - total[i + 1]  # 计算卫星吸筹调整仓位
+                satellite[i + 1] = X
+                buy_lo = day_lo[i]
                 sell_flag = 0
-                df.loc[idx, 'PCR吸筹总仓位'] = 1  # 更新PCR吸筹总仓位
-                df.loc[idx, '吸筹买卖'] = '买入'
-                print(f'{dt}买入，价格：{P}')
+                total[i] = 1
+                action[i] = '买入'
+                events.append((i, '买入', P, 0))
             else:
-                print(f"警告：最后一行数据无法执行买入吸筹买卖，因为没有次日数据。")
+                events.append((i, '无次日', 0, 0))
             continue
-        
-        # 继承前一天的PCR吸筹总仓位
-        if idx > 0 and not df.loc[idx, '吸筹买卖'] and not df.loc[idx, 'pcr_bbi仓位调整']:
-            df.loc[idx, 'PCR吸筹总仓位'] = df.loc[idx - 1, 'PCR吸筹总仓位']
-        elif df.loc[idx,'pcr_bbi仓位调整'] and 0<df.loc[idx - 1, 'PCR吸筹总仓位']<1:
-            df.loc[idx, 'PCR吸筹总仓位'] = df.loc[idx - 1, 'PCR吸筹总仓位']+df.loc[idx, 'pcr_bbi仓位调整']
-        elif df.loc[idx,'pcr_bbi仓位调整']==-0.1 and df.loc[idx - 1, 'PCR吸筹总仓位']==0:
-            df.loc[idx, 'PCR吸筹总仓位']=0
-        elif df.loc[idx,'pcr_bbi仓位调整']==0.1 and df.loc[idx - 1, 'PCR吸筹总仓位']==1:
-            df.loc[idx, 'PCR吸筹总仓位']=1
-
-        return_pct=0
-        ##收益率再看，因为好像就是0.08和0.1
+
+        # 继承前一天的PCR吸筹总仓位（当天的吸筹买卖此时必为空）
+        if i > 0 or prev_total is not None:
+            adj = pcr_adjust[i]
+            prev = total[i - 1] if i > 0 else prev_total
+            if not adj:
+                total[i] = prev
+            elif 0 < prev < 1:
+                total[i] = prev + adj
+            elif adj == -0.1 and prev == 0:
+                total[i] = 0
+            elif adj == 0.1 and prev == 1:
+                total[i] = 1
+
         # 卖出逻辑
         if P != 0 and X > 0:  # 确保有买入价格且有持仓
-            if  close >= P * 1.1 and sell_flag != 2:  
+            if close[i] >= P * take_profit_full and sell_flag != 2:
                 sell_amount = X
-                df.loc[idx, 'PCR吸筹总仓位'] -= sell_amount
-                X = 0
-                sell_flag = 2
-                P = 0
-                return_pct=10
-                df.loc[idx, '吸筹买卖'] = f'卖出{sell_amount}'
-                print(f'P达到1.1,{dt}卖出，卖出仓位：{sell_amount}，收益率：{return_pct:.2f}%')
-            elif close >= P * 1.08 and sell_flag == 0:  
+                total[i] -= sell_amount
+                X, sell_flag, P = 0, 2, 0
+                action[i] = f'卖出{sell_amount}'
+                events.append((i, '全部止盈', sell_amount, round((take_profit_full - 1) * 100, 2)))
+            elif close[i] >= P * take_profit_half and sell_flag == 0:
                 sell_amount = 0.5 * X
-                df.loc[idx, 'PCR吸筹总仓位'] -= sell_amount
+                total[i] -= sell_amount
                 X -= sell_amount
                 sell_flag = 1
-                df.loc[idx, '吸筹买卖'] = f'卖出{sell_amount}'
-                return_pct=8
-                print(f'P达到1.08{dt}卖出，卖出仓位：{sell_amount}，收益率：{return_pct:.2f}%')
-            elif CD(df, DATE.date(), dt.date(), '日期') > 60:  # 超时卖出
+                action[i] = f'卖出{sell_amount}'
+                events.append((i, '部分止盈', sell_amount, round((take_profit_half - 1) * 100, 2)))
+            elif day_hi[i] - buy_lo > timeout_days:  # 超时卖出
                 sell_amount = X
-                df.loc[idx, 'PCR吸筹总仓位'] -= sell_amount
-                X = 0
-                sell_flag = 2
-                return_pct=(df.loc[idx, '收盘价']-P)/P*100
-                P = 0
-                df.loc[idx, '吸筹买卖'] = f'自动止盈或止损{sell_amount}'
-                df.loc[idx, '收益率'] = return_pct
-                print(f'{dt}自动止盈或止损，卖出仓位：{sell_amount}，收益率：{return_pct:.2f}%')
-    
-    return df
\ No newline at end of file
+                total[i] -= sell_amount
+                return_pct = (close[i] - P) / P * 100
+                X, sell_flag, P = 0, 2, 0
+                action[i] = f'自动止盈或止损{sell_amount}'
+                returns[i] = return_pct
+                events.append((i, '超时', sell_amount, return_pct))
+
+    return {
+        'PCR吸筹总仓位': total,
+        '卫星吸筹调整仓位': satellite,
+        '吸筹买卖': action,
+        '收益率': returns,
+        'events': events,
+        'state': {'P': P, 'X': X, 'sell_flag': sell_flag, 'buy_lo': buy_lo,
+                  'prev_total': float(total[stop - 1]) if stop > 0 else prev_total},
+    }
+
+
+def xichou(df, params=None):
+    """
+    吸筹策略函数，基于吸筹值和价格变化进行买入卖出吸筹买卖，并在每次卖出时计算收益率。
+    参数:
+        df (pd.DataFrame): 包含'日期', '收盘价', '吸筹值', 'pcr_bbi仓位调整', 'pcr_bbi总仓位'列
+        params (StrategyParams): 策略参数，默认为 StrategyParams()
+    返回:
+        pd.DataFrame: 添加了'卫星吸筹调整仓位', '吸筹买卖', '收益率', 'PCR吸筹总仓位'列的DataFrame
+    """
+    params = params or StrategyParams()
+    dates = as_datetime(df['日期']).values
+    day_lo, day_hi = TradingCalendar(dates).bounds(dates)  # 交易日序号，用于超时判断
+
+    result = xichou_engine(
+        df['吸筹值'].to_numpy(dtype=float),
+        df['收盘价'].to_numpy(dtype=float),
+        df['pcr_bbi仓位调整'].to_numpy(dtype=float),
+        df['pcr_bbi总仓位'].to_numpy(dtype=float),
+        day_lo, day_hi,
+        threshold=params.xichou_threshold,
+        take_profit_half=params.xichou_take_profit_half,
+        take_profit_full=params.xichou_take_profit_full,
+        timeout_days=params.xichou_timeout_days,
+    )
+
+    for i, kind, value, return_pct in result['events']:
+        if kind == '无次日':
+            logger.warning(f"警告：最后一行数据无法执行买入吸筹买卖，因为没有次日数据。")
+        elif logger.isEnabledFor(logging.INFO):
+            dt = df['日期'].iloc[i]
+            if kind == '买入':
+                logger.info(f'{dt}买入，价格：{value}')
+            elif kind == '全部止盈':
+                logger.info(f'P达到{params.xichou_take_profit_full},{dt}卖出，卖出仓位：{value}，收益率：{return_pct:.2f}%')
+            elif kind == '部分止盈':
+                logger.info(f'P达到{params.xichou_take_profit_half}{dt}卖出，卖出仓位：{value}，收益率：{return_pct:.2f}%')
+            else:
+                logger.info(f'{dt}自动止盈或止损，卖出仓位：{value}，收益率：{return_pct:.2f}%')
+
+    # 一次性写回输出列
+    df['卫星吸筹调整仓位'] = result['卫星吸筹调整仓位']
+    df['吸筹买卖'] = categorical(result['吸筹买卖'], '吸筹买卖')
+    df['收益率'] = result['收益率']
+    df['PCR吸筹总仓位'] = result['PCR吸筹总仓位']
+
+    return df
+
+
+def xichou_initial_state():
+    """
+    xichou_resume 从第一行开始计算时使用的状态。
+    """
+    return {'start': 0, 'P': 0, 'X': 0, 'sell_flag': 0, 'buy_lo': 0, 'prev_total': None}
+
+
+def xichou_resume(df, state, next_start, params=None, offset=0):
+    """
+    检查点续算：从 state['start'] 行开始运行吸筹状态机，之前的行沿用上一次的结果。
+    同时在 next_start 附近保存下一次续算的状态：下一次的起点不晚于 next_start（上游 pcr_bbi 列
+    下一次可能变化的第一行）和最后一行（最后一行的买入需要次日数据），也不落在买入的次日
+    （买入行读取次日的pcr_bbi总仓位，起点退回到买入行，买入前为空仓，状态只需前一行的总仓位）。
+
+    参数:
+        df (pd.DataFrame): pcr_bbi 列已经更新到最新的完整日度表，日期严格递增
+        state (dict): 上一次返回的状态，首次计算使用 xichou_initial_state()
+        next_start (int): 下一次续算的最晚起点
+        params (StrategyParams): 策略参数，默认为 StrategyParams()
+        offset (int): df 第一行在完整日度表中的行号，df 只需包含 state['start'] 及之后的行
+
+    返回:
+        tuple: (start, outputs, new_state)。outputs 为 start 及之后各行的
+               '卫星吸筹调整仓位', '吸筹买卖', '收益率', 'PCR吸筹总仓位' 数组
+    """
+    params = params or StrategyParams()
+    start = state['start']
+    tail = df.iloc[start - offset:]
+    dates = tail['日期'].values
+    day_lo, day_hi = TradingCalendar(dates).bounds(dates)
+    arrays = (
+        tail['吸筹值'].to_numpy(dtype=float),
+        tail['收盘价'].to_numpy(dtype=float),
+        tail['pcr_bbi仓位调整'].to_numpy(dtype=float),
+        tail['pcr_bbi总仓位'].to_numpy(dtype=float),
+        day_lo + start, day_hi + start,
+    )
+    options = dict(threshold=params.xichou_threshold, take_profit_half=params.xichou_take_profit_half,
+                   take_profit_full=params.xichou_take_profit_full, timeout_days=params.xichou_timeout_days)
+
+    engine_state = {key: value for key, value in state.items() if key != 'start'}
+    split = max(min(next_start, offset + len(df) - 1) - start, 0)
+    head = xichou_engine(*arrays, state=engine_state, stop=split, **options)
+    middle = head['state']
+    if split > 0 and head['吸筹买卖'][split - 1] == '买入':
+        split -= 1
+        middle = {'P': 0, 'X': 0, 'sell_flag': 0, 'buy_lo': 0,
+                  'prev_total': float(head['PCR吸筹总仓位'][split - 1]) if split > 0 else engine_state['prev_total']}
+    rest = xichou_engine(*(array[split:] for array in arrays), state=middle, **options)
+
+    columns = ['卫星吸筹调整仓位', '吸筹买卖', '收益率', 'PCR吸筹总仓位']
+    outputs = {col: np.concatenate([head[col][:split], rest[col]]) for col in columns}
+    return start, outputs, dict(middle, start=start + split)